@@ -24,7 +24,7 @@ setup(
     # pip install consults this list by specifying . in requirements.txt
     install_requires=[
         "configparser",
-        "falcon",
+        "falcon>=3",
         "gunicorn",
         "httpie",
         "pycall",
@@ -34,8 +34,13 @@ setup(
         "requests",
     ],
     extras_require={
+        "asgi": ["uvicorn"],
+        "brotli": ["brotli"],
         "dev": ["mock", "pytest", "pytest-localserver", "pytest-mock", "tox"],
+        "fast": ["orjson"],
         "lint": ["black", "flake8", "isort"],
+        "parquet": ["pyarrow"],
     },
     scripts=["bin/simon_event_handler", "bin/simon_event_handler"],
+    entry_points={"console_scripts": ["simon-says=simon_says.cli:main"]},
 )
@@ -1,6 +1,7 @@
 """
 ContactID codes from: http://www.voip-sip-sdk.com/attachments/583/contact_id.pdf
 """
+from typing import NamedTuple, Tuple
 
 EVENT_CATEGORIES = {
     "100": "Alarms",
@@ -238,3 +239,65 @@ CODES = {
     "653": {"name": "Reserved for Ademco Use", "type": "user"},
     "654": {"name": "System Inactivity", "type": "zone"},
 }
+
+# Fallback for codes missing from the table above. Since we can't tell whether the
+# event refers to a zone or to a user, neither is set.
+UNKNOWN = "Unknown"
+UNKNOWN_TYPE = "unknown"
+
+# Event codes are 3 digits long
+MAX_CODE = 999
+
+
+class CodeInfo(NamedTuple):
+    """ Everything known about an event code """
+
+    name: str
+    type: str
+    category: str
+
+
+def _build_code_table() -> Tuple[CodeInfo, ...]:
+    """ Precompute the info of every possible code, so that lookups are a plain index """
+
+    bases = sorted(int(b) for b in EVENT_CATEGORIES)
+    table = []
+    category = UNKNOWN
+    for code in range(MAX_CODE + 1):
+        # Each category spans from its base code up to the next one
+        if str(code) in EVENT_CATEGORIES:
+            category = EVENT_CATEGORIES[str(code)]
+        elif code < bases[0]:
+            category = UNKNOWN
+
+        info = CODES.get(f"{code:03d}")
+        if info:
+            table.append(CodeInfo(info["name"], info["type"], category))
+        else:
+            table.append(CodeInfo(UNKNOWN, UNKNOWN_TYPE, category))
+    return tuple(table)
+
+
+# Code info, indexed by the integer code
+CODE_TABLE = _build_code_table()
+
+
+# Contact ID messages are 16 digits long: ACCT MT Q EEE GG ZZZ S
+MESSAGE_LENGTH = 16
+
+# A "0" digit is valued as 10 when computing the checksum
+_ZERO = ord("0")
+
+
+def checksum_valid(message: str) -> bool:
+    """
+    Verify the checksum of a Contact ID message.
+    The sum of all digits (counting 0 as 10), including the checksum digit, must be a multiple of 15.
+    """
+
+    if len(message) != MESSAGE_LENGTH or not message.isdigit():
+        return False
+
+    # Sum the digits in one go over the encoded bytes, instead of one int() per digit
+    total = sum(message.encode()) - _ZERO * MESSAGE_LENGTH + 10 * message.count("0")
+    return total % 15 == 0
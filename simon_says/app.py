@@ -1,142 +1,388 @@
-import json
 import logging
+import time
 from configparser import ConfigParser
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import falcon
+from falcon import media
 
+from simon_says.cache import EventCache, create_event_cache
+from simon_says.compression import ResponseCompression
+from simon_says.config import install_reload_handler, on_reload
 from simon_says.control import Controller
 from simon_says.db import DataStore
 from simon_says.events import AlarmEvent, EventStore
-from simon_says.log import configure_logging
+from simon_says.export import STREAM_ENCODERS, encode_chunks
+from simon_says.history import SensorHistory
+from simon_says.log import LogSampling, configure_logging
+from simon_says.panels import Panel, Panels
+from simon_says.profiling import Profiler, ProfilingMiddleware, timer
+from simon_says.ratelimit import RateLimiter, RateLimits
 from simon_says.sensors import Sensors, SensorState
+from simon_says.serialization import dumps, loads
 from simon_says.version import __version__
+from simon_says.webhooks import WebhookDispatcher, create_webhook_dispatcher
 
 logger = logging.getLogger(__name__)
 
 
-class EventsResource:
-    """ API resource for Events """
+def set_sensor_state(sensors: Sensors, event: AlarmEvent) -> Optional[int]:
+    """ Set the sensor state depending on the event code. Returns the number of the sensor opened, if any """
 
-    def __init__(self, event_store: EventStore, sensors: Sensors, controller: Controller) -> None:
+    category = event.category
+    if event.sensor and category == "Troubles":
+        sensor = sensors.by_number(event.sensor)
+        logger.info("Setting sensor %s (%s) state to 'open'", event.sensor, event.sensor_name)
+        sensor.state = SensorState.OPEN
+        return event.sensor
 
-        self.event_store = event_store
-        self.sensors = sensors
-        self.controller = controller
+    logger.debug("_set_sensor_state: Ignoring event %s", event.uid)
+    return None
 
-    def _set_sensor_state(self, event: AlarmEvent) -> None:
-        """ Set the sensor state depending on the event code """
 
-        category = event.category
-        if event.sensor and category == "Troubles":
-            sensor = self.sensors.by_number(event.sensor)
-            logger.info("Setting sensor %s (%s) state to 'open'", event.sensor, event.sensor_name)
-            sensor.state = SensorState.OPEN
-        else:
-            logger.debug("_set_sensor_state: Ignoring event %s", event.uid)
+def sensor_numbers(sensors: Sensors) -> List[int]:
+    """ Get the numbers of all sensors in a collection """
+
+    return [s.number for s in sensors.get_all_sensors()]
+
+
+def get_sensor_history(panel: Panel) -> Any:
+    """ Get the sensor history of a panel, for time-travel queries """
+
+    if panel.sensor_history is None:
+        logger.error("No sensor history for panel %s", panel.account)
+        raise falcon.HTTPNotFound()
+    return panel.sensor_history
+
+
+def sensors_at(sensors: Sensors, numbers: List[int], states: Dict[int, Optional[SensorState]]) -> List[Dict[str, Any]]:
+    """ Describe sensors with their state at some point in time. Sensors with no history were closed """
+
+    return [dict(sensors.by_number(n).to_dict(), state=(states[n] or SensorState.CLOSED).value) for n in numbers]
+
+
+def requested_sensor_numbers(sensors: Sensors, number: Optional[str]) -> List[int]:
+    """ Get the numbers of the sensors a request is about: the one in the route, or all of them """
+
+    return [get_sensor_number(sensors, number)] if number else sensor_numbers(sensors)
+
+
+def sensors_as_json(sensors: Sensors, number: Optional[str]) -> bytes:
+    """ Describe the sensor in the route, or all sensors, with their current state """
+
+    if number:
+        return sensors.by_number(get_sensor_number(sensors, number)).to_json()
+    logger.info("Getting all sensors")
+    return sensors.all_as_json()
+
+
+def sensors_at_as_json(
+    sensors: Sensors, number: Optional[str], numbers: List[int], states: Dict[int, Optional[SensorState]]
+) -> bytes:
+    """ Describe the sensor in the route, or all sensors, with their state at some point in time """
+
+    result = sensors_at(sensors, numbers, states)
+    return dumps(result[0] if number else result)
+
+
+def transitions_as_dicts(transitions: List[Tuple[int, SensorState]]) -> List[Dict[str, Any]]:
+    """ Describe sensor state transitions """
+
+    return [{"timestamp": ts, "state": state.value} for ts, state in transitions]
+
+
+def get_sensor_number(sensors: Sensors, number: str) -> int:
+    """ Validate a sensor number from a route """
+
+    try:
+        return sensors.by_number(int(number)).number
+    except (KeyError, ValueError):
+        logger.error("number %s not found", number)
+        raise falcon.HTTPNotFound()
+
+
+def parse_control_request(data: Dict[str, Any]) -> Tuple[List[str], str]:
+    """
+    Validate a /control request body and return its actions and access code.
+    Either a single "action", or a list of "actions" sent over the same call, in order
+    """
+
+    if "actions" in data:
+        actions = data["actions"]
+        if not isinstance(actions, list) or not actions or not all(isinstance(a, str) for a in actions):
+            logger.error("Invalid parameter: 'actions' must be a non-empty list of actions")
+            raise falcon.HTTPBadRequest()
+    elif "action" in data:
+        actions = [data["action"]]
+    else:
+        logger.error("Missing required parameter: 'action'")
+        raise falcon.HTTPBadRequest()
+
+    if "access_code" not in data:
+        logger.error("Missing required parameter: 'access_code'")
+        raise falcon.HTTPBadRequest()
+
+    return actions, data["access_code"]
+
+
+def run_action(controller: Controller, sensors: Sensors, actions: List[str], code: str) -> None:
+    """ Send actions to the alarm via the controller """
+
+    if len(actions) > 1:
+        logger.info("Sending commands %s", ", ".join(actions))
+        controller.send_commands(actions, code)
+        if "disarm" in actions:
+            sensors.clear_all()
+        return
+
+    action = actions[0]
+    logger.info("Sending command %s", action)
+    if action == "disarm":
+        controller.disarm(code)
+        sensors.clear_all()
+    elif action == "arm_home":
+        controller.arm_home(code)
+    elif action == "arm_away":
+        controller.arm_away(code)
+    else:
+        # Pass other less common actions
+        controller.send_command(action, code)
+
+
+def get_panel(panels: Panels, account: Optional[str]) -> Panel:
+    """ Get the panel a request is scoped to. Routes without an account use the default panel """
+
+    if account is None:
+        return panels.default
+
+    try:
+        return panels.by_account(int(account))
+    except (KeyError, ValueError):
+        logger.error("Panel with account %s not found", account)
+        raise falcon.HTTPNotFound()
+
+
+def get_export_format(req) -> str:
+    """ Get the streaming export format requested """
+
+    fmt = req.get_param("format", default="ndjson")
+    if fmt not in STREAM_ENCODERS:
+        logger.error("Unsupported export format: %s", fmt)
+        raise falcon.HTTPBadRequest(description=f"Supported formats: {', '.join(STREAM_ENCODERS)}")
+    return fmt
+
+
+def set_json_response(resp, data: bytes, status: str = falcon.HTTP_200) -> None:
+    """ Respond with a JSON document """
+
+    resp.status = status
+    resp.content_type = "application/json"
+    resp.data = data
+
+
+def set_export_response(resp, fmt: str, stream: Any) -> None:
+    """ Respond with a stream of events in an export format """
+
+    resp.content_type = STREAM_ENCODERS[fmt].content_type
+    resp.downloadable_as = f"events.{fmt}"
+    resp.status = falcon.HTTP_200
+    resp.stream = stream
+
+
+def parse_event(data: Dict[str, Any]) -> AlarmEvent:
+    """ Validate an incoming event. Meant to be called within handle_event_errors """
+
+    logger.info("Adding new event with uid %s", data["uid"])
+    with timer("validation"):
+        return AlarmEvent(**data)
+
+
+@contextmanager
+def handle_event_errors() -> Iterator[None]:
+    """ Turn errors validating and storing an incoming event into the HTTP error telling the sender what to do """
+
+    try:
+        yield
+    except falcon.HTTPNotFound:
+        raise
+    except (KeyError, TypeError, ValueError) as err:
+        # Invalid, or already stored: sending it again won't help
+        logger.error("Error creating AlarmEvent: %s", err)
+        raise falcon.HTTPBadRequest()
+    except Exception as err:
+        # e.g. the data store is unreachable: the sender should try again later
+        logger.error("Error storing AlarmEvent: %s", err)
+        raise falcon.HTTPServiceUnavailable()
 
-    def on_get(self, req, resp, uid: str = None):
+
+def set_event_response(resp, event: AlarmEvent, added: bool, webhooks: Optional[WebhookDispatcher]) -> None:
+    """ Respond to an incoming event, once stored (or skipped as a retransmission), and notify webhooks """
+
+    if not added:
+        # A retransmission: nothing was created, but the sender must not retry it either
+        set_json_response(resp, dumps({"result": "DUPLICATE"}))
+        return
+
+    if webhooks is not None:
+        webhooks.submit(event)
+    set_json_response(resp, dumps({"result": "OK"}), falcon.HTTP_201)
+
+
+@contextmanager
+def handle_control_errors() -> Iterator[None]:
+    """ Turn errors sending actions to the alarm into HTTP errors """
+
+    try:
+        yield
+    except Exception as err:
+        logger.error("Error sending action to Alarm: %s", err)
+        raise falcon.HTTPBadRequest()
+
+
+def get_event_panel(panels: Panels, event: AlarmEvent, account: Optional[str]) -> Panel:
+    """ Get the panel an incoming event belongs to """
+
+    if account is None:
+        return panels.for_event_account(event.account)
+
+    panel = get_panel(panels, account)
+    if panel.account != event.account:
+        raise ValueError(f"Event account {event.account} does not match panel account {account}")
+    return panel
+
+
+class EventsResource:
+    """ API resource for Events """
+
+    def __init__(self, panels: Panels, webhooks: WebhookDispatcher = None) -> None:
+
+        self.panels = panels
+        self.webhooks = webhooks
+
+    def on_get(self, req, resp, uid: str = None, account: str = None):
         """ Handle GET requests for events in the queue """
 
+        event_store = get_panel(self.panels, account).event_store
         if uid:
             logger.info("Getting event with uid %s", uid)
 
-            e = self.event_store.get(uid=uid)
-            if e:
-                resp.body = e.to_json()
-            else:
+            e = event_store.get(uid=uid)
+            if not e:
                 logger.error("uid %s not found", uid)
                 raise falcon.HTTPNotFound()
+            set_json_response(resp, e.to_json())
 
         else:
             logger.info("Getting all events")
-            resp.body = self.event_store.events_as_json()
-
-        resp.content_type = "application/json"
-        resp.status = falcon.HTTP_200
+            events = event_store.get_events(start=req.get_param_as_int("start"), end=req.get_param_as_int("end"))
+            set_json_response(resp, dumps([e.__dict__ for e in events]))
 
-    def on_post(self, req, resp):
+    def on_post(self, req, resp, account: str = None):
         """ Handle POST requests for event """
 
         data = req.media
-        try:
-            logger.info("Adding new event with uid %s", data["uid"])
-            event = AlarmEvent(**data)
-            self.event_store.add(event)
-            self._set_sensor_state(event)
-        except Exception as err:
-            logger.error("Error creating AlarmEvent: %s", err)
-            raise falcon.HTTPBadRequest()
+        with handle_event_errors():
+            event = parse_event(data)
+            panel = get_event_panel(self.panels, event, account)
+            added = panel.event_store.add(event)
+            if added:
+                opened = set_sensor_state(panel.sensors, event)
+                if opened is not None and panel.sensor_history is not None:
+                    panel.sensor_history.record([opened], SensorState.OPEN, event.timestamp)
+
+        set_event_response(resp, event, added, self.webhooks)
+
 
-        resp.status = falcon.HTTP_201
-        resp.content_type = "application/json"
-        resp.body = json.dumps({"result": "OK"})
+class ExportResource:
+    """ API resource for exporting events in bulk """
+
+    def __init__(self, panels: Panels) -> None:
+        self.panels = panels
+
+    def on_get(self, req, resp, account: str = None):
+        """ Handle GET requests for all events, streamed in chunks """
+
+        event_store = get_panel(self.panels, account).event_store
+        fmt = get_export_format(req)
+        logger.info("Exporting events as %s", fmt)
+        chunks = event_store.iter_event_chunks(start=req.get_param_as_int("start"), end=req.get_param_as_int("end"))
+        set_export_response(resp, fmt, encode_chunks(fmt, chunks))
 
 
 class ControllerResource:
     """ API resource for commands and state """
 
-    def __init__(self, sensors: Sensors, controller: Controller = None) -> None:
-        self.sensors = sensors
-        self.controller = controller
+    def __init__(self, panels: Panels) -> None:
+        self.panels = panels
 
-    def on_post(self, req, resp):
+    def on_post(self, req, resp, account: str = None):
         """ Handle POST requests for commands """
 
-        data = req.media
-        if "action" not in data:
-            logger.error("Missing required parameter: 'action'")
-            raise falcon.HTTPBadRequest()
-
-        if "access_code" not in data:
-            logger.error("Missing required parameter: 'access_code'")
-            raise falcon.HTTPBadRequest()
+        panel = get_panel(self.panels, account)
+        actions, code = parse_control_request(req.media)
+        with handle_control_errors():
+            run_action(panel.controller, panel.sensors, actions, code)
 
-        action = data["action"]
-        code = data["access_code"]
-        try:
-            logger.info("Sending command %s", action)
-            if action == "disarm":
-                self.controller.disarm(code)
-                self.sensors.clear_all()
-            elif action == "arm_home":
-                self.controller.arm_home(code)
-            elif action == "arm_away":
-                self.controller.arm_away(code)
-            else:
-                # Pass other less common actions
-                self.controller.send_command(action, code)
-
-        except Exception as err:
-            logger.error("Error sending action to Alarm: %s", err)
-            raise falcon.HTTPBadRequest()
+        if "disarm" in actions and panel.sensor_history is not None:
+            panel.sensor_history.record(sensor_numbers(panel.sensors), SensorState.CLOSED, int(time.time()))
 
-        resp.status = falcon.HTTP_202
-        resp.content_type = "application/json"
-        resp.body = json.dumps({"result": "OK"})
+        set_json_response(resp, dumps({"result": "OK"}), falcon.HTTP_202)
 
 
 class SensorsResource:
     """ Sensors resource class """
 
-    def __init__(self, sensors: Sensors) -> None:
-        self.sensors = sensors
+    def __init__(self, panels: Panels) -> None:
+        self.panels = panels
 
-    def on_get(self, req, resp, number: str = None):
-        """ Handle GET requests for a given sensor number """
+    def on_get(self, req, resp, number: str = None, account: str = None):
+        """ Handle GET requests for a given sensor number, or all sensors. With ?at=, as of that time """
 
-        if number:
-            try:
-                sensor = self.sensors.by_number(int(number))
-                resp.body = sensor.to_json()
-            except KeyError:
-                logger.error("number %s not found", number)
-                raise falcon.HTTPNotFound()
-        else:
-            logger.info("Getting all sensors")
-            resp.body = self.sensors.all_as_json()
+        panel = get_panel(self.panels, account)
+        at = req.get_param_as_int("at")
+        if at is None:
+            set_json_response(resp, sensors_as_json(panel.sensors, number))
+            return
+
+        numbers = requested_sensor_numbers(panel.sensors, number)
+        logger.info("Getting sensor states at %s", at)
+        states = get_sensor_history(panel).states_at(numbers, at=at)
+        set_json_response(resp, sensors_at_as_json(panel.sensors, number, numbers, states))
+
+    def on_get_history(self, req, resp, number: str, account: str = None):
+        """ Handle GET requests for the state transitions of a sensor """
+
+        panel = get_panel(self.panels, account)
+        n = get_sensor_number(panel.sensors, number)
+        history = get_sensor_history(panel)
+        transitions = history.transitions(n, start=req.get_param_as_int("start"), end=req.get_param_as_int("end"))
+        set_json_response(resp, dumps(transitions_as_dicts(transitions)))
+
+
+class PanelsResource:
+    """ Panels resource class """
+
+    def __init__(self, panels: Panels) -> None:
+        self.panels = panels
+
+    def on_get(self, req, resp):
+        """ Handle GET requests for all configured panels """
+
+        set_json_response(resp, dumps([p.to_dict() for p in self.panels.get_all_panels()]))
+
+
+class CacheResource:
+    """ Event cache resource class """
 
-        resp.content_type = "application/json"
-        resp.status = falcon.HTTP_200
+    def __init__(self, cache: EventCache) -> None:
+        self.cache = cache
+
+    def on_get(self, req, resp):
+        """ Handle GET requests for event cache statistics """
+
+        set_json_response(resp, dumps(self.cache.stats()))
 
 
 class VersionResource:
@@ -146,9 +392,31 @@ class VersionResource:
     def on_get(req, resp):
         """ Handle GET requests for API version """
 
-        resp.content_type = "application/json"
-        resp.status = falcon.HTTP_200
-        resp.body = json.dumps({"version": __version__})
+        set_json_response(resp, dumps({"version": __version__}))
+
+
+def configure_media_handlers(api: falcon.App) -> None:
+    """ Use the same (fast, when available) JSON backend for req.media and resp.media """
+
+    json_handler = media.JSONHandler(dumps=dumps, loads=loads)
+    api.req_options.media_handlers.update({falcon.MEDIA_JSON: json_handler})
+    api.resp_options.media_handlers.update({falcon.MEDIA_JSON: json_handler})
+
+
+def add_panel_routes(api: falcon.App, events_resource, sensors_resource, controller_resource, export_resource) -> None:
+    """
+    Add the panel resources, both for the default panel (e.g. /events),
+    and scoped by panel account (e.g. /panels/1234/events)
+    """
+
+    for prefix in ("", "/panels/{account}"):
+        api.add_route(f"{prefix}/sensors", sensors_resource)
+        api.add_route(f"{prefix}/sensors/{{number}}", sensors_resource)
+        api.add_route(f"{prefix}/sensors/{{number}}/history", sensors_resource, suffix="history")
+        api.add_route(f"{prefix}/events", events_resource)
+        api.add_route(f"{prefix}/events/{{uid}}", events_resource)
+        api.add_route(f"{prefix}/control", controller_resource)
+        api.add_route(f"{prefix}/export/events", export_resource)
 
 
 def create_app(config: ConfigParser = None, controller: Controller = None, log_level: str = "INFO") -> falcon.API:
@@ -156,27 +424,50 @@ def create_app(config: ConfigParser = None, controller: Controller = None, log_l
 
     # Wire up the app handler with gunicorn's
     gunicorn_logger = logging.getLogger("gunicorn.error")
-    configure_logging(log_level=log_level, handlers=gunicorn_logger.handlers)
-
-    api = falcon.API()
+    configure_logging(log_level=log_level, handlers=gunicorn_logger.handlers, queued=True)
 
-    if not controller:
-        controller = Controller(config=config)
+    db = DataStore(config=config)
+    limits = RateLimits(db.cfg)
+    # Profiling goes first, so that it also covers the other middleware. Compression goes next, so that it
+    # handles responses once all other middleware is done with them
+    profiler = Profiler(db.cfg)
+    log_sampling = LogSampling(db.cfg)
+    middleware = [ProfilingMiddleware(profiler), ResponseCompression(db.cfg)]
+    middleware += [log_sampling] if log_sampling else []
+    api = falcon.API(middleware=middleware + ([RateLimiter(limits, db)] if limits else []))
+    configure_media_handlers(api)
 
     version_resource = VersionResource()
     api.add_route("/version", version_resource)
 
-    sensors = Sensors(config=config)
-    sensors_resource = SensorsResource(sensors=sensors)
-    api.add_route("/sensors", sensors_resource)
-    api.add_route("/sensors/{number}", sensors_resource)
-
-    db = DataStore(config=config)
-    events_resource = EventsResource(event_store=EventStore(db=db), sensors=sensors, controller=controller)
-    api.add_route("/events", events_resource)
-    api.add_route("/events/{uid}", events_resource)
-
-    controller_resource = ControllerResource(sensors=sensors, controller=controller)
-    api.add_route("/control", controller_resource)
+    cache = create_event_cache(db)
+    if cache is not None:
+        api.add_route("/cache/stats", CacheResource(cache=cache))
+
+    panels = Panels(
+        event_store_factory=partial(EventStore, db, cache=cache),
+        config=config,
+        controller=controller,
+        sensor_history_factory=partial(SensorHistory, db),
+    )
+    api.add_route("/panels", PanelsResource(panels=panels))
+
+    # Events are pushed to webhooks from background threads, so delivery never delays requests
+    webhooks = create_webhook_dispatcher(db)
+
+    if config is None:
+        # Running with the config file: pick up changes on SIGHUP, without restarting the server. This is also how
+        # profiling is turned on and off, since gunicorn workers already use SIGUSR1 to reopen their log files
+        on_reload(panels.reload)
+        on_reload(profiler.reload)
+        install_reload_handler()
+
+    add_panel_routes(
+        api,
+        events_resource=EventsResource(panels=panels, webhooks=webhooks),
+        sensors_resource=SensorsResource(panels=panels),
+        controller_resource=ControllerResource(panels=panels),
+        export_resource=ExportResource(panels=panels),
+    )
 
     return api
@@ -0,0 +1,146 @@
+"""
+Compressed archive of processed event files.
+
+Instead of piling up millions of small files in dst_dir, processed files can be appended to daily segments
+([events] archive = yes). A segment, events-<YYYY-MM-DD>.gz, is a series of gzip members, one per file, so the
+whole segment also reads as the concatenation of its files (e.g. with zcat). Next to it, events-<YYYY-MM-DD>.idx
+has one "<name> <offset> <length>" line per file, so that any of them can be read back on its own.
+
+Event handlers may run concurrently, so appends are serialized with a lock on the segment.
+"""
+import datetime
+import fcntl
+import gzip
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "events-"
+SEGMENT_SUFFIX = ".gz"
+INDEX_SUFFIX = ".idx"
+
+# Event files are tiny, so favor speed over size
+COMPRESS_LEVEL = 1
+
+
+class IndexEntry(NamedTuple):
+    """ Where a file is in a segment """
+
+    name: str
+    offset: int
+    length: int
+
+
+def segment_day(timestamp: float) -> str:
+    """ Get the day (in UTC) of the segment for the given time """
+
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc).strftime("%Y-%m-%d")
+
+
+def index_path(segment: Path) -> Path:
+    """ Get the index of a segment """
+
+    return segment.with_suffix(INDEX_SUFFIX)
+
+
+def is_segment(path: Path) -> bool:
+    """ Check whether a path is an archive segment """
+
+    return path.name.startswith(SEGMENT_PREFIX) and path.suffix == SEGMENT_SUFFIX and index_path(path).is_file()
+
+
+def read_index(segment: Path) -> List[IndexEntry]:
+    """ Read the index of a segment, in the order files were appended """
+
+    entries = []
+    with index_path(segment).open("r") as f:
+        for line in f:
+            name, offset, length = line.split()
+            entries.append(IndexEntry(name, int(offset), int(length)))
+    return entries
+
+
+def read_entry(segment: Path, entry: IndexEntry) -> bytes:
+    """ Read a single file from a segment """
+
+    with segment.open("rb") as f:
+        f.seek(entry.offset)
+        return gzip.decompress(f.read(entry.length))
+
+
+def iter_segment(segment: Path, skip: int = 0) -> Iterator[Tuple[str, bytes]]:
+    """ Yield (name, contents) for all files in a segment, in the order they were appended, but the first skip """
+
+    with segment.open("rb") as f:
+        for entry in read_index(segment)[skip:]:
+            f.seek(entry.offset)
+            yield entry.name, gzip.decompress(f.read(entry.length))
+
+
+class SegmentArchive:
+    """ Daily compressed segments of processed event files, in a directory """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def segment(self, day: str) -> Path:
+        """ Get the segment of a day (YYYY-MM-DD) """
+
+        return self.path / f"{SEGMENT_PREFIX}{day}{SEGMENT_SUFFIX}"
+
+    def segments(self, start: str = None, end: str = None) -> List[Path]:
+        """ Get all segments, optionally from day start to day end (YYYY-MM-DD, both included), by day """
+
+        res = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                path = Path(entry.path)
+                if not is_segment(path):
+                    continue
+                day = path.name[len(SEGMENT_PREFIX) : -len(SEGMENT_SUFFIX)]  # noqa: E203
+                if (start is None or day >= start) and (end is None or day <= end):
+                    res.append(path)
+        return sorted(res)
+
+    def append(self, name: str, data: bytes, timestamp: float = None) -> IndexEntry:
+        """ Append a file to the segment of the given time (now by default) """
+
+        segment = self.segment(segment_day(time.time() if timestamp is None else timestamp))
+        member = gzip.compress(data, compresslevel=COMPRESS_LEVEL, mtime=0)
+
+        with segment.open("ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(member)
+                f.flush()
+                entry = IndexEntry(name, offset, len(member))
+                # The index is only written once the data is in, so it never points past the segment
+                with index_path(segment).open("a") as idx:
+                    idx.write(f"{entry.name} {entry.offset} {entry.length}\n")
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+        return entry
+
+    def find(self, name: str, start: str = None, end: str = None) -> Optional[bytes]:
+        """ Find a file by name, optionally only in segments from day start to day end """
+
+        for segment in reversed(self.segments(start, end)):
+            for entry in read_index(segment):
+                if entry.name == name:
+                    return read_entry(segment, entry)
+        return None
+
+    def extract(self, segment: Path, dst_dir: Path) -> int:
+        """ Write out all files in a segment to a directory. Returns the number of files written """
+
+        count = 0
+        for name, data in iter_segment(segment):
+            (dst_dir / name).write_bytes(data)
+            count += 1
+        return count
@@ -0,0 +1,266 @@
+"""
+ASGI variant of the API.
+
+Serves the same resources as simon_says.app, but on falcon's ASGI support, with a non-blocking
+Redis client. Run it under any ASGI server, e.g.:
+
+    uvicorn --factory simon_says.asgi:create_asgi_app
+"""
+import logging
+import time
+from configparser import ConfigParser
+from functools import partial
+
+import falcon
+import falcon.asgi
+from falcon.util import sync_to_async
+
+from simon_says.app import (
+    add_panel_routes,
+    configure_media_handlers,
+    get_event_panel,
+    get_export_format,
+    get_panel,
+    get_sensor_history,
+    get_sensor_number,
+    handle_control_errors,
+    handle_event_errors,
+    parse_control_request,
+    parse_event,
+    requested_sensor_numbers,
+    run_action,
+    sensor_numbers,
+    sensors_as_json,
+    sensors_at_as_json,
+    set_event_response,
+    set_export_response,
+    set_json_response,
+    set_sensor_state,
+    transitions_as_dicts,
+)
+from simon_says.cache import EventCache, create_event_cache
+from simon_says.compression import AsyncResponseCompression
+from simon_says.config import install_reload_handler, on_reload
+from simon_says.control import Controller
+from simon_says.db import AsyncDataStore, DataStore
+from simon_says.events import AsyncEventStore
+from simon_says.export import encode_chunks_async
+from simon_says.history import AsyncSensorHistory
+from simon_says.log import AsyncLogSampling, configure_logging
+from simon_says.panels import Panels
+from simon_says.profiling import AsyncProfilingMiddleware, Profiler
+from simon_says.ratelimit import AsyncRateLimiter, RateLimits
+from simon_says.sensors import SensorState
+from simon_says.serialization import dumps
+from simon_says.version import __version__
+from simon_says.webhooks import WebhookDispatcher, create_webhook_dispatcher
+
+logger = logging.getLogger(__name__)
+
+
+class EventsResource:
+    """ API resource for Events """
+
+    def __init__(self, panels: Panels, webhooks: WebhookDispatcher = None) -> None:
+
+        self.panels = panels
+        self.webhooks = webhooks
+
+    async def on_get(self, req, resp, uid: str = None, account: str = None):
+        """ Handle GET requests for events in the queue """
+
+        event_store = get_panel(self.panels, account).event_store
+        if uid:
+            logger.info("Getting event with uid %s", uid)
+
+            e = await event_store.get(uid=uid)
+            if not e:
+                logger.error("uid %s not found", uid)
+                raise falcon.HTTPNotFound()
+            set_json_response(resp, e.to_json())
+
+        else:
+            logger.info("Getting all events")
+            events = await event_store.get_events(start=req.get_param_as_int("start"), end=req.get_param_as_int("end"))
+            set_json_response(resp, dumps([e.__dict__ for e in events]))
+
+    async def on_post(self, req, resp, account: str = None):
+        """ Handle POST requests for event """
+
+        data = await req.get_media()
+        with handle_event_errors():
+            event = parse_event(data)
+            panel = get_event_panel(self.panels, event, account)
+            added = await panel.event_store.add(event)
+            if added:
+                opened = set_sensor_state(panel.sensors, event)
+                if opened is not None and panel.sensor_history is not None:
+                    await panel.sensor_history.record([opened], SensorState.OPEN, event.timestamp)
+
+        set_event_response(resp, event, added, self.webhooks)
+
+
+class ExportResource:
+    """ API resource for exporting events in bulk """
+
+    def __init__(self, panels: Panels) -> None:
+        self.panels = panels
+
+    async def on_get(self, req, resp, account: str = None):
+        """ Handle GET requests for all events, streamed in chunks """
+
+        event_store = get_panel(self.panels, account).event_store
+        fmt = get_export_format(req)
+        logger.info("Exporting events as %s", fmt)
+        chunks = event_store.iter_event_chunks(start=req.get_param_as_int("start"), end=req.get_param_as_int("end"))
+        set_export_response(resp, fmt, encode_chunks_async(fmt, chunks))
+
+
+class ControllerResource:
+    """ API resource for commands and state """
+
+    def __init__(self, panels: Panels) -> None:
+        self.panels = panels
+
+    async def on_post(self, req, resp, account: str = None):
+        """ Handle POST requests for commands """
+
+        panel = get_panel(self.panels, account)
+        actions, code = parse_control_request(await req.get_media())
+        with handle_control_errors():
+            # Spooling writes call files to disk, so keep it off the event loop
+            await sync_to_async(run_action, panel.controller, panel.sensors, actions, code)
+
+        if "disarm" in actions and panel.sensor_history is not None:
+            await panel.sensor_history.record(sensor_numbers(panel.sensors), SensorState.CLOSED, int(time.time()))
+
+        set_json_response(resp, dumps({"result": "OK"}), falcon.HTTP_202)
+
+
+class SensorsResource:
+    """ Sensors resource class """
+
+    def __init__(self, panels: Panels) -> None:
+        self.panels = panels
+
+    async def on_get(self, req, resp, number: str = None, account: str = None):
+        """ Handle GET requests for a given sensor number, or all sensors. With ?at=, as of that time """
+
+        panel = get_panel(self.panels, account)
+        at = req.get_param_as_int("at")
+        if at is None:
+            set_json_response(resp, sensors_as_json(panel.sensors, number))
+            return
+
+        numbers = requested_sensor_numbers(panel.sensors, number)
+        logger.info("Getting sensor states at %s", at)
+        states = await get_sensor_history(panel).states_at(numbers, at=at)
+        set_json_response(resp, sensors_at_as_json(panel.sensors, number, numbers, states))
+
+    async def on_get_history(self, req, resp, number: str, account: str = None):
+        """ Handle GET requests for the state transitions of a sensor """
+
+        panel = get_panel(self.panels, account)
+        n = get_sensor_number(panel.sensors, number)
+        history = get_sensor_history(panel)
+        transitions = await history.transitions(n, start=req.get_param_as_int("start"), end=req.get_param_as_int("end"))
+        set_json_response(resp, dumps(transitions_as_dicts(transitions)))
+
+
+class PanelsResource:
+    """ Panels resource class """
+
+    def __init__(self, panels: Panels) -> None:
+        self.panels = panels
+
+    async def on_get(self, req, resp):
+        """ Handle GET requests for all configured panels """
+
+        set_json_response(resp, dumps([p.to_dict() for p in self.panels.get_all_panels()]))
+
+
+class CacheResource:
+    """ Event cache resource class """
+
+    def __init__(self, cache: EventCache) -> None:
+        self.cache = cache
+
+    async def on_get(self, req, resp):
+        """ Handle GET requests for event cache statistics """
+
+        set_json_response(resp, dumps(self.cache.stats()))
+
+
+class VersionResource:
+    """ Version resource class """
+
+    @staticmethod
+    async def on_get(req, resp):
+        """ Handle GET requests for API version """
+
+        set_json_response(resp, dumps({"version": __version__}))
+
+
+class DataStoreLifespan:
+    """ Close the Redis connection pool when the ASGI server shuts down """
+
+    def __init__(self, db: AsyncDataStore) -> None:
+        self.db = db
+
+    async def process_shutdown(self, scope, event):
+        await self.db.close()
+
+
+def create_asgi_app(
+    config: ConfigParser = None, controller: Controller = None, log_level: str = "INFO"
+) -> falcon.asgi.App:
+    """ Create a falcon.asgi.App object """
+
+    # Wire up the app handler with uvicorn's
+    uvicorn_logger = logging.getLogger("uvicorn.error")
+    configure_logging(log_level=log_level, handlers=uvicorn_logger.handlers, queued=True)
+
+    db = AsyncDataStore(config=config)
+    limits = RateLimits(db.cfg)
+    profiler = Profiler(db.cfg)
+    log_sampling = AsyncLogSampling(db.cfg)
+    middleware = [DataStoreLifespan(db), AsyncProfilingMiddleware(profiler), AsyncResponseCompression(db.cfg)]
+    middleware += [log_sampling] if log_sampling else []
+    api = falcon.asgi.App(middleware=middleware + ([AsyncRateLimiter(limits, db)] if limits else []))
+    configure_media_handlers(api)
+
+    version_resource = VersionResource()
+    api.add_route("/version", version_resource)
+
+    # Invalidations are received, and webhooks dispatched, on threads with a blocking client of their own
+    sync_db = DataStore(config=config)
+    cache = create_event_cache(sync_db)
+    if cache is not None:
+        api.add_route("/cache/stats", CacheResource(cache=cache))
+
+    panels = Panels(
+        event_store_factory=partial(AsyncEventStore, db, cache=cache),
+        config=config,
+        controller=controller,
+        sensor_history_factory=partial(AsyncSensorHistory, db),
+    )
+    api.add_route("/panels", PanelsResource(panels=panels))
+
+    webhooks = create_webhook_dispatcher(sync_db)
+
+    if config is None:
+        # Running with the config file: pick up changes on SIGHUP, without restarting the server. As with the WSGI
+        # app, this is also how profiling is turned on and off, so that no other signal is taken from uvicorn
+        on_reload(panels.reload)
+        on_reload(profiler.reload)
+        install_reload_handler()
+
+    add_panel_routes(
+        api,
+        events_resource=EventsResource(panels=panels, webhooks=webhooks),
+        sensors_resource=SensorsResource(panels=panels),
+        controller_resource=ControllerResource(panels=panels),
+        export_resource=ExportResource(panels=panels),
+    )
+
+    return api
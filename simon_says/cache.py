@@ -0,0 +1,114 @@
+"""
+In-process cache of decoded events.
+
+Events never change once stored, so a worker can keep the ones it has read and serve them
+again without going to Redis. The only way a cached event goes stale is being deleted, and
+event stores announce deletions on a Redis channel that every worker with a cache listens to.
+
+An event read from Redis right before it is deleted could still be cached after its invalidation arrived, so
+readers note the invalidation count before going to Redis, and only cache what they read if nothing was
+invalidated meanwhile.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from simon_says.db import DataStore
+
+logger = logging.getLogger(__name__)
+
+# Event stores publish the keys of deleted events here
+INVALIDATION_CHANNEL = "event_invalidations"
+
+# How often the listener thread checks for new messages, in seconds
+LISTEN_INTERVAL = 0.1
+
+
+class EventCache:
+    """ A bounded, thread-safe LRU cache of events by key, with hit and miss counters """
+
+    def __init__(self, max_size: int) -> None:
+        if max_size < 1:
+            raise ValueError(f"Invalid cache size: {max_size}")
+
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # Items invalidated so far (a clear counts as one)
+        self.invalidations = 0
+        self._items: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: str) -> Any:
+        """ Get an item, or None if it's not cached """
+
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._items.move_to_end(key)
+            return item
+
+    def put(self, key: str, item: Any, invalidations: int = None) -> None:
+        """
+        Add an item, evicting the least recently used one if full.
+        Given the invalidation count from before the item was read, it is not added if anything was invalidated since
+        """
+
+        with self._lock:
+            if invalidations is not None and invalidations != self.invalidations:
+                return
+            self._items[key] = item
+            self._items.move_to_end(key)
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        """ Remove an item, if cached """
+
+        with self._lock:
+            self._items.pop(key, None)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        """ Remove all items """
+
+        with self._lock:
+            self._items.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        """ Get size and hit/miss counters """
+
+        return {"size": len(self._items), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+    def listen(self, db: DataStore) -> None:
+        """ Invalidate items deleted by any process, from a background thread """
+
+        def on_error(err: Exception) -> None:
+            # Deletions may have been missed while disconnected
+            logger.warning("Error listening for event invalidations, clearing cache: %s", err)
+            self.clear()
+
+        self._listener = db.subscribe(INVALIDATION_CHANNEL, self.invalidate, on_error, LISTEN_INTERVAL)
+
+
+def create_event_cache(db: DataStore) -> Optional[EventCache]:
+    """ Create the event cache, listening for invalidations, if enabled with [events] cache_size """
+
+    size = db.cfg.getint("events", "cache_size", fallback=0)
+    if size <= 0:
+        return None
+
+    logger.info("Caching up to %s events", size)
+    cache = EventCache(max_size=size)
+    cache.listen(db)
+    return cache
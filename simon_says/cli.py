@@ -0,0 +1,215 @@
+"""
+Administrative command line tool: simon-says <command> [options]
+"""
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+from simon_says.archive import SegmentArchive, read_entry, read_index
+from simon_says.config import get_config
+from simon_says.db import DataStore
+from simon_says.events import EventStore
+from simon_says.export import EXPORT_FORMATS, encode_chunks, write_parquet
+from simon_says.importer import DEFAULT_BATCH_SIZE, EventImporter
+from simon_says.log import configure_logging
+from simon_says.webhooks import DEAD_LETTER_KEY, WebhookDispatcher, configured_webhooks
+
+logger = logging.getLogger(__name__)
+
+
+def import_events(args: argparse.Namespace) -> int:
+    """ Import archived event files into the event store """
+
+    importer = EventImporter(batch_size=args.batch_size, state_file=args.state_file)
+    state = importer.run(args.source)
+    print(f"Processed {state.processed} files: {state.imported} imported, {state.rejected} rejected")
+    return 0
+
+
+def export_events(args: argparse.Namespace) -> int:
+    """ Export events from the event store """
+
+    event_store = EventStore(db=DataStore(), account=args.account)
+    chunks = event_store.iter_event_chunks(start=args.start, end=args.end)
+
+    if args.format == "parquet":
+        if not args.output:
+            raise ValueError("Parquet export needs an output file")
+        write_parquet(chunks, args.output)
+        return 0
+
+    with (args.output.open("wb") if args.output else open(sys.stdout.fileno(), "wb", closefd=False)) as f:
+        for data in encode_chunks(args.format, chunks):
+            f.write(data)
+    return 0
+
+
+def list_archive(args: argparse.Namespace) -> int:
+    """ List the segments of the processed event archive """
+
+    archive = SegmentArchive(args.directory or Path(get_config().get("events", "dst_dir")))
+    for segment in archive.segments(start=args.start, end=args.end):
+        print(f"{segment}\t{len(read_index(segment))} files\t{segment.stat().st_size} bytes")
+    return 0
+
+
+def extract_archive(args: argparse.Namespace) -> int:
+    """ Write out event files from an archive segment """
+
+    if args.name:
+        for entry in read_index(args.segment):
+            if entry.name == args.name:
+                (args.output / entry.name).write_bytes(read_entry(args.segment, entry))
+                return 0
+        raise ValueError(f"{args.name} not found in {args.segment}")
+
+    count = SegmentArchive(args.segment.parent).extract(args.segment, args.output)
+    print(f"Extracted {count} files to {args.output}")
+    return 0
+
+
+def replay_webhooks(args: argparse.Namespace) -> int:
+    """ Try to deliver dead-lettered webhook events once more """
+
+    db = DataStore()
+    dispatcher = WebhookDispatcher(configured_webhooks(db.cfg), db)
+    count = dispatcher.replay_dead_letters()
+    print(f"Replayed {count} batches, {db.list_length(DEAD_LETTER_KEY)} left in the dead letter queue")
+    return 0
+
+
+def generate_load(args: argparse.Namespace) -> int:
+    """ Push synthetic events through the whole pipeline, and report their latency """
+
+    # Only used for load testing, so keep it out of the other commands' imports
+    from simon_says.loadgen import CallFileConsumer, CommandSender, LoadGenerator, format_latencies
+
+    generator = LoadGenerator(spool_dir=args.spool_dir, account=args.account, seed=args.seed)
+
+    consumer = None
+    if args.consume_calls:
+        consumer = CallFileConsumer(args.call_spool_dir or Path(generator.cfg.get("control", "spool_dir")))
+        consumer.start()
+
+    sender = None
+    if args.command_rate:
+        if not args.access_code:
+            raise ValueError("Sending commands needs an access code")
+        sender = CommandSender(args.url, args.access_code)
+        sender.start(args.command_rate)
+
+    started = time.monotonic()
+    try:
+        generator.run(rate=args.rate, duration=args.duration, timeout=args.timeout)
+    finally:
+        if sender is not None:
+            sender.stop()
+        if consumer is not None:
+            consumer.stop()
+    elapsed = time.monotonic() - started
+
+    stored = len(generator.latencies)
+    print(f"Wrote {generator.written} events, {stored} stored ({stored / elapsed:.1f}/s), {generator.pending} lost")
+    if generator.duplicates:
+        # Counted by the event store, so they may include retransmissions from real panels meanwhile
+        print(f"{generator.duplicates} events skipped as retransmissions (see [events] dedup_window)")
+    print(format_latencies("File to event store", generator.latencies))
+    if sender is not None:
+        print(format_latencies("Command requests", sender.latencies) + f", {sender.errors} errors")
+    if consumer is not None:
+        print(format_latencies("Call files waiting in spool", consumer.latencies))
+
+    if not args.keep:
+        generator.cleanup()
+    return 0 if not generator.pending else 1
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    """
+    Parse command line arguments
+    """
+    parser = argparse.ArgumentParser(prog="simon-says", description="Simon Says administration tool")
+    parser.add_argument("-l", "--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Import archived event files into the event store")
+    import_parser.add_argument(
+        "source", type=Path, help="Directory, archive segment or tarball (.tar, .tar.gz, ...) with event files"
+    )
+    import_parser.add_argument(
+        "-b", "--batch-size", default=DEFAULT_BATCH_SIZE, type=int, help="Files to store per round-trip"
+    )
+    import_parser.add_argument(
+        "-s", "--state-file", type=Path, help="Keep progress in this file, and resume from it if it exists"
+    )
+    import_parser.set_defaults(func=import_events)
+
+    export_parser = subparsers.add_parser("export", help="Export events from the event store")
+    export_parser.add_argument("-f", "--format", default="ndjson", choices=EXPORT_FORMATS)
+    export_parser.add_argument("-o", "--output", type=Path, help="Output file (default: standard output)")
+    export_parser.add_argument("-a", "--account", type=int, help="Export events of this panel account")
+    export_parser.add_argument("--start", type=int, help="Only events from this time on (seconds from epoch)")
+    export_parser.add_argument("--end", type=int, help="Only events up to this time (seconds from epoch)")
+    export_parser.set_defaults(func=export_events)
+
+    loadgen_parser = subparsers.add_parser(
+        "loadgen", help="Write synthetic event files at a target rate, and report end-to-end latency"
+    )
+    loadgen_parser.add_argument("-r", "--rate", default=10, type=float, help="Events per second")
+    loadgen_parser.add_argument("-d", "--duration", default=10, type=float, help="Seconds to write events for")
+    loadgen_parser.add_argument(
+        "-t", "--timeout", default=30, type=float, help="Seconds to wait for the last events to be stored"
+    )
+    loadgen_parser.add_argument("-a", "--account", default=1234, type=int, help="Account of the generated events")
+    loadgen_parser.add_argument("--spool-dir", type=Path, help="Write event files here (default: [events] src_dir)")
+    loadgen_parser.add_argument("--seed", type=int, help="Seed for the random event mix")
+    loadgen_parser.add_argument(
+        "--keep", action="store_true", help="Keep the generated events in the event store (deleted by default)"
+    )
+    loadgen_parser.add_argument(
+        "--consume-calls", action="store_true", help="Pick up call files from the outgoing spool, like Asterisk would"
+    )
+    loadgen_parser.add_argument("--call-spool-dir", type=Path, help="Outgoing spool (default: [control] spool_dir)")
+    loadgen_parser.add_argument("--command-rate", type=float, help="Also send this many disarm commands per second")
+    loadgen_parser.add_argument("--url", default="http://localhost:8000", help="API URL, for sending commands")
+    loadgen_parser.add_argument("--access-code", help="Access code, for sending commands")
+    loadgen_parser.set_defaults(func=generate_load)
+
+    list_parser = subparsers.add_parser("archive-list", help="List the segments of the processed event archive")
+    list_parser.add_argument("-d", "--directory", type=Path, help="Archive directory (default: [events] dst_dir)")
+    list_parser.add_argument("--start", help="Only segments from this day on (YYYY-MM-DD)")
+    list_parser.add_argument("--end", help="Only segments up to this day (YYYY-MM-DD)")
+    list_parser.set_defaults(func=list_archive)
+
+    extract_parser = subparsers.add_parser(
+        "archive-extract", help="Write out event files from an archive segment (to replay one, import it instead)"
+    )
+    extract_parser.add_argument("segment", type=Path, help="Segment (events-<YYYY-MM-DD>.gz)")
+    extract_parser.add_argument("-o", "--output", type=Path, default=Path("."), help="Output directory")
+    extract_parser.add_argument("-n", "--name", help="Only extract the file with this name")
+    extract_parser.set_defaults(func=extract_archive)
+
+    replay_parser = subparsers.add_parser("webhooks-replay", help="Send dead-lettered webhook events again")
+    replay_parser.set_defaults(func=replay_webhooks)
+
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None) -> int:
+    """ Entry point of the simon-says command """
+
+    args = parse_args(argv)
+    # Standard output may carry exported data, so log to standard error
+    configure_logging(args.log_level, handlers=[logging.StreamHandler(sys.stderr)])
+    try:
+        return args.func(args)
+    except (OSError, RuntimeError, ValueError) as err:
+        logger.error("%s failed: %s", args.command, err)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,33 +1,185 @@
-from typing import Any, Dict, List
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-import requests
+from simon_says.retry import AdaptiveTimeout, Backoff, CircuitBreaker, RetryPolicy
 
 # This is both the connect and read timeout values
 # Notice that this does not apply to the total length of the request
 # See: https://requests.readthedocs.io/en/latest/user/advanced/#timeouts
 DEFAULT_TIMEOUT = 10
 
+# Connecting never takes long, even to a busy API, so don't wait for as long as for responses
+CONNECT_TIMEOUT = 3.05
+
+# When the API sheds load (429/503), wait as told by its Retry-After header and try again,
+# this many times at most, and only if the wait is not longer than MAX_RETRY_AFTER seconds
+MAX_RETRIES = 3
+MAX_RETRY_AFTER = 60
+
+# The API sheds load with these before handling a request, so any request can be retried after them
+RETRY_STATUS_CODES = (429, 503)
+
+# Requests that can be sent twice to the same effect, so they are also retried after errors that leave it
+# unknown whether the API handled them (e.g. timeouts, 502, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+GATEWAY_STATUS_CODES = (502, 504)
+
+logger = logging.getLogger(__name__)
+
 
 class Client(object):
-    def __init__(self, url: str):
+    """
+    Client of the API.
+
+    Requests are retried according to a RetryPolicy, waiting with exponential backoff (or as long as the API asks
+    to, with Retry-After). Read timeouts of idempotent requests adapt to how long the API takes to answer each
+    route, without ever exceeding the timeout passed to each method, and after too many failures in a row a
+    circuit breaker makes requests fail fast (with CircuitOpenError) for a while, instead of piling up on an API
+    that is down.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        max_retries: int = MAX_RETRIES,
+        max_retry_after: float = MAX_RETRY_AFTER,
+        retry_policy: RetryPolicy = None,
+        breaker: CircuitBreaker = None,
+        adaptive_timeouts: bool = True,
+    ):
+        # requests is slow to import, so only pay for it when a Client is actually used
+        import requests
+        from urllib3.util.request import ACCEPT_ENCODING
+
         self._url = url
         self._session = requests.Session()
+        # Ask for compressed responses, in all the encodings that can be decoded here (brotli, when installed)
+        self._session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        self._retry_policy = retry_policy or RetryPolicy(max_retries=max_retries, max_retry_after=max_retry_after)
+        self.breaker = breaker or CircuitBreaker()
+        self._adaptive_timeouts = adaptive_timeouts
+        # By method and route (e.g. "GET /events/{uid}")
+        self._timeouts: Dict[str, AdaptiveTimeout] = {}
 
-    def get_version(self, timeout: int = DEFAULT_TIMEOUT):
-        r = self._session.get(f"{self._url}/version", timeout=timeout)
-        if r.status_code == 200:
+    @staticmethod
+    def _retry_after(r) -> Optional[float]:
+        """ Get how long the server asked us to wait, if it did """
+
+        try:
+            return float(r.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return None
+
+    @staticmethod
+    def _never_sent(err: Exception) -> bool:
+        """ Whether a request failed before reaching the API, so that it's safe to send it again """
+
+        import requests
+        from urllib3.exceptions import NewConnectionError
+
+        if isinstance(err, requests.ConnectTimeout):
+            return True
+        reason = getattr(err.args[0], "reason", None) if err.args else None
+        return isinstance(reason, NewConnectionError)
+
+    def _adaptive_timeout(self, method: str, route: str) -> Optional[AdaptiveTimeout]:
+        """ Get the timeout tracking requests like this one """
+
+        if not self._adaptive_timeouts:
+            return None
+        key = f"{method} {route}"
+        if key not in self._timeouts:
+            self._timeouts[key] = AdaptiveTimeout()
+        return self._timeouts[key]
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        expected_status: Union[int, Tuple[int, ...]],
+        timeout: int,
+        idempotent: bool = None,
+        route: str = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Send a request, retrying it when that's safe, and return the decoded response.
+        Requests are considered idempotent based on their method, unless told otherwise. Paths with parameters
+        are given along with their route (e.g. "/events/{uid}"), so that their response times are tracked together
+        """
+        import requests
+
+        expected = (expected_status,) if isinstance(expected_status, int) else expected_status
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        policy = self._retry_policy
+        backoff = Backoff(policy.backoff, policy.max_backoff)
+        # A request timing out early can't be sent again unless it's idempotent, so others wait for all the timeout
+        adaptive = self._adaptive_timeout(method, route or path) if idempotent else None
+
+        for attempt in range(policy.max_retries + 1):
+            self.breaker.allow()
+            # Each retry waits longer, in case the API just got slower
+            read_timeout = min(timeout, adaptive.get(timeout) * 2 ** attempt) if adaptive else timeout
+            started = time.monotonic()
+            try:
+                r = self._session.request(
+                    method, f"{self._url}{path}", timeout=(min(CONNECT_TIMEOUT, timeout), read_timeout), **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout) as err:
+                self.breaker.record_failure()
+                if attempt == policy.max_retries or not (idempotent or self._never_sent(err)):
+                    raise
+                wait = backoff.next()
+                logger.warning("%s %s failed (%s), retrying in %.1fs", method, path, err, wait)
+                time.sleep(wait)
+                continue
+            except Exception:
+                # Whatever went wrong, the breaker must hear about it, or it would wait for this request forever.
+                # Interrupts and exits are not the API's fault: a trial request that saw one is let through again
+                # after reset_timeout anyway
+                self.breaker.record_failure()
+                raise
+
+            retry_after = self._retry_after(r) if r.status_code in RETRY_STATUS_CODES else None
+            if retry_after is not None:
+                # The API is up and shedding load, and said when to come back: neither a failure nor a success
+                pass
+            elif r.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+                if adaptive:
+                    adaptive.observe(time.monotonic() - started)
+
+            if r.status_code in expected or attempt == policy.max_retries:
+                break
+            if r.status_code in RETRY_STATUS_CODES:
+                if retry_after is not None and retry_after > policy.max_retry_after:
+                    break
+                wait = backoff.next() if retry_after is None else retry_after
+            elif r.status_code in GATEWAY_STATUS_CODES and idempotent:
+                wait = backoff.next()
+            else:
+                break
+            logger.warning("%s %s got %s, retrying in %.1fs", method, path, r.status_code, wait)
+            time.sleep(wait)
+
+        if r.status_code in expected:
             return r.json()
         else:
             raise RuntimeError(f"Error code: {r.status_code}, content: {r.text}")
 
+    def get_version(self, timeout: int = DEFAULT_TIMEOUT):
+        return self._request("GET", "/version", 200, timeout)
+
     def _action(self, action: str, access_code: str, timeout: int = DEFAULT_TIMEOUT) -> str:
-        r = self._session.post(
-            f"{self._url}/control", json={"action": action, "access_code": access_code}, timeout=timeout
-        )
-        if r.status_code == 202:
-            return r.json()
-        else:
-            raise RuntimeError(f"Error code: {r.status_code}, content: {r.text}")
+        return self._request("POST", "/control", 202, timeout, json={"action": action, "access_code": access_code})
+
+    def send_commands(self, actions: List[str], access_code: str, timeout: int = DEFAULT_TIMEOUT) -> str:
+        """ Send several actions, in order, over a single call to the alarm """
+        return self._request("POST", "/control", 202, timeout, json={"actions": actions, "access_code": access_code})
 
     def arm_home(self, access_code: str, timeout: int = DEFAULT_TIMEOUT) -> str:
         return self._action(timeout=timeout, action="arm_home", access_code=access_code)
@@ -39,45 +191,21 @@ class Client(object):
         return self._action(timeout=timeout, action="disarm", access_code=access_code)
 
     def add_event(self, data: Dict, timeout: int = DEFAULT_TIMEOUT) -> str:
-        """ Add a single event """
-        r = self._session.post(f"{self._url}/events", json=data, timeout=timeout)
-        if r.status_code == 201:
-            return r.json()
-        else:
-            raise RuntimeError(f"Error code: {r.status_code}, content: {r.text}")
+        """ Add a single event. Retransmissions of events already stored are acknowledged with 200 """
+        return self._request("POST", "/events", (201, 200), timeout, json=data)
 
     def get_events(self, timeout: int = DEFAULT_TIMEOUT) -> List[Dict[str, Any]]:
         """ Get all events """
-        r = self._session.get(f"{self._url}/events", timeout=timeout)
-        if r.status_code == 200:
-            data = r.json()
-            return data
-        else:
-            raise RuntimeError(f"Error code: {r.status_code}, content: {r.text}")
+        return self._request("GET", "/events", 200, timeout)
 
     def get_event(self, uid: str, timeout: int = DEFAULT_TIMEOUT) -> Dict[str, Any]:
         """ Get a single event given its UID """
-        r = self._session.get(f"{self._url}/events/{uid}", timeout=timeout)
-        if r.status_code == 200:
-            data = r.json()
-            return data
-        else:
-            raise RuntimeError(f"Error code: {r.status_code}, content: {r.text}")
+        return self._request("GET", f"/events/{uid}", 200, timeout, route="/events/{uid}")
 
     def get_sensors(self, timeout: int = DEFAULT_TIMEOUT) -> List[Dict[str, Any]]:
         """ Get all sensors """
-        r = self._session.get(f"{self._url}/sensors", timeout=timeout)
-        if r.status_code == 200:
-            data = r.json()
-            return data
-        else:
-            raise RuntimeError(f"Error code: {r.status_code}, content: {r.text}")
+        return self._request("GET", "/sensors", 200, timeout)
 
     def get_sensor(self, number: str, timeout: int = DEFAULT_TIMEOUT) -> Dict[str, Any]:
         """ Get a single sensor given its number """
-        r = self._session.get(f"{self._url}/sensors/{number}", timeout=timeout)
-        if r.status_code == 200:
-            data = r.json()
-            return data
-        else:
-            raise RuntimeError(f"Error code: {r.status_code}, content: {r.text}")
+        return self._request("GET", f"/sensors/{number}", 200, timeout, route="/sensors/{number}")
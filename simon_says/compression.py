@@ -0,0 +1,182 @@
+"""
+Response compression, negotiated with the Accept-Encoding request header.
+
+JSON and CSV compress very well, which matters to clients polling /events over slow links. Responses are
+compressed with brotli when it is installed (pip install simon_says[brotli]) and preferred by the client, and with
+gzip otherwise. Streamed responses (e.g. exports) are compressed chunk by chunk, as they are sent.
+
+Set up in the [compression] config section, e.g.:
+
+    [compression]
+    # Set to no to leave compression to a reverse proxy
+    enabled = yes
+    # Smaller responses are sent as they are
+    min_size = 1024
+    # 1 (fastest) to 9 (smallest)
+    gzip_level = 6
+    # 0 (fastest) to 11 (smallest)
+    brotli_quality = 4
+"""
+import zlib
+from configparser import ConfigParser
+from typing import AsyncIterator, Dict, Iterable, Iterator, Optional
+
+import falcon
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None  # type: ignore
+
+COMPRESSION_SECTION = "compression"
+
+# Content types worth compressing (binary formats like Parquet are compressed already)
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+# Most preferred first, when the client likes them equally
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """ Get the quality value of each coding in an Accept-Encoding header """
+
+    codings: Dict[str, float] = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def negotiate(header: Optional[str], available: Iterable[str] = ENCODINGS) -> Optional[str]:
+    """ Pick the encoding to use for a response, given the Accept-Encoding header of the request """
+
+    codings = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = codings.get(encoding, codings.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class Compressor:
+    """ Incrementally compress a response body with the given encoding """
+
+    def __init__(self, encoding: str, gzip_level: int = 6, brotli_quality: int = 4) -> None:
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        elif encoding == "gzip":
+            self._brotli = None
+            # wbits=31 writes a gzip header and trailer
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, data: bytes) -> bytes:
+        """ Compress some data, returning whatever output is ready """
+
+        if self._brotli is not None:
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def flush(self) -> bytes:
+        """ Send everything given so far, e.g. the chunk of a stream, without ending the output """
+
+        if self._brotli is not None:
+            return self._brotli.flush()
+        return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        """ End the output """
+
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+class ResponseCompression:
+    """ Falcon middleware compressing responses for clients that accept it """
+
+    def __init__(self, config: ConfigParser) -> None:
+        self.enabled = config.getboolean(COMPRESSION_SECTION, "enabled", fallback=True)
+        self.min_size = config.getint(COMPRESSION_SECTION, "min_size", fallback=1024)
+        self.gzip_level = config.getint(COMPRESSION_SECTION, "gzip_level", fallback=6)
+        self.brotli_quality = config.getint(COMPRESSION_SECTION, "brotli_quality", fallback=4)
+
+    def _encoding_for(self, req, resp) -> Optional[str]:
+        """ Get the encoding to compress a response with, if any """
+
+        content_type = resp.content_type or ""
+        if not any(content_type.startswith(t) for t in COMPRESSIBLE_TYPES):
+            return None
+        if resp.get_header("Content-Encoding") or falcon.http_status_to_code(resp.status) in (204, 304):
+            return None
+        # The response depends on the request's Accept-Encoding, even when sent uncompressed
+        resp.append_header("Vary", "Accept-Encoding")
+        return negotiate(req.get_header("Accept-Encoding"))
+
+    def _compressor(self, encoding: str) -> Compressor:
+        return Compressor(encoding, gzip_level=self.gzip_level, brotli_quality=self.brotli_quality)
+
+    def _compress_body(self, resp, encoding: str, body: Optional[bytes]) -> None:
+        if body is None or len(body) < self.min_size:
+            return
+        compressor = self._compressor(encoding)
+        # Text takes precedence over data when rendering the body
+        resp.text = None
+        resp.data = compressor.compress(body) + compressor.finish()
+        resp.set_header("Content-Encoding", encoding)
+
+    def _compress_stream(self, stream: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+        compressor = self._compressor(encoding)
+        for chunk in stream:
+            # Flush each chunk, so that streaming isn't held up by compression
+            yield compressor.compress(chunk) + compressor.flush()
+        yield compressor.finish()
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        if not self.enabled:
+            return
+        encoding = self._encoding_for(req, resp)
+        if encoding is None:
+            return
+
+        if resp.stream is not None:
+            resp.stream = self._compress_stream(resp.stream, encoding)
+            resp.set_header("Content-Encoding", encoding)
+        else:
+            self._compress_body(resp, encoding, resp.render_body())
+
+
+class AsyncResponseCompression(ResponseCompression):
+    """ Falcon ASGI middleware compressing responses for clients that accept it """
+
+    async def _compress_async_stream(self, stream: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+        compressor = self._compressor(encoding)
+        async for chunk in stream:
+            yield compressor.compress(chunk) + compressor.flush()
+        yield compressor.finish()
+
+    async def process_response(self, req, resp, resource, req_succeeded):  # type: ignore
+        if not self.enabled:
+            return
+        encoding = self._encoding_for(req, resp)
+        if encoding is None:
+            return
+
+        if resp.stream is not None:
+            resp.stream = self._compress_async_stream(resp.stream, encoding)
+            resp.set_header("Content-Encoding", encoding)
+        else:
+            self._compress_body(resp, encoding, await resp.render_body())
@@ -1,6 +1,8 @@
 import logging
+import signal
 from configparser import ConfigParser
 from pathlib import Path
+from typing import Callable, Dict, List, Optional
 
 DEFAULT_CONFIG_PATH = Path("/etc/simon_says.ini")
 
@@ -15,6 +17,19 @@ DEFAULTS = {
         # Default directories to read files from and move them to on the Asterisk instance
         "src_dir": "/var/spool/asterisk/alarm_events",
         "dst_dir": "/var/spool/asterisk/alarm_events_processed",
+        # Files that can't be parsed (e.g. bad checksum) are moved here
+        "quarantine_dir": "/var/spool/asterisk/alarm_events_rejected",
+        # Append processed files to daily compressed segments in dst_dir, instead of moving them there one by one
+        "archive": "no",
+        # Levels of hashed subdirectories (e.g. 3f/a0/) event files are spread over, in src_dir and dst_dir
+        "shard_depth": 0,
+        # Handle at most this many files (the oldest) in each pass over src_dir (0 for all of them)
+        "batch_size": 0,
+        # Number of decoded events each API worker keeps in memory (0 disables the cache)
+        "cache_size": 0,
+        # Events with the same account, code, qualifier, zone/user and partition as one received less than
+        # this many seconds before are retransmissions of it, and are not stored (0 disables deduplication)
+        "dedup_window": 0,
     },
     "control": {
         # SIP extension that will receive the commands via Asterisk
@@ -52,3 +67,74 @@ class ConfigLoader:
             self.config.read(cfg_path)
         else:
             logger.warning("No configuration file found at %s. Using defaults", cfg_path)
+
+
+# Config shared by all components of this process, see get_config()
+_shared_config: Optional[ConfigParser] = None
+_reload_callbacks: List[Callable[[ConfigParser], None]] = []
+
+
+def get_config() -> ConfigParser:
+    """
+    Get the config shared by all components in this process, loading it on first use.
+
+    Treat it as read-only: reloading builds a new ConfigParser instead of changing this one,
+    so a component can keep using the config it was built with until it is handed a new one.
+    """
+    global _shared_config
+
+    if _shared_config is None:
+        _shared_config = ConfigLoader().config
+    return _shared_config
+
+
+def on_reload(callback: Callable[[ConfigParser], None]) -> None:
+    """ Have callback called with the new config whenever it is reloaded """
+
+    _reload_callbacks.append(callback)
+
+
+def reload_config() -> ConfigParser:
+    """ Load the config file again, replace the shared config, and notify subscribers """
+    global _shared_config
+
+    logger.info("Reloading configuration from %s", DEFAULT_CONFIG_PATH)
+    _shared_config = ConfigLoader().config
+    for callback in list(_reload_callbacks):
+        try:
+            callback(_shared_config)
+        except Exception:
+            logger.exception("Error applying new configuration with %s", callback)
+
+    return _shared_config
+
+
+def install_reload_handler(signum: int = signal.SIGHUP) -> None:
+    """ Reload the config when the process gets the given signal (SIGHUP by default) """
+
+    signal.signal(signum, lambda *_: reload_config())
+
+
+# Config section prefix for the sensor names of each panel, e.g. [sensors:1234]
+SENSORS_SECTION_PREFIX = "sensors:"
+
+
+def sensor_names(config: ConfigParser, section: str = "sensors") -> Dict[int, str]:
+    """ Get the sensor names in a config section, by sensor number """
+
+    if not config.has_section(section):
+        return {}
+    return {int(number): name for number, name in config[section].items()}
+
+
+def account_sensor_names(config: ConfigParser) -> Dict[Optional[int], Dict[int, str]]:
+    """
+    Get the sensor names of each panel with a [sensors:<account>] section, by account and sensor number.
+    The names in [sensors], used by all other accounts, are under None
+    """
+
+    names: Dict[Optional[int], Dict[int, str]] = {None: sensor_names(config)}
+    for section in config.sections():
+        if section.startswith(SENSORS_SECTION_PREFIX):
+            names[int(section[len(SENSORS_SECTION_PREFIX) :])] = sensor_names(config, section)  # noqa: E203
+    return names
@@ -1,10 +1,11 @@
 import logging
 from configparser import ConfigParser
 from pathlib import Path
+from typing import List, Sequence
 
 from pycall import Application, Call, CallFile
 
-from simon_says.config import ConfigLoader
+from simon_says.config import get_config
 
 # Map relevant actions to DTMF sequences
 # See user manual at https://static.interlogix.com/library/466-2266_rev_f.pdf
@@ -19,6 +20,19 @@ ACTION_TO_DTMF = {
     "terminate": ["9"],
 }
 
+# Shorter names the API takes for the most common actions
+ACTION_ALIASES = {
+    "arm_home": "arm_doors_and_windows_no_delay",
+    "arm_away": "arm_doors_and_windows_and_motion_sensors",
+}
+
+# Most actions a single call can carry
+MAX_ACTIONS_PER_CALL = 8
+
+# Pause between the tones of different actions in a batch (2 seconds), longer than the one between the tones of
+# a single action
+ACTION_PAUSE = "wwww"
+
 logger = logging.getLogger(__name__)
 
 
@@ -35,7 +49,7 @@ class Controller:
         asterisk_user: str = None,
         spool_dir: Path = None,
     ) -> None:
-        self.cfg = config or ConfigLoader().config
+        self.cfg = config or get_config()
         self._state_db_key = "armed_state"
         self.extension = extension or self.cfg.get("control", "extension")
         self.wait_time = wait_time or int(self.cfg.get("control", "wait_time"))
@@ -47,28 +61,74 @@ class Controller:
         if not self.spool_dir.is_dir():
             raise ValueError(f"spool_dir {self.spool_dir} is not a valid directory")
 
+    @staticmethod
+    def _resolve_actions(actions: Sequence[str]) -> List[str]:
+        """ Validate a batch of actions, and resolve their aliases """
+
+        if not actions:
+            raise ValueError("No actions")
+        if len(actions) > MAX_ACTIONS_PER_CALL:
+            raise ValueError(f"Too many actions: {len(actions)} (at most {MAX_ACTIONS_PER_CALL} per call)")
+
+        resolved = [ACTION_ALIASES.get(action, action) for action in actions]
+        for action in resolved:
+            if action not in ACTION_TO_DTMF:
+                raise ValueError(f"Invalid action: {action}")
+        if len(resolved) > 1 and "terminate" in resolved:
+            # The panel would hang up before getting the rest
+            raise ValueError("terminate can't be batched with other actions")
+        Controller._check_unambiguous(resolved)
+        return resolved
+
+    @staticmethod
+    def _check_unambiguous(actions: Sequence[str]) -> None:
+        """
+        Make sure the tones of a batch can't be read as other actions: the panel reads tones one after the other,
+        so e.g. arm_doors_and_windows twice would arm without delay. Any tones running across the end of an
+        action that make up another action are rejected
+        """
+
+        by_tones = {tuple(tones): action for action, tones in ACTION_TO_DTMF.items()}
+        tones: List[str] = []
+        boundaries = []
+        for action in actions:
+            if tones:
+                boundaries.append(len(tones))
+            tones.extend(ACTION_TO_DTMF[action])
+
+        for start in range(len(tones)):
+            for end in range(start + 2, len(tones) + 1):
+                if not any(start < b < end for b in boundaries):
+                    continue
+                other = by_tones.get(tuple(tones[start:end]))
+                if other is not None:
+                    raise ValueError(f"Ambiguous actions: tones {''.join(tones[start:end])} would read as {other}")
+
     @staticmethod
     def _build_dtmf_sequence(action: str, access_code: str) -> str:
         """
         Build DTMF tone sequence to send to alarm
         """
 
-        if action not in ACTION_TO_DTMF:
-            raise ValueError(f"Invalid action: {action}")
+        return Controller._build_batch_dtmf_sequence([action], access_code)
+
+    @staticmethod
+    def _build_batch_dtmf_sequence(actions: Sequence[str], access_code: str) -> str:
+        """
+        Build a DTMF tone sequence sending several actions, in order, over a single call.
+        The panel takes commands until told to hang up, so the access code is only entered once
+        """
 
         # "w" means wait a half second
         # For more details, see https://wiki.asterisk.org/wiki/display/AST/Application_SendDTMF
 
-        # Wait before sending the access code
-        sections = ["w", access_code]
-
-        # Add requested action
-        sections.extend(ACTION_TO_DTMF[action])
+        # Tones of each action, with a half-second in between them
+        actions_tones = ["w".join(ACTION_TO_DTMF[action]) for action in Controller._resolve_actions(actions)]
 
-        # Hang up
-        sections.extend(ACTION_TO_DTMF["terminate"])
+        # Wait before sending the access code, pause longer between actions, and hang up
+        sections = ["w", access_code, ACTION_PAUSE.join(actions_tones)] + ACTION_TO_DTMF["terminate"]
 
-        # Join all tones with a half-second in between them
+        # Join all sections with a half-second in between them
         result = "w".join(sections)
 
         return result
@@ -76,21 +136,26 @@ class Controller:
     def send_command(self, action: str, access_code: str) -> None:
         """ Send control sequence via Asterisk call file """
 
+        self.send_commands([action], access_code)
+
+    def send_commands(self, actions: Sequence[str], access_code: str) -> None:
+        """ Send several actions, in order, in the control sequence of a single Asterisk call file """
+
         call = Call(
             f"SIP/{self.extension}", wait_time=self.wait_time, retry_time=self.retry_time, max_retries=self.max_retries
         )
 
-        seq = self._build_dtmf_sequence(action, access_code)
+        seq = self._build_batch_dtmf_sequence(actions, access_code)
 
-        logger.debug("Sending action '%s' (DTMF: '%s') to alarm", action, seq)
+        logger.debug("Sending actions %s (DTMF: '%s') to alarm", ", ".join(actions), seq)
 
-        action = Application("SendDTMF", seq)
+        application = Application("SendDTMF", seq)
 
         callfile_args = {"archive": True, "spool_dir": self.spool_dir}
         if self.asterisk_user:
             callfile_args["user"] = self.asterisk_user
 
-        c = CallFile(call, action, **callfile_args)
+        c = CallFile(call, application, **callfile_args)
         c.spool()
 
     def disarm(self, access_code: str) -> None:
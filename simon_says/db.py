@@ -1,44 +1,549 @@
+import bisect
+import itertools
 import logging
+import threading
+import zlib
+from collections import defaultdict
 from configparser import ConfigParser
-from typing import List
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 import redis
+import redis.asyncio
+import redis.asyncio.cluster
+import redis.cluster
 
-from simon_says.config import ConfigLoader
+from simon_says.config import get_config
+from simon_says.profiling import timed_methods
 
 logger = logging.getLogger(__name__)
 
+# Number of points each node gets on the hash ring. More points spread keys more evenly.
+RING_REPLICAS = 64
 
-class DataStore:
-    """ Persistence class """
+# How many keys to ask for on each SCAN iteration
+SCAN_COUNT = 1000
+
+# How many index members to fetch per round-trip when iterating over an index
+INDEX_CHUNK_SIZE = 1000
+
+NodeT = TypeVar("NodeT")
+
+
+def hash_tag(key: str) -> str:
+    """
+    Return the part of the key used to pick a node.
+    Same as Redis Cluster: if the key contains a non-empty {tag}, only the tag is hashed,
+    so that related keys (e.g. all events of an account) land on the same node.
+    """
+
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1 : end]  # noqa: E203
+    return key
+
+
+class HashRing(Generic[NodeT]):
+    """ Consistent hashing ring, mapping keys to nodes """
+
+    def __init__(self, nodes: Sequence[Tuple[str, NodeT]], replicas: int = RING_REPLICAS) -> None:
+        points = []
+        for name, node in nodes:
+            for i in range(replicas):
+                points.append((zlib.crc32(f"{name}#{i}".encode()), node))
+        points.sort(key=lambda p: p[0])
+        self._hashes = [p[0] for p in points]
+        self._nodes = [p[1] for p in points]
+
+    def get_node(self, key: str) -> NodeT:
+        """ Get the node that owns the given key """
+
+        idx = bisect.bisect(self._hashes, zlib.crc32(hash_tag(key).encode())) % len(self._hashes)
+        return self._nodes[idx]
+
+
+def parse_nodes(value: str) -> List[Tuple[str, int]]:
+    """ Parse a comma-separated list of host:port pairs """
+
+    nodes = []
+    for item in value.split(","):
+        item = item.strip()
+        if item:
+            host, _, port = item.rpartition(":")
+            nodes.append((host, int(port)))
+    return nodes
+
+
+class IndexCursor:
+    """
+    Position of a chunked walk over a sorted index.
+
+    Paging with LIMIT offset makes Redis skip over all previous members on every call, so instead each
+    chunk starts at the last score seen, skipping only the members that share that score.
+    """
+
+    def __init__(self, start: float = None, end: float = None) -> None:
+        self.low: Union[float, str] = "-inf" if start is None else start
+        self.high: Union[float, str] = "+inf" if end is None else end
+        self.skip = 0
+        self.done = False
+
+    def advance(self, items: List[Tuple[str, float]], chunk_size: int) -> List[str]:
+        """ Move past a chunk of (member, score) items and return its members """
+
+        if len(items) < chunk_size:
+            self.done = True
+        elif items:
+            last = items[-1][1]
+            same = sum(1 for _ in itertools.takewhile(lambda i: i[1] == last, reversed(items)))
+            if last == self.low:
+                self.skip += same
+            else:
+                self.low = last
+                self.skip = same
+        return [member for member, _ in items]
+
+
+class BaseDataStore(Generic[NodeT]):
+    """
+    Node selection shared by the sync and async data stores.
+
+    Depending on the [data_store] config, records are kept in:
+      - a single Redis instance (redis_host/redis_port)
+      - several independent Redis instances, picked by consistent hashing of the key (redis_nodes)
+      - a Redis Cluster (redis_cluster = yes), which does its own sharding
+    """
 
     def __init__(self, config: ConfigParser = None) -> None:
-        self.cfg = config or ConfigLoader().config
+        self.cfg = config or get_config()
         redis_host = self.cfg.get("data_store", "redis_host")
-        redis_port = self.cfg.get("data_store", "redis_port")
-        logger.debug("Instantiating Redis client at %s:%s", redis_host, redis_port)
-        self._redis = redis.Redis(host=redis_host, port=int(redis_port), db=0, decode_responses=True)
+        redis_port = int(self.cfg.get("data_store", "redis_port"))
+
+        self._nodes: List[NodeT] = []
+        self._cluster = self.cfg.getboolean("data_store", "redis_cluster", fallback=False)
+        if self._cluster:
+            logger.debug("Instantiating Redis Cluster client at %s:%s", redis_host, redis_port)
+            self._nodes.append(self._cluster_client(redis_host, redis_port))
+        else:
+            nodes = parse_nodes(self.cfg.get("data_store", "redis_nodes", fallback=""))
+            if not nodes:
+                nodes = [(redis_host, redis_port)]
+            for host, port in nodes:
+                logger.debug("Instantiating Redis client at %s:%s", host, port)
+                self._nodes.append(self._client(host, port))
+
+        self._ring = HashRing([(str(i), n) for i, n in enumerate(self._nodes)])
+        self._scripts: Dict[Tuple[int, str], Any] = {}
+
+    def _client(self, host: str, port: int) -> NodeT:
+        raise NotImplementedError
+
+    def _cluster_client(self, host: str, port: int) -> NodeT:
+        raise NotImplementedError
+
+    def _node_for(self, key: str) -> NodeT:
+        """ Get the client that holds the given key """
+
+        if len(self._nodes) == 1:
+            return self._nodes[0]
+        return self._ring.get_node(key)
+
+    def colocated(self, keys: Sequence[str]) -> bool:
+        """
+        Whether keys can be used together in a single script: they share a hash tag, or, outside of a cluster
+        (where each tag has a slot of its own), they are on the same node anyway
+        """
+
+        if len({hash_tag(k) for k in keys}) == 1:
+            return True
+        return not self._cluster and len({id(self._node_for(k)) for k in keys}) == 1
 
-    def add(self, key: str, value: str) -> None:
+    def _script_for(self, keys: Sequence[str], script: str) -> Any:
+        """
+        Get a Lua script registered with the node that holds the keys (which must share a hash tag).
+        Scripts are sent by SHA, and only loaded into Redis when it does not have them yet.
+        """
+
+        node = self._node_for(keys[0])
+        cache_key = (id(node), script)
+        if cache_key not in self._scripts:
+            self._scripts[cache_key] = node.register_script(script)  # type: ignore
+        return self._scripts[cache_key]
+
+    def _group_by_node(self, keys: Sequence[str]) -> Dict[Any, List[int]]:
+        """ Group key positions by the node that holds them """
+
+        groups: Dict[Any, List[int]] = defaultdict(list)
+        for i, key in enumerate(keys):
+            groups[self._node_for(key)].append(i)
+        return groups
+
+
+@timed_methods("datastore")
+class DataStore(BaseDataStore[redis.Redis]):
+    """ Persistence class """
+
+    def _client(self, host: str, port: int) -> redis.Redis:
+        return redis.Redis(host=host, port=port, db=0, decode_responses=True)
+
+    def _cluster_client(self, host: str, port: int) -> redis.Redis:
+        # Not a Redis subclass, but it takes the same commands
+        return redis.cluster.RedisCluster(host=host, port=port, decode_responses=True)  # type: ignore
+
+    def add(self, key: str, value: Union[str, bytes]) -> None:
         """ Add a record """
 
         logger.debug("Adding key %s to db", key)
-        self._redis.execute_command("SET", key, value)
+        self._node_for(key).set(key, value)
+
+    def add_new(self, key: str, value: Union[str, bytes]) -> bool:
+        """ Add a record, unless it exists already. Returns whether it was written """
+
+        return bool(self._node_for(key).set(key, value, nx=True))
 
     def delete(self, key: str) -> None:
         """ Delete a record """
 
         logger.debug("Deleting record %s", key)
-        self._redis.execute_command("DEL", key)
+        self._node_for(key).delete(key)
 
-    def get(self, key: str) -> str:
+    def get(self, key: str) -> Optional[str]:
         """ Get AlarmEvent by UID """
 
         logger.debug("Getting key %s from store", key)
-        return self._redis.execute_command("GET", key)
+        return self._node_for(key).get(key)
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[str]]:
+        """ Get several records at once, with one round-trip per node """
+
+        res: List[Optional[str]] = [None] * len(keys)
+        for node, positions in self._group_by_node(keys).items():
+            pipe = node.pipeline(transaction=False)
+            for i in positions:
+                pipe.get(keys[i])
+            for i, value in zip(positions, pipe.execute()):
+                res[i] = value
+        return res
+
+    def add_many(self, items: Sequence[Tuple[str, Union[str, bytes]]], only_new: bool = False) -> List[bool]:
+        """
+        Add several records at once, with one pipelined round-trip per node.
+        With only_new, existing records are left untouched. Returns whether each record was written.
+        """
+
+        keys = [k for k, _ in items]
+        res = [False] * len(items)
+        for node, positions in self._group_by_node(keys).items():
+            pipe = node.pipeline(transaction=False)
+            for i in positions:
+                pipe.set(items[i][0], items[i][1], nx=only_new)
+            for i, written in zip(positions, pipe.execute()):
+                res[i] = bool(written)
+        return res
+
+    def exists(self, key: str) -> bool:
+        """ Check whether a record exists """
+
+        return bool(self._node_for(key).exists(key))
+
+    def increment(self, key: str) -> int:
+        """ Increment a counter, returning its new value """
+
+        return self._node_for(key).incr(key)
+
+    def run_script(self, script: str, keys: Sequence[str], args: Sequence[Any]) -> Any:
+        """ Run a Lua script atomically on the node that holds the keys """
+
+        return self._script_for(keys, script)(keys=keys, args=args)
+
+    def run_script_many(self, script: str, calls: Sequence[Tuple[Sequence[str], Sequence[Any]]]) -> List[Any]:
+        """
+        Run a Lua script once for each (keys, args) given, with one pipelined round-trip per node.
+        Each run is atomic on its own, and the keys of each must be colocated
+        """
+
+        if self._cluster:
+            # Cluster pipelines don't run scripts, so send them one by one
+            return [self.run_script(script, keys, args) for keys, args in calls]
+
+        res: List[Any] = [None] * len(calls)
+        for node, positions in self._group_by_node([keys[0] for keys, _ in calls]).items():
+            pipe = node.pipeline(transaction=False)
+            for i in positions:
+                keys, args = calls[i]
+                self._script_for(keys, script)(keys=keys, args=args, client=pipe)
+            for i, value in zip(positions, pipe.execute()):
+                res[i] = value
+        return res
+
+    def publish(self, channel: str, message: str) -> None:
+        """ Publish a message on a channel """
+
+        self._node_for(channel).publish(channel, message)
+
+    def subscribe(
+        self,
+        channel: str,
+        callback: Callable[[str], None],
+        on_error: Callable[[Exception], None],
+        interval: float,
+    ) -> threading.Thread:
+        """
+        Call callback with every message published on a channel, from a daemon thread.
+        The subscription survives connection errors, which are passed to on_error.
+        """
+
+        pubsub = self._node_for(channel).pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{channel: lambda message: callback(message["data"])})
+        return pubsub.run_in_thread(sleep_time=interval, daemon=True, exception_handler=lambda err, *_: on_error(err))
+
+    def push(self, key: str, value: Union[str, bytes]) -> None:
+        """ Append a value to a list """
+
+        self._node_for(key).rpush(key, value)
+
+    def pop(self, key: str) -> Optional[str]:
+        """ Remove and return the first value of a list, or None if it's empty """
+
+        return self._node_for(key).lpop(key)
+
+    def list_length(self, key: str) -> int:
+        """ Get the length of a list """
+
+        return self._node_for(key).llen(key)
 
     def get_all_keys(self, pattern: str) -> List[str]:
-        """ Get all keys matching the given pattern """
+        """ Get all keys matching the given pattern, from all nodes """
+
+        logger.debug("Retrieving all keys matching %s from store", pattern)
+        res: List[str] = []
+        for node in self._nodes:
+            res.extend(node.scan_iter(match=pattern, count=SCAN_COUNT))
+        return res
+
+    def add_to_index(self, key: str, member: str, score: float) -> None:
+        """ Add a member to a sorted index """
+
+        self._node_for(key).zadd(key, {member: score})
+
+    def add_many_to_index(self, key: str, scores: Mapping[str, float]) -> None:
+        """ Add several members to a sorted index """
+
+        if scores:
+            # redis types members as str or bytes
+            members: Dict[Union[str, bytes], float] = {m: s for m, s in scores.items()}
+            self._node_for(key).zadd(key, members)
+
+    def remove_from_index(self, key: str, member: str) -> None:
+        """ Remove a member from a sorted index """
+
+        self._node_for(key).zrem(key, member)
+
+    def add_to_indexes(self, entries: Sequence[Tuple[str, str, float]]) -> None:
+        """ Add (key, member, score) entries to several sorted indexes, with one round-trip per node """
+
+        for node, positions in self._group_by_node([e[0] for e in entries]).items():
+            pipe = node.pipeline(transaction=False)
+            for i in positions:
+                key, member, score = entries[i]
+                pipe.zadd(key, {member: score})
+            pipe.execute()
+
+    def last_from_indexes(self, keys: Sequence[str], end: float = None) -> List[Optional[str]]:
+        """ Get the member with the highest score up to end from each of several sorted indexes """
+
+        res: List[Optional[str]] = [None] * len(keys)
+        for node, positions in self._group_by_node(keys).items():
+            pipe = node.pipeline(transaction=False)
+            for i in positions:
+                pipe.zrevrangebyscore(keys[i], "+inf" if end is None else end, "-inf", start=0, num=1)
+            for i, members in zip(positions, pipe.execute()):
+                res[i] = members[0] if members else None
+        return res
+
+    def range_from_index(
+        self, key: str, start: float = None, end: float = None, offset: int = None, count: int = None
+    ) -> List[str]:
+        """ Get index members with scores within [start, end], in ascending order """
+
+        if count is not None and offset is None:
+            offset = 0
+        return self._node_for(key).zrangebyscore(
+            key,
+            "-inf" if start is None else start,
+            "+inf" if end is None else end,
+            start=offset,
+            num=count,
+        )
+
+    def iter_index(
+        self, key: str, start: float = None, end: float = None, chunk_size: int = INDEX_CHUNK_SIZE
+    ) -> Iterator[List[str]]:
+        """ Iterate over index members with scores within [start, end], in ascending order, a chunk at a time """
+
+        node = self._node_for(key)
+        cursor = IndexCursor(start, end)
+        while not cursor.done:
+            items = node.zrangebyscore(key, cursor.low, cursor.high, start=cursor.skip, num=chunk_size, withscores=True)
+            members = cursor.advance(items, chunk_size)
+            if members:
+                yield members
+
+
+@timed_methods("datastore")
+class AsyncDataStore(BaseDataStore[redis.asyncio.Redis]):
+    """ Persistence class, using a non-blocking Redis client (for the ASGI app) """
+
+    def _client(self, host: str, port: int) -> redis.asyncio.Redis:
+        return redis.asyncio.Redis(host=host, port=port, db=0, decode_responses=True)
+
+    def _cluster_client(self, host: str, port: int) -> redis.asyncio.Redis:
+        # Not a Redis subclass, but it takes the same commands
+        return redis.asyncio.cluster.RedisCluster(host=host, port=port, decode_responses=True)  # type: ignore
+
+    async def add(self, key: str, value: Union[str, bytes]) -> None:
+        """ Add a record """
+
+        logger.debug("Adding key %s to db", key)
+        await self._node_for(key).set(key, value)
+
+    async def add_new(self, key: str, value: Union[str, bytes]) -> bool:
+        """ Add a record, unless it exists already. Returns whether it was written """
+
+        return bool(await self._node_for(key).set(key, value, nx=True))
+
+    async def delete(self, key: str) -> None:
+        """ Delete a record """
+
+        logger.debug("Deleting record %s", key)
+        await self._node_for(key).delete(key)
+
+    async def get(self, key: str) -> Optional[str]:
+        """ Get AlarmEvent by UID """
+
+        logger.debug("Getting key %s from store", key)
+        return await self._node_for(key).get(key)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[str]]:
+        """ Get several records at once, with one round-trip per node """
+
+        res: List[Optional[str]] = [None] * len(keys)
+        for node, positions in self._group_by_node(keys).items():
+            pipe = node.pipeline(transaction=False)
+            for i in positions:
+                pipe.get(keys[i])
+            for i, value in zip(positions, await pipe.execute()):
+                res[i] = value
+        return res
+
+    async def exists(self, key: str) -> bool:
+        """ Check whether a record exists """
+
+        return bool(await self._node_for(key).exists(key))
+
+    async def increment(self, key: str) -> int:
+        """ Increment a counter, returning its new value """
+
+        return await self._node_for(key).incr(key)
+
+    async def run_script(self, script: str, keys: Sequence[str], args: Sequence[Any]) -> Any:
+        """ Run a Lua script atomically on the node that holds the keys """
+
+        return await self._script_for(keys, script)(keys=keys, args=args)
+
+    async def publish(self, channel: str, message: str) -> None:
+        """ Publish a message on a channel """
+
+        await self._node_for(channel).publish(channel, message)
+
+    async def get_all_keys(self, pattern: str) -> List[str]:
+        """ Get all keys matching the given pattern, from all nodes """
 
         logger.debug("Retrieving all keys matching %s from store", pattern)
-        return self._redis.execute_command(f"KEYS {pattern}")
+        res: List[str] = []
+        for node in self._nodes:
+            res.extend([k async for k in node.scan_iter(match=pattern, count=SCAN_COUNT)])
+        return res
+
+    async def add_to_index(self, key: str, member: str, score: float) -> None:
+        """ Add a member to a sorted index """
+
+        await self._node_for(key).zadd(key, {member: score})
+
+    async def remove_from_index(self, key: str, member: str) -> None:
+        """ Remove a member from a sorted index """
+
+        await self._node_for(key).zrem(key, member)
+
+    async def add_to_indexes(self, entries: Sequence[Tuple[str, str, float]]) -> None:
+        """ Add (key, member, score) entries to several sorted indexes, with one round-trip per node """
+
+        for node, positions in self._group_by_node([e[0] for e in entries]).items():
+            pipe = node.pipeline(transaction=False)
+            for i in positions:
+                key, member, score = entries[i]
+                pipe.zadd(key, {member: score})
+            await pipe.execute()
+
+    async def last_from_indexes(self, keys: Sequence[str], end: float = None) -> List[Optional[str]]:
+        """ Get the member with the highest score up to end from each of several sorted indexes """
+
+        res: List[Optional[str]] = [None] * len(keys)
+        for node, positions in self._group_by_node(keys).items():
+            pipe = node.pipeline(transaction=False)
+            for i in positions:
+                pipe.zrevrangebyscore(keys[i], "+inf" if end is None else end, "-inf", start=0, num=1)
+            for i, members in zip(positions, await pipe.execute()):
+                res[i] = members[0] if members else None
+        return res
+
+    async def range_from_index(
+        self, key: str, start: float = None, end: float = None, offset: int = None, count: int = None
+    ) -> List[str]:
+        """ Get index members with scores within [start, end], in ascending order """
+
+        if count is not None and offset is None:
+            offset = 0
+        return await self._node_for(key).zrangebyscore(
+            key,
+            "-inf" if start is None else start,
+            "+inf" if end is None else end,
+            start=offset,
+            num=count,
+        )
+
+    async def iter_index(
+        self, key: str, start: float = None, end: float = None, chunk_size: int = INDEX_CHUNK_SIZE
+    ) -> AsyncIterator[List[str]]:
+        """ Iterate over index members with scores within [start, end], in ascending order, a chunk at a time """
+
+        node = self._node_for(key)
+        cursor = IndexCursor(start, end)
+        while not cursor.done:
+            items = await node.zrangebyscore(
+                key, cursor.low, cursor.high, start=cursor.skip, num=chunk_size, withscores=True
+            )
+            members = cursor.advance(items, chunk_size)
+            if members:
+                yield members
+
+    async def close(self) -> None:
+        """ Close the connection pools """
+
+        for node in self._nodes:
+            await node.close()
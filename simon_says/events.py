@@ -1,20 +1,55 @@
-import configparser
-import datetime
-import json
 import logging
-import re
-from configparser import ConfigParser
-from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
 from pydantic import BaseModel
 
-from simon_says.ademco import CODES, EVENT_CATEGORIES
-from simon_says.config import ConfigLoader
-from simon_says.db import DataStore
+from simon_says.cache import INVALIDATION_CHANNEL, EventCache
+from simon_says.db import INDEX_CHUNK_SIZE, AsyncDataStore, DataStore
+from simon_says.parser import EventParser  # noqa: F401 (kept importable from here)
+from simon_says.serialization import dumps, loads
 
 logger = logging.getLogger(__name__)
 
+# Claim the content key of an event (KEYS[1]) for the dedup window, unless an event with the same content
+# and a timestamp within the window (ARGV[2], in seconds) of this one (ARGV[1]) already did.
+# Returns 1 for duplicates, and 0 otherwise.
+DEDUP_SCRIPT = """
+local last = tonumber(redis.call("GET", KEYS[1]))
+local ts = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+if last and math.abs(ts - last) < window then
+    return 1
+end
+redis.call("SET", KEYS[1], ARGV[1], "EX", window)
+return 0
+"""
+
+
+# Store an event (KEYS[1], ARGV[1]) unless it exists already, and index its uid (ARGV[2]) by timestamp (ARGV[3]) in
+# KEYS[2], atomically, so that a stored event is always indexed. Given a dedup key (KEYS[3]) and window (ARGV[4]),
+# retransmissions are skipped as with DEDUP_SCRIPT, and the key is only claimed along with storing the event.
+# Returns one of the ADD_* results.
+ADD_SCRIPT = """
+if redis.call("EXISTS", KEYS[1]) == 1 then
+    return 0
+end
+if KEYS[3] then
+    local last = tonumber(redis.call("GET", KEYS[3]))
+    local ts = tonumber(ARGV[3])
+    local window = tonumber(ARGV[4])
+    if last and math.abs(ts - last) < window then
+        return 2
+    end
+    redis.call("SET", KEYS[3], ARGV[3], "EX", window)
+end
+redis.call("SET", KEYS[1], ARGV[1])
+redis.call("ZADD", KEYS[2], ARGV[3], ARGV[2])
+return 1
+"""
+ADD_EXISTS = 0
+ADD_STORED = 1
+ADD_DUPLICATE = 2
+
 
 class AlarmEvent(BaseModel):
     """ Represents an alarm event """
@@ -35,233 +70,402 @@ class AlarmEvent(BaseModel):
     checksum: int
     status: Optional[str]
 
+    @classmethod
+    def from_trusted(cls, data: Dict[str, Any]) -> "AlarmEvent":
+        """
+        Build an event from data that was already validated at ingest (e.g. read back from the store).
+        Skips pydantic validation, which dominates the cost of reading events.
+        """
+        return cls.construct(**data)
+
     def to_dict(self) -> Dict[str, Any]:
         """ Convert to Dict """
         return self.__dict__
 
-    def to_json(self) -> str:
+    def to_json(self) -> bytes:
         """ Convert event to JSON """
-        return json.dumps(self.to_dict())
+        return dumps(self.__dict__)
 
 
-class EventStore:
-    """ A store of alarm events """
+class BaseEventStore:
+    """
+    Key layout shared by the sync and async event stores.
 
-    def __init__(self, db: DataStore) -> None:
-        self._namespace = "event"
-        self._db = db
+    Events from each panel account live in their own namespace. Without an account, the default one is used.
+    Account namespaces are hash-tagged with the account number, so that all keys of an account are kept on
+    the same Redis node (or cluster slot).
+
+    Besides the events themselves, each namespace has a sorted set of event UIDs by timestamp,
+    used for listing events in order and for time range queries. Events stored before the index existed are
+    indexed once, the first time events are listed, which is recorded in a marker key.
+
+    Decoded events can be kept in an EventCache. Deleting an event is announced to all processes,
+    so that they drop it from their caches.
+
+    Panels retransmit reports when they miss the kissoff tone, each time with a new UID. With a dedup window,
+    the timestamp of the last event with given contents is kept in a key that expires with the window, and
+    events arriving within the window are counted as duplicates instead of stored.
+    """
+
+    def __init__(self, account: Optional[int] = None, cache: EventCache = None, dedup_window: int = 0) -> None:
+        self.account = account
+        self._cache = cache
+        self._dedup_window = dedup_window
+        self._namespace = "event" if account is None else f"account:{{{account}}}:event"
+        self.index_key = f"{self._namespace}_index"
+        self.index_built_key = f"{self._namespace}_index_built"
+        # Whether the marker was seen already, to skip looking it up again
+        self._index_built = False
+        self.duplicates_key = f"{self._namespace}_duplicates"
 
-    def add(self, event: AlarmEvent) -> None:
-        """ Add an event """
+    def dedup_key(self, event: AlarmEvent) -> str:
+        """ Return the key identifying retransmissions of an event """
 
-        if self._db.get(self.obj_key(event.uid)):
+        return (
+            f"{self._namespace}_dedup:{event.account}:{event.code}:{event.qualifier}:"
+            f"{event.sensor}:{event.user}:{event.partition}"
+        )
+
+    def _add_keys(self, event: AlarmEvent) -> List[str]:
+        """ Keys of ADD_SCRIPT for an event, with its dedup key if deduplicating """
+
+        keys = [self.obj_key(event.uid), self.index_key]
+        return keys + [self.dedup_key(event)] if self._dedup_window else keys
+
+    def _add_args(self, event: AlarmEvent) -> List[Any]:
+        """ Arguments of ADD_SCRIPT for an event """
+
+        return [event.to_json(), event.uid, event.timestamp, self._dedup_window]
+
+    @staticmethod
+    def _check_added(event: AlarmEvent, result: int) -> bool:
+        """ Turn an ADD_SCRIPT result into whether the event was stored, raising if it existed already """
+
+        if result == ADD_EXISTS:
             raise ValueError(f"Event with uid {event.uid} already exists")
+        return result == ADD_STORED
+
+    def obj_key(self, uid: str) -> str:
+        """ Return the key string used to store and retrieve event objects """
+
+        return f"{self._namespace}:{uid}"
+
+    def keys_pattern(self) -> str:
+        """ Return the pattern matching all keys in our namespace """
+
+        return f"{self._namespace}:*"
+
+    @staticmethod
+    def _decode_events(values: List[Optional[str]]) -> List[AlarmEvent]:
+        """ Decode stored events, skipping the ones removed since they were looked up """
+
+        return [AlarmEvent.from_trusted(loads(v)) for v in values if v]
+
+    def _from_cache(self, keys: List[str]) -> Tuple[List[Optional[AlarmEvent]], List[int], int]:
+        """
+        Look events up in the cache. Returns the events found, the positions of the ones that were not, and the
+        invalidation count of the cache, to be given to _merge
+        """
+
+        if self._cache is None:
+            return [None] * len(keys), list(range(len(keys))), 0
+
+        invalidations = self._cache.invalidations
+        events = [self._cache.get(k) for k in keys]
+        return events, [i for i, e in enumerate(events) if e is None], invalidations
+
+    def _merge(
+        self,
+        keys: List[str],
+        events: List[Optional[AlarmEvent]],
+        missing: List[int],
+        values: List[Optional[str]],
+        invalidations: int,
+    ) -> List[AlarmEvent]:
+        """ Decode the values of events not found in the cache, and merge them with the ones that were """
+
+        for i, value in zip(missing, values):
+            if value:
+                event = AlarmEvent.from_trusted(loads(value))
+                events[i] = event
+                if self._cache is not None:
+                    # Events deleted while they were being read are not cached
+                    self._cache.put(keys[i], event, invalidations)
+        return [e for e in events if e is not None]
+
+
+class EventStore(BaseEventStore):
+    """ A store of alarm events """
+
+    def __init__(self, db: DataStore, account: Optional[int] = None, cache: EventCache = None) -> None:
+        super().__init__(
+            account=account, cache=cache, dedup_window=db.cfg.getint("events", "dedup_window", fallback=0)
+        )
+        self._db = db
+
+    def add(self, event: AlarmEvent) -> bool:
+        """ Add an event. Returns False if it's a retransmission of one already stored, and was skipped """
 
         logger.debug("Adding AlarmEvent %s to store", event.uid)
-        self._db.add(self.obj_key(event.uid), event.to_json())
+        keys = self._add_keys(event)
+        if self._db.colocated(keys):
+            result = self._db.run_script(ADD_SCRIPT, keys, self._add_args(event))
+        else:
+            result = self._add_apart(event, keys)
+
+        if result == ADD_DUPLICATE:
+            logger.info("Skipping AlarmEvent %s, a retransmission of an event already stored", event.uid)
+            self._db.increment(self.duplicates_key)
+        return self._check_added(event, result)
+
+    def _add_apart(self, event: AlarmEvent, keys: List[str]) -> int:
+        """ Add an event whose keys are on different nodes, a step at a time. Returns an ADD_SCRIPT result """
+
+        if self._db.get(keys[0]):
+            return ADD_EXISTS
+        if len(keys) > 2 and self._db.run_script(DEDUP_SCRIPT, keys[2:], [event.timestamp, self._dedup_window]):
+            return ADD_DUPLICATE
+
+        try:
+            # Index first, so that a failed write leaves no unindexed event behind, and can simply be retried
+            self._db.add_to_index(keys[1], event.uid, event.timestamp)
+            return ADD_STORED if self._db.add_new(keys[0], event.to_json()) else ADD_EXISTS
+        except Exception:
+            if len(keys) > 2:
+                # Otherwise, the retry would be skipped as a retransmission of an event that was never stored
+                self._db.delete(keys[2])
+            raise
+
+    def duplicate_count(self) -> int:
+        """ Get the number of retransmitted events that were skipped """
+
+        return int(self._db.get(self.duplicates_key) or 0)
+
+    def add_many(self, events: List[AlarmEvent]) -> int:
+        """
+        Add several events in bulk, skipping the ones already in store. Returns the number of events added.
+        Meant for restoring archives, so events are stored as they are, without deduplication.
+        """
+
+        keys = [self.obj_key(e.uid) for e in events]
+        if all(self._db.colocated([k, self.index_key]) for k in keys):
+            calls = [([k, self.index_key], self._add_args(e)) for k, e in zip(keys, events)]
+            return sum(self._db.run_script_many(ADD_SCRIPT, calls))
+
+        # Index first, so that a failed write leaves no unindexed events behind
+        existing = self._db.get_many(keys)
+        self._db.add_many_to_index(self.index_key, {e.uid: e.timestamp for e, v in zip(events, existing) if not v})
+        return sum(self._db.add_many([(k, e.to_json()) for k, e in zip(keys, events)], only_new=True))
 
     def delete(self, uid: str) -> None:
         """ Delete an event given its UID """
 
         logger.debug("Deleting event %s", uid)
-        self._db.delete(self.obj_key(uid))
+        key = self.obj_key(uid)
+        self._db.delete(key)
+        self._db.remove_from_index(self.index_key, uid)
+        self._db.publish(INVALIDATION_CHANNEL, key)
+        if self._cache is not None:
+            self._cache.invalidate(key)
 
     def get(self, uid: str) -> Optional[AlarmEvent]:
         """ Get AlarmEvent by UID """
 
         logger.debug("Getting event %s from store", uid)
 
-        j_str = self._db.get(self.obj_key(uid))
-        if not j_str:
-            return None
-
-        obj_data = json.loads(j_str)
-        return AlarmEvent(**obj_data)
+        key = self.obj_key(uid)
+        events, missing, invalidations = self._from_cache([key])
+        if missing:
+            return next(iter(self._merge([key], events, missing, [self._db.get(key)], invalidations)), None)
+        return events[0]
 
     def get_all_keys(self) -> List[str]:
         """ Get all keys in our namespace """
 
         logger.debug("Retrieving all %s keys from store", self._namespace)
-        return self._db.get_all_keys(f"{self._namespace}*")
+        return self._db.get_all_keys(self.keys_pattern())
+
+    def reindex(self) -> int:
+        """ Rebuild the timestamp index from the stored events. Returns the number of events indexed """
+
+        logger.info("Rebuilding index %s", self.index_key)
+        keys = self.get_all_keys()
+        events = self._decode_events(self._db.get_many(keys))
+        for event in events:
+            self._db.add_to_index(self.index_key, event.uid, event.timestamp)
+        self._db.add(self.index_built_key, "1")
+        self._index_built = True
+        return len(events)
+
+    def _ensure_index(self) -> None:
+        """ Index events stored before the index existed, once per namespace """
+
+        if self._index_built:
+            return
+        if self._db.exists(self.index_built_key):
+            self._index_built = True
+        else:
+            self.reindex()
 
-    def obj_key(self, uid: str) -> str:
-        """ Return the key string used to store and retrieve event objects """
+    def get_events(self, start: int = None, end: int = None) -> List[AlarmEvent]:
+        """ Get all events in store, in chronological order, optionally within [start, end] (seconds from epoch) """
 
-        return f"{self._namespace}:{uid}"
+        logger.debug("Retrieving all events from store")
 
-    def get_events(self) -> List[AlarmEvent]:
-        """ Get all events in store, in chronological order """
+        self._ensure_index()
 
-        logger.debug("Retrieving all events from store")
-        res = []
-        for key in self.get_all_keys():
-            obj_data = json.loads(self._db.get(key))
-            res.append(AlarmEvent(**obj_data))
+        uids = self._db.range_from_index(self.index_key, start=start, end=end)
+        return self._get_many([self.obj_key(uid) for uid in uids])
 
-        return sorted(res, key=lambda x: x.timestamp)
+    def iter_event_chunks(
+        self, start: int = None, end: int = None, chunk_size: int = INDEX_CHUNK_SIZE
+    ) -> Iterator[List[AlarmEvent]]:
+        """
+        Iterate over events in chronological order, optionally within [start, end], a chunk at a time.
+        Unlike get_events, only one chunk is held in memory, no matter how many events are in store.
+        """
+
+        self._ensure_index()
+
+        for uids in self._db.iter_index(self.index_key, start=start, end=end, chunk_size=chunk_size):
+            yield self._get_many([self.obj_key(uid) for uid in uids])
+
+    def _get_many(self, keys: List[str]) -> List[AlarmEvent]:
+        """ Get events by key, from the cache when possible """
+
+        events, missing, invalidations = self._from_cache(keys)
+        values = self._db.get_many([keys[i] for i in missing]) if missing else []
+        return self._merge(keys, events, missing, values, invalidations)
 
-    def events_as_json(self) -> str:
+    def events_as_json(self) -> bytes:
         """ Get all events as a list, in JSON format """
 
         logger.debug("Retrieving all events, in JSON format")
-        return json.dumps([e.to_dict() for e in self.get_events()])
+        return dumps([e.__dict__ for e in self.get_events()])
 
 
-class EventParser:
-    """
-    Parse Asterisk's AlarmReceiver events
-    """
+class AsyncEventStore(BaseEventStore):
+    """ A store of alarm events, backed by a non-blocking data store """
 
-    def __init__(
-        self,
-        config: ConfigParser = None,
-        src_dir: Path = None,
-        dst_dir: Path = None,
-        move_files: bool = True,
-    ) -> None:
+    def __init__(self, db: AsyncDataStore, account: Optional[int] = None, cache: EventCache = None) -> None:
+        super().__init__(
+            account=account, cache=cache, dedup_window=db.cfg.getint("events", "dedup_window", fallback=0)
+        )
+        self._db = db
+
+    async def add(self, event: AlarmEvent) -> bool:
+        """ Add an event. Returns False if it's a retransmission of one already stored, and was skipped """
 
-        self.cfg = config or ConfigLoader().config
-        self.src_dir = src_dir or Path(self.cfg.get("events", "src_dir"))
-        self.dst_dir = dst_dir or Path(self.cfg.get("events", "dst_dir"))
+        logger.debug("Adding AlarmEvent %s to store", event.uid)
+        keys = self._add_keys(event)
+        if self._db.colocated(keys):
+            result = await self._db.run_script(ADD_SCRIPT, keys, self._add_args(event))
+        else:
+            result = await self._add_apart(event, keys)
+
+        if result == ADD_DUPLICATE:
+            logger.info("Skipping AlarmEvent %s, a retransmission of an event already stored", event.uid)
+            await self._db.increment(self.duplicates_key)
+        return self._check_added(event, result)
+
+    async def _add_apart(self, event: AlarmEvent, keys: List[str]) -> int:
+        """ Add an event whose keys are on different nodes, a step at a time. Returns an ADD_SCRIPT result """
+
+        if await self._db.get(keys[0]):
+            return ADD_EXISTS
+        if len(keys) > 2 and await self._db.run_script(
+            DEDUP_SCRIPT, keys[2:], [event.timestamp, self._dedup_window]
+        ):
+            return ADD_DUPLICATE
+
+        try:
+            # Index first, so that a failed write leaves no unindexed event behind, and can simply be retried
+            await self._db.add_to_index(keys[1], event.uid, event.timestamp)
+            return ADD_STORED if await self._db.add_new(keys[0], event.to_json()) else ADD_EXISTS
+        except Exception:
+            if len(keys) > 2:
+                # Otherwise, the retry would be skipped as a retransmission of an event that was never stored
+                await self._db.delete(keys[2])
+            raise
+
+    async def duplicate_count(self) -> int:
+        """ Get the number of retransmitted events that were skipped """
+
+        return int(await self._db.get(self.duplicates_key) or 0)
+
+    async def delete(self, uid: str) -> None:
+        """ Delete an event given its UID """
 
-        for p in (self.src_dir, self.dst_dir):
-            if not p.is_dir():
-                raise RuntimeError(f"Required directory {p} does not exist")
+        logger.debug("Deleting event %s", uid)
+        key = self.obj_key(uid)
+        await self._db.delete(key)
+        await self._db.remove_from_index(self.index_key, uid)
+        await self._db.publish(INVALIDATION_CHANNEL, key)
+        if self._cache is not None:
+            self._cache.invalidate(key)
+
+    async def get(self, uid: str) -> Optional[AlarmEvent]:
+        """ Get AlarmEvent by UID """
 
-        self.move_files = move_files
+        logger.debug("Getting event %s from store", uid)
 
-    def parse_file(self, path: Path) -> Optional[Dict[str, Any]]:
-        """
-        Parse an event file
-        See: https://www.voip-info.org/asterisk-cmd-alarmreceiver/
+        key = self.obj_key(uid)
+        events, missing, invalidations = self._from_cache([key])
+        if missing:
+            return next(iter(self._merge([key], events, missing, [await self._db.get(key)], invalidations)), None)
+        return events[0]
+
+    async def reindex(self) -> int:
+        """ Rebuild the timestamp index from the stored events. Returns the number of events indexed """
+
+        logger.info("Rebuilding index %s", self.index_key)
+        keys = await self._db.get_all_keys(self.keys_pattern())
+        events = self._decode_events(await self._db.get_many(keys))
+        for event in events:
+            await self._db.add_to_index(self.index_key, event.uid, event.timestamp)
+        await self._db.add(self.index_built_key, "1")
+        self._index_built = True
+        return len(events)
+
+    async def _ensure_index(self) -> None:
+        """ Index events stored before the index existed, once per namespace """
+
+        if self._index_built:
+            return
+        if await self._db.exists(self.index_built_key):
+            self._index_built = True
+        else:
+            await self.reindex()
 
-        Notice that this code expects Asterisk's EventHandler config to be set with:
-            logindividualevents = yes
-        """
+    async def get_events(self, start: int = None, end: int = None) -> List[AlarmEvent]:
+        """ Get all events in store, in chronological order, optionally within [start, end] (seconds from epoch) """
 
-        logger.debug("Parsing event file at %s", path)
-        with path.open("r") as f:
-            for line in f:
-                line = line.strip()
-
-                # Verify Protocol
-                proto_match = re.match(r"PROTOCOL=(.*)$", line)
-                if proto_match:
-                    proto_value = proto_match.group(1)
-                    if proto_value != "ADEMCO_CONTACT_ID":
-                        logger.warning("Invalid protocol. Skipping file {p}")
-                        break
-
-                uid = self._get_uid_from_filename(path.name)
-
-                # Get caller extension
-                x_match = re.match(r"CALLINGFROM=(.*)$", line)
-                if x_match:
-                    extension = x_match.group(1)
-
-                # Get Timestamp
-                t_match = re.match(r"TIMESTAMP=(.*)$", line)
-                if t_match:
-                    timestamp_str = t_match.group(1)
-                    timestamp = self._parse_timestamp_str(timestamp_str)
-
-                # Get event info
-                fields = re.findall(r"^(\d{4})(\d{2})(\d)(\d{3})(\d{2})(\d{3})(\d)", line)
-                if fields:
-                    logger.debug("Event line found: %s", line)
-
-                    account, msg_type, qualifier, code, partition, sensor_or_user, checksum = fields[0]
-
-                    event_data = {
-                        "uid": uid,
-                        "timestamp": timestamp,
-                        "account": account,
-                        "msg_type": msg_type,
-                        "qualifier": qualifier,
-                        "code": int(code),
-                        "code_description": CODES[code]["name"],
-                        "category": self._get_event_category(int(code)),
-                        "partition": partition,
-                        "checksum": checksum,
-                        "extension": extension,
-                    }
-
-                    self._set_sensor_or_user(event_data, int(sensor_or_user))
-
-                    logger.debug("Event data: %s", event_data)
-                    return event_data
-
-        logger.warning("No events found in file %s", path)
-        return None
-
-    def move_file(self, src: Path) -> None:
-        """ Move event file to processed folder """
-
-        dst = self.dst_dir / src.name
-        logger.debug("Moving file %s to %s", src, dst)
-        src.rename(dst)
-
-    def process_files(self) -> List[Dict[str, Any]]:
-        """
-        Parse all event files available in spool directory.
-        Move each parsed file to another directory
-        """
-        results = []
-        for file in self.src_dir.glob("event-*"):
-            if file.is_file():
-                event_data = self.parse_file(file)
-                if event_data:
-                    results.append(event_data)
-                if self.move_files:
-                    self.move_file(file)
-        return results
+        logger.debug("Retrieving all events from store")
 
-    @staticmethod
-    def _get_uid_from_filename(filename: str) -> str:
-        """ Extract unique ID from filename """
+        await self._ensure_index()
 
-        # e.g. event-1IkVo1 -> 1IkVo1
-        return filename.replace("event-", "")
+        uids = await self._db.range_from_index(self.index_key, start=start, end=end)
+        return await self._get_many([self.obj_key(uid) for uid in uids])
 
-    @staticmethod
-    def _parse_timestamp_str(timestamp: str) -> int:
-        """ Convert the string timestamp coming from Asterisk into seconds from epoch"""
-        # e.g
-        # Sat Dec 26, 2020 @ 16:16:29 UTC => datetime.datetime(2020, 12, 26, 16, 16, 29)
-        return int(datetime.datetime.strptime(timestamp, "%a %b %d, %Y @ %H:%M:%S %Z").timestamp())
-
-    def _set_sensor_or_user(self, event_data: Dict, sensor_or_user: int) -> None:
-        """ Set either sensor or user fields """
-
-        # The Ademco standard reuses the 6th field for either sensor or user identification.
-        # We look at what each code data type is and set the fields accordingly
-        code = str(event_data["code"])
-        data_type = CODES[code]["type"]
-        if data_type == "zone":
-            event_data["sensor"] = sensor_or_user
-            # If there are configured sensor names, include the name
-            try:
-                event_data["sensor_name"] = self.cfg.get("sensors", str(sensor_or_user))
-            except (KeyError, configparser.NoOptionError):
-                logger.debug("Sensor %s not found in config", str(sensor_or_user))
-                event_data["sensor_name"] = None
-            event_data["user"] = None
-        elif data_type == "user":
-            event_data["user"] = sensor_or_user
-            event_data["sensor"] = None
-            event_data["sensor_name"] = None
-        else:
-            raise ValueError(f"Invalid data type {data_type}")
+    async def iter_event_chunks(
+        self, start: int = None, end: int = None, chunk_size: int = INDEX_CHUNK_SIZE
+    ) -> AsyncIterator[List[AlarmEvent]]:
+        """ Iterate over events in chronological order, optionally within [start, end], a chunk at a time """
 
-    @staticmethod
-    def _get_event_category(code: int) -> str:
-        """ Given a code number, get the ADEMCO category description """
-
-        bases = [int(s) for s in sorted(EVENT_CATEGORIES)]
-        last_base = None
-        for b in bases:
-            if code >= b:
-                last_base = b
-            elif code < b:
-                break
-        return EVENT_CATEGORIES[str(last_base)]
+        await self._ensure_index()
+
+        async for uids in self._db.iter_index(self.index_key, start=start, end=end, chunk_size=chunk_size):
+            yield await self._get_many([self.obj_key(uid) for uid in uids])
+
+    async def _get_many(self, keys: List[str]) -> List[AlarmEvent]:
+        """ Get events by key, from the cache when possible """
+
+        events, missing, invalidations = self._from_cache(keys)
+        values = await self._db.get_many([keys[i] for i in missing]) if missing else []
+        return self._merge(keys, events, missing, values, invalidations)
+
+    async def events_as_json(self) -> bytes:
+        """ Get all events as a list, in JSON format """
+
+        logger.debug("Retrieving all events, in JSON format")
+        return dumps([e.__dict__ for e in await self.get_events()])
@@ -0,0 +1,120 @@
+"""
+Export events in bulk, as NDJSON, CSV or Parquet.
+
+Events are encoded one chunk at a time, as they are read from the store, so the memory
+needed does not grow with the number of events exported.
+"""
+import csv
+import io
+import logging
+from pathlib import Path
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Type, Union
+
+from simon_says.events import AlarmEvent
+from simon_says.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+# Column order for tabular formats. Taken from the annotations rather than pydantic's field info, which
+# differs between pydantic versions
+EXPORT_FIELDS = list(AlarmEvent.__annotations__)
+
+
+def _is_int(annotation: Any) -> bool:
+    """ Whether a field annotation is int, or Optional[int] """
+
+    return annotation is int or int in getattr(annotation, "__args__", ())
+
+
+class NDJSONEncoder:
+    """ Encode events as newline-delimited JSON, one event per line """
+
+    content_type = "application/x-ndjson"
+
+    def header(self) -> bytes:
+        return b""
+
+    def encode(self, events: List[AlarmEvent]) -> bytes:
+        return b"".join(dumps(e.__dict__) + b"\n" for e in events)
+
+
+class CSVEncoder:
+    """ Encode events as CSV rows, with a header row """
+
+    content_type = "text/csv"
+
+    def __init__(self) -> None:
+        self._buffer = io.StringIO()
+        self._writer = csv.DictWriter(self._buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+
+    def _flush(self) -> bytes:
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data.encode()
+
+    def header(self) -> bytes:
+        self._writer.writeheader()
+        return self._flush()
+
+    def encode(self, events: List[AlarmEvent]) -> bytes:
+        self._writer.writerows(e.__dict__ for e in events)
+        return self._flush()
+
+
+# Formats that can be streamed, e.g. in an HTTP response
+STREAM_ENCODERS: Dict[str, Type[Union[NDJSONEncoder, CSVEncoder]]] = {
+    "ndjson": NDJSONEncoder,
+    "csv": CSVEncoder,
+}
+
+EXPORT_FORMATS = list(STREAM_ENCODERS) + ["parquet"]
+
+
+def encode_chunks(fmt: str, chunks: Iterable[List[AlarmEvent]]) -> Iterator[bytes]:
+    """ Encode chunks of events in the given streaming format """
+
+    encoder = STREAM_ENCODERS[fmt]()
+    header = encoder.header()
+    if header:
+        yield header
+    for events in chunks:
+        yield encoder.encode(events)
+
+
+async def encode_chunks_async(fmt: str, chunks: AsyncIterable[List[AlarmEvent]]) -> AsyncIterator[bytes]:
+    """ Encode chunks of events in the given streaming format, from an asynchronous source """
+
+    encoder = STREAM_ENCODERS[fmt]()
+    header = encoder.header()
+    if header:
+        yield header
+    async for events in chunks:
+        yield encoder.encode(events)
+
+
+def write_parquet(chunks: Iterable[List[AlarmEvent]], path: Path) -> int:
+    """ Write chunks of events to a Parquet file, one row group per chunk. Returns the number of events written """
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install simon_says[parquet])")
+
+    schema = pa.schema(
+        [
+            (name, pa.int64() if _is_int(annotation) else pa.string())
+            for name, annotation in AlarmEvent.__annotations__.items()
+        ]
+    )
+
+    count = 0
+    with pq.ParquetWriter(str(path), schema) as writer:
+        for events in chunks:
+            if events:
+                writer.write_table(pa.Table.from_pylist([e.__dict__ for e in events], schema=schema))
+                count += len(events)
+
+    logger.info("Wrote %s events to %s", count, path)
+    return count
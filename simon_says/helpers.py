@@ -1,9 +1,7 @@
 import socket
 from contextlib import closing
 
-from simon_says.config import ConfigLoader
-
-config = ConfigLoader().config
+from simon_says.config import get_config
 
 
 def port_open(host, port) -> bool:
@@ -20,4 +18,5 @@ def port_open(host, port) -> bool:
 
 def redis_present() -> bool:
     """ Check if Redis service is present """
+    config = get_config()
     return port_open(config.get("data_store", "redis_host"), int(config.get("data_store", "redis_port")))
@@ -0,0 +1,94 @@
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from simon_says.db import AsyncDataStore, DataStore
+from simon_says.sensors import SensorState
+
+logger = logging.getLogger(__name__)
+
+Transition = Tuple[int, SensorState]
+
+
+class BaseSensorHistory:
+    """
+    Key layout shared by the sync and async sensor histories.
+
+    Each sensor has a sorted set of its state transitions, scored by timestamp, so that the state at
+    any point in time is a single reverse range lookup. Members are "<timestamp>:<arrival>:<state>"
+    strings, where arrival is the zero-padded time.time_ns() of the write: members with the same score
+    sort lexicographically, so transitions within the same second are ordered by when they were recorded
+    rather than by state name. Members written before the arrival field was added ("<timestamp>:<state>")
+    are still read. Like events, each panel account has its own hash-tagged namespace.
+    """
+
+    def __init__(self, account: Optional[int] = None) -> None:
+        self.account = account
+        self._namespace = "sensor_history" if account is None else f"account:{{{account}}}:sensor_history"
+
+    def key(self, number: int) -> str:
+        """ Return the key of the transitions of a sensor """
+
+        return f"{self._namespace}:{number}"
+
+    @staticmethod
+    def _member(timestamp: int, state: SensorState) -> str:
+        return f"{timestamp}:{time.time_ns():020d}:{state.value}"
+
+    @staticmethod
+    def _parse_member(member: str) -> Transition:
+        timestamp, _, rest = member.partition(":")
+        return int(timestamp), SensorState(rest.rpartition(":")[2])
+
+    def _entries(self, numbers: Iterable[int], state: SensorState, timestamp: int) -> List[Tuple[str, str, float]]:
+        return [(self.key(n), self._member(timestamp, state), timestamp) for n in numbers]
+
+    def _states(self, numbers: List[int], members: List[Optional[str]]) -> Dict[int, Optional[SensorState]]:
+        return {n: self._parse_member(m)[1] if m else None for n, m in zip(numbers, members)}
+
+
+class SensorHistory(BaseSensorHistory):
+    """ A log of sensor state transitions """
+
+    def __init__(self, db: DataStore, account: Optional[int] = None) -> None:
+        super().__init__(account=account)
+        self._db = db
+
+    def record(self, numbers: Iterable[int], state: SensorState, timestamp: int) -> None:
+        """ Record that sensors changed to the given state at the given time """
+
+        self._db.add_to_indexes(self._entries(numbers, state, timestamp))
+
+    def states_at(self, numbers: List[int], at: int = None) -> Dict[int, Optional[SensorState]]:
+        """ Get the state of sensors at a point in time (now by default). None for sensors with no history """
+
+        return self._states(numbers, self._db.last_from_indexes([self.key(n) for n in numbers], end=at))
+
+    def transitions(self, number: int, start: int = None, end: int = None) -> List[Transition]:
+        """ Get the state transitions of a sensor within [start, end], in chronological order """
+
+        return [self._parse_member(m) for m in self._db.range_from_index(self.key(number), start=start, end=end)]
+
+
+class AsyncSensorHistory(BaseSensorHistory):
+    """ A log of sensor state transitions, backed by a non-blocking data store """
+
+    def __init__(self, db: AsyncDataStore, account: Optional[int] = None) -> None:
+        super().__init__(account=account)
+        self._db = db
+
+    async def record(self, numbers: Iterable[int], state: SensorState, timestamp: int) -> None:
+        """ Record that sensors changed to the given state at the given time """
+
+        await self._db.add_to_indexes(self._entries(numbers, state, timestamp))
+
+    async def states_at(self, numbers: List[int], at: int = None) -> Dict[int, Optional[SensorState]]:
+        """ Get the state of sensors at a point in time (now by default). None for sensors with no history """
+
+        return self._states(numbers, await self._db.last_from_indexes([self.key(n) for n in numbers], end=at))
+
+    async def transitions(self, number: int, start: int = None, end: int = None) -> List[Transition]:
+        """ Get the state transitions of a sensor within [start, end], in chronological order """
+
+        members = await self._db.range_from_index(self.key(number), start=start, end=end)
+        return [self._parse_member(m) for m in members]
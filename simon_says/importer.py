@@ -0,0 +1,214 @@
+"""
+Bulk import of historical event files (e.g. years of alarm_events_processed) into the event store.
+"""
+import json
+import logging
+import mmap
+import os
+import tarfile
+import time
+from configparser import ConfigParser
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from simon_says.archive import is_segment, iter_segment
+from simon_says.config import get_config
+from simon_says.db import DataStore
+from simon_says.events import AlarmEvent, EventStore
+from simon_says.panels import configured_accounts
+from simon_says.parser import EventParser
+from simon_says.spool import EVENT_FILE_PREFIX, iter_entries
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def read_file(path: Path) -> bytes:
+    """ Read a file through a memory map, which skips a copy through Python's file buffers """
+
+    with path.open("rb") as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                return m[:]
+        except ValueError:
+            # Empty files can't be mapped
+            return b""
+
+
+def iter_directory(source: Path, shard_depth: int = 0, skip: int = 0) -> Iterator[Tuple[str, bytes]]:
+    """
+    Yield (name, contents) for all event files in a directory, and its shards, in a stable order.
+    The first skip files are left out without being read
+    """
+
+    paths = sorted((e.name, e.path) for e in iter_entries(source, shard_depth))
+    for name, path in paths[skip:]:
+        yield name, read_file(Path(path))
+
+
+def iter_tarball(source: Path, skip: int = 0) -> Iterator[Tuple[str, bytes]]:
+    """
+    Yield (name, contents) for all event files in a (possibly compressed) tarball, in archive order.
+    The first skip files are left out without being extracted
+    """
+
+    with tarfile.open(source, "r:*") as tar:
+        for member in tar:
+            name = os.path.basename(member.name)
+            if member.isfile() and name.startswith(EVENT_FILE_PREFIX):
+                if skip:
+                    skip -= 1
+                    continue
+                f = tar.extractfile(member)
+                if f is not None:
+                    yield name, f.read()
+
+
+class ImportState:
+    """
+    Progress of an import, persisted to a state file after every batch so that an interrupted
+    import can be resumed where it left off.
+    """
+
+    def __init__(self, path: Optional[Path], source: Path) -> None:
+        self.path = path
+        self.source = str(source)
+        self.processed = 0
+        self.imported = 0
+        self.rejected = 0
+
+        if path and path.is_file():
+            data = json.loads(path.read_text())
+            if data["source"] != self.source:
+                raise ValueError(f"State file {path} belongs to an import of {data['source']}")
+            self.processed = data["processed"]
+            self.imported = data["imported"]
+            self.rejected = data["rejected"]
+
+    def save(self) -> None:
+        """ Atomically write state to file """
+
+        if not self.path:
+            return
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "source": self.source,
+                    "processed": self.processed,
+                    "imported": self.imported,
+                    "rejected": self.rejected,
+                }
+            )
+        )
+        tmp.replace(self.path)
+
+
+class EventImporter:
+    """
+    Import event files into the event store in large batches.
+
+    Files are parsed with the same EventParser used by the event handler, validated, routed to their
+    panel's namespace by account, and written with pipelined bulk inserts, along with the timestamp index.
+    Events already in the store are skipped, so an import can safely be re-run.
+    """
+
+    def __init__(
+        self,
+        config: ConfigParser = None,
+        db: DataStore = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        state_file: Path = None,
+    ) -> None:
+        self.cfg = config or get_config()
+        self.db = db or DataStore(config=self.cfg)
+        self.batch_size = batch_size
+        self.state_file = state_file
+
+        self._accounts = set(configured_accounts(self.cfg))
+        self._stores: Dict[Optional[int], EventStore] = {}
+
+    def _store_for(self, account: int) -> EventStore:
+        """ Get the event store for the panel of the given account """
+
+        key = account if account in self._accounts else None
+        if key not in self._stores:
+            self._stores[key] = EventStore(db=self.db, account=key)
+        return self._stores[key]
+
+    def _write_batch(self, parser: EventParser, batch: List[Tuple[str, bytes]], state: ImportState) -> None:
+        """ Parse, validate and store a batch of files """
+
+        by_store: Dict[Optional[int], List[AlarmEvent]] = {}
+        for name, data in batch:
+            try:
+                event_data = parser.parse_bytes(name, data)
+                if not event_data:
+                    state.rejected += 1
+                    continue
+                event = AlarmEvent(**event_data)
+            except Exception as err:
+                logger.warning("Skipping event file %s: %s", name, err)
+                state.rejected += 1
+                continue
+
+            store = self._store_for(event.account)
+            by_store.setdefault(store.account, []).append(event)
+
+        for account, events in by_store.items():
+            state.imported += self._stores[account].add_many(events)
+        state.processed += len(batch)
+
+    def run(self, source: Path) -> ImportState:
+        """ Import all event files from a directory, an archive segment or a tarball """
+
+        state = ImportState(self.state_file, source)
+        if state.processed:
+            logger.info("Resuming import of %s after %s files", source, state.processed)
+
+        # Files handled by a previous run are skipped without reading them
+        if source.is_dir():
+            files = iter_directory(source, self.cfg.getint("events", "shard_depth", fallback=0), state.processed)
+            parser_dir = source
+        elif is_segment(source):
+            files = iter_segment(source, state.processed)
+            parser_dir = source.parent
+        elif tarfile.is_tarfile(source):
+            files = iter_tarball(source, state.processed)
+            parser_dir = source.parent
+        else:
+            raise ValueError(f"{source} is neither a directory, an archive segment nor a tarball")
+
+        # The parser is only used to parse contents here, it never moves files
+        parser = EventParser(config=self.cfg, src_dir=parser_dir, dst_dir=parser_dir, move_files=False)
+
+        started = time.monotonic()
+        batch: List[Tuple[str, bytes]] = []
+        for item in files:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._write_batch(parser, batch, state)
+                state.save()
+                self._report(state, started)
+                batch = []
+
+        if batch:
+            self._write_batch(parser, batch, state)
+            state.save()
+        self._report(state, started)
+
+        return state
+
+    @staticmethod
+    def _report(state: ImportState, started: float) -> None:
+        """ Log import progress """
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            "Processed %s files (%s imported, %s rejected) in %.1fs",
+            state.processed,
+            state.imported,
+            state.rejected,
+            elapsed,
+        )
@@ -0,0 +1,340 @@
+"""
+Synthetic load for end-to-end throughput testing.
+
+LoadGenerator writes AlarmReceiver event files into the spool directory at a target rate, just like Asterisk,
+and measures how long each event takes to make it through the event handler and the API into the event store.
+CallFileConsumer stands in for Asterisk on the other side, picking up the call files spooled for commands.
+
+Panels retransmit reports, so the event store skips events with the same contents as one received shortly
+before ([events] dedup_window). Generated events are kept apart by varying their partition and zone or user, and
+never repeat contents within the window, so that all of them are stored.
+
+The event handler and the API must be running against the same config, e.g.:
+
+    bin/simon_event_handler --monitor-files --interval 0.5 &
+    simon-says loadgen --rate 50 --duration 60 --consume-calls --command-rate 1 --access-code 1234
+"""
+import datetime
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from configparser import ConfigParser
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from simon_says.config import get_config
+from simon_says.db import DataStore
+from simon_says.events import EventStore
+from simon_says.panels import configured_accounts
+
+logger = logging.getLogger(__name__)
+
+# (qualifier, code, highest zone or user) of the events generated: openings and restores of perimeter
+# sensors, openings and closings by users, and test reports. Zones and users span all the numbers Contact ID
+# allows, and partitions all but 0, for events to have many different contents
+EVENT_MIX = [(1, 131, 999), (3, 131, 999), (1, 401, 999), (3, 401, 999), (1, 601, 0)]
+MAX_PARTITION = 99
+
+# Tries at finding contents not used within the dedup window, before settling for a duplicate
+MAX_CONTENT_TRIES = 100
+
+PERCENTILES = (50, 90, 99)
+
+# How often to look for generated events in the event store, and call files in the spool, in seconds
+POLL_INTERVAL = 0.05
+
+# Events are looked up in the event store this many at a time
+POLL_CHUNK_SIZE = 1000
+
+EVENT_FILE_TEMPLATE = """
+
+[metadata]
+
+PROTOCOL=ADEMCO_CONTACT_ID
+CHECKSUM=yes
+CALLINGFROM=loadgen
+CALLERNAME=Load Generator
+TIMESTAMP={timestamp}
+
+[events]
+
+{message}
+
+"""
+
+
+def contact_id_message(account: int, qualifier: int, code: int, partition: int, zone: int) -> str:
+    """
+    Build a Contact ID message, with its checksum digit.
+    Panels send checksums of 11 to 15 as hex digits, which AlarmReceiver files can't hold, so messages
+    that would need one are moved to the next zone.
+    """
+
+    while True:
+        body = f"{account:04d}18{qualifier}{code:03d}{partition:02d}{zone:03d}"
+        checksum = -sum(10 if d == "0" else int(d) for d in body) % 15 or 15
+        if checksum <= 10:
+            # 0 stands for 10
+            return body + str(checksum % 10)
+        zone = (zone + 1) % 1000
+
+
+def event_file_contents(message: str, timestamp: float) -> str:
+    """ Render an AlarmReceiver event file """
+
+    when = datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+    return EVENT_FILE_TEMPLATE.format(timestamp=when.strftime("%a %b %d, %Y @ %H:%M:%S UTC"), message=message)
+
+
+def percentiles(values: Sequence[float], points: Sequence[int] = PERCENTILES) -> Dict[str, float]:
+    """ Get nearest-rank percentiles, and the maximum, of some values """
+
+    if not values:
+        return {}
+
+    ordered = sorted(values)
+    res = {f"p{p}": ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))] for p in points}
+    res["max"] = ordered[-1]
+    return res
+
+
+def format_latencies(name: str, values: Sequence[float]) -> str:
+    """ Summarize latencies (in seconds) as milliseconds """
+
+    stats = percentiles(values)
+    summary = ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in stats.items())
+    return f"{name}: {len(values)} samples" + (f", {summary}" if summary else "")
+
+
+class LoadGenerator:
+    """ Write synthetic event files at a target rate, and time their arrival in the event store """
+
+    def __init__(
+        self,
+        config: ConfigParser = None,
+        db: DataStore = None,
+        spool_dir: Path = None,
+        account: int = 1234,
+        seed: int = None,
+    ) -> None:
+        self.cfg = config or get_config()
+        self.db = db or DataStore(config=self.cfg)
+        self.spool_dir = spool_dir or Path(self.cfg.get("events", "src_dir"))
+        self.account = account
+        self.event_store = EventStore(
+            db=self.db, account=account if account in configured_accounts(self.cfg) else None
+        )
+
+        self.written = 0
+        self.latencies: List[float] = []
+        self.dedup_window = self.cfg.getint("events", "dedup_window", fallback=0)
+        # When each message (without its checksum) was last written, within the dedup window, oldest first
+        self._recent: "OrderedDict[str, float]" = OrderedDict()
+        self._duplicates_before = self.event_store.duplicate_count()
+        # Written at, by uid
+        self._pending: Dict[str, float] = {}
+        self._random = random.Random(seed)
+        self._run_id = f"lg{int(time.time()):x}"
+
+    def _random_message(self) -> str:
+        qualifier, code, highest = self._random.choice(EVENT_MIX)
+        zone = self._random.randint(1, highest) if highest else 0
+        partition = self._random.randint(1, MAX_PARTITION)
+        return contact_id_message(self.account, qualifier, code, partition=partition, zone=zone)
+
+    def _unique_message(self, now: float) -> str:
+        """ Get a random message, with contents unlike the ones written within the dedup window """
+
+        if not self.dedup_window:
+            return self._random_message()
+
+        while self._recent and next(iter(self._recent.values())) <= now - self.dedup_window:
+            self._recent.popitem(last=False)
+        for _ in range(MAX_CONTENT_TRIES):
+            message = self._random_message()
+            if message[:-1] not in self._recent:
+                break
+        self._recent[message[:-1]] = now
+        self._recent.move_to_end(message[:-1])
+        return message
+
+    def write_event(self) -> str:
+        """ Write one synthetic event file, atomically, and start timing it. Returns its uid """
+
+        now = time.time()
+        message = self._unique_message(now)
+        uid = f"{self._run_id}x{self.written}"
+        tmp = self.spool_dir / f".loadgen-{uid}"
+        tmp.write_text(event_file_contents(message, now))
+        # Renaming makes the file appear complete, so that the handler never reads it half-written
+        os.rename(tmp, self.spool_dir / f"event-{uid}")
+
+        self._pending[uid] = now
+        self.written += 1
+        return uid
+
+    def poll(self) -> int:
+        """ Look for pending events in the event store, recording the latency of the ones found """
+
+        found = 0
+        now = time.time()
+        uids = list(self._pending)
+        for i in range(0, len(uids), POLL_CHUNK_SIZE):
+            chunk = uids[i : i + POLL_CHUNK_SIZE]  # noqa: E203
+            values = self.db.get_many([self.event_store.obj_key(uid) for uid in chunk])
+            for uid, value in zip(chunk, values):
+                if value is not None:
+                    self.latencies.append(now - self._pending.pop(uid))
+                    found += 1
+        return found
+
+    @property
+    def pending(self) -> int:
+        """ Number of events written but not stored yet """
+
+        return len(self._pending)
+
+    @property
+    def duplicates(self) -> int:
+        """ Number of events skipped by the event store as retransmissions, since the generator was created """
+
+        return self.event_store.duplicate_count() - self._duplicates_before
+
+    def run(self, rate: float, duration: float, timeout: float) -> None:
+        """
+        Write events at the given rate (per second) for the given duration (in seconds), then wait up to
+        timeout seconds for the rest of them to be stored
+        """
+
+        if rate <= 0:
+            raise ValueError(f"Invalid rate: {rate}")
+
+        logger.info("Writing %s events per second to %s for %ss", rate, self.spool_dir, duration)
+        started = time.monotonic()
+        last_poll = started
+        while True:
+            now = time.monotonic()
+            if now - started >= duration:
+                break
+
+            # Keep to the schedule even when writing falls behind, instead of drifting
+            due = int((now - started) * rate) + 1
+            while self.written < due:
+                self.write_event()
+
+            if now - last_poll >= POLL_INTERVAL:
+                self.poll()
+                last_poll = now
+            time.sleep(min(POLL_INTERVAL, max(0.0, started + self.written / rate - time.monotonic())))
+
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            self.poll()
+            time.sleep(POLL_INTERVAL)
+
+    def cleanup(self) -> None:
+        """ Delete the generated events from the event store """
+
+        uids = [f"{self._run_id}x{i}" for i in range(self.written)]
+        for i in range(0, len(uids), POLL_CHUNK_SIZE):
+            chunk = uids[i : i + POLL_CHUNK_SIZE]  # noqa: E203
+            values = self.db.get_many([self.event_store.obj_key(uid) for uid in chunk])
+            for uid, value in zip(chunk, values):
+                if value is not None:
+                    self.event_store.delete(uid)
+
+
+class CallFileConsumer:
+    """
+    Stand in for Asterisk on outgoing calls: pick up and remove the call files spooled by the Controller,
+    timing how long they waited in the spool
+    """
+
+    def __init__(self, spool_dir: Path) -> None:
+        self.spool_dir = spool_dir
+        self.latencies: List[float] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def consume(self) -> int:
+        """ Pick up all call files in the spool. Returns the number of files picked up """
+
+        count = 0
+        with os.scandir(self.spool_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".call") or not entry.is_file():
+                    continue
+                try:
+                    waited = time.time() - entry.stat().st_mtime
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    continue
+                self.latencies.append(waited)
+                count += 1
+        return count
+
+    def start(self) -> None:
+        """ Consume call files from a background thread """
+
+        def run() -> None:
+            while not self._stop.is_set():
+                self.consume()
+                self._stop.wait(POLL_INTERVAL)
+
+        self._thread = threading.Thread(target=run, name="call-file-consumer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """ Stop the background thread, picking up any call files left """
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.consume()
+
+
+class CommandSender:
+    """ Send disarm commands through the API at a target rate, timing the requests """
+
+    def __init__(self, url: str, access_code: str) -> None:
+        # Only needed when sending commands
+        from simon_says.client import Client
+
+        self.client = Client(url)
+        self.access_code = access_code
+        self.latencies: List[float] = []
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def send(self) -> None:
+        """ Send one command """
+
+        started = time.monotonic()
+        try:
+            self.client.disarm(access_code=self.access_code)
+        except Exception as err:
+            logger.warning("Error sending command: %s", err)
+            self.errors += 1
+            return
+        self.latencies.append(time.monotonic() - started)
+
+    def start(self, rate: float) -> None:
+        """ Send commands from a background thread """
+
+        def run() -> None:
+            while not self._stop.wait(1 / rate):
+                self.send()
+
+        self._thread = threading.Thread(target=run, name="command-sender", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """ Stop sending commands """
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
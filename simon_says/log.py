@@ -1,15 +1,95 @@
+"""
+Logging setup.
+
+Log records can be formatted as JSON, one object per line (SIMON_SAYS_LOG_FORMAT=json), and handed over to a
+background thread through a queue (queued=True, which the API apps use), so that formatting and writing them
+never holds up a request.
+
+Under load, INFO and DEBUG records of busy routes can also be sampled, per request, with the [log_sampling]
+config section, e.g.:
+
+    [log_sampling]
+    # <route> = <fraction of requests to log>, routes being named after the last part of their path
+    events = 0.01
+
+Warnings and errors are always logged.
+
+Debug calls on hot paths (e.g. storing an event, or parsing each line of an event file) pass their values as
+arguments, for the message to be formatted only if the record is emitted: with DEBUG disabled, a call costs a
+cached level check. Calls are only guarded with logger.isEnabledFor where building an argument costs more than
+that, which none of the current ones do.
+"""
+import atexit
+import datetime
+import json
 import logging
 import os
+import queue
+import random
 import sys
-from typing import List
+from configparser import ConfigParser
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional
 
 DEFAULT_LOGLEVEL = "INFO"
+LOG_SAMPLING_SECTION = "log_sampling"
+
+# Attributes every LogRecord has. Any other ones were passed with extra=..., and are added to JSON records
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# Whether the current request is being logged, when sampled
+_sampled: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+# The thread writing queued records, if any
+_listener: Optional[QueueListener] = None
+
+
+class JSONFormatter(logging.Formatter):
+    """ Format records as JSON objects """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "time": datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in data:
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
 
 
-def configure_logging(log_level: str = None, handlers: List[logging.Handler] = None) -> None:
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue records as they are, leaving all formatting to the listener thread.
+    QueueHandler formats records before queueing them, so they can be pickled to other processes, which a
+    queue between threads doesn't need.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class SampledOutFilter(logging.Filter):
+    """ Drop INFO and DEBUG records of requests that were not sampled for logging """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or _sampled.get()
+
+
+def configure_logging(
+    log_level: str = None, handlers: List[logging.Handler] = None, json_format: bool = None, queued: bool = False
+) -> None:
     """
     Configure logging
     """
+    global _listener
 
     # Get root logger
     root = logging.getLogger()
@@ -21,9 +101,84 @@ def configure_logging(log_level: str = None, handlers: List[logging.Handler] = N
         # Check if ENV log level is set, otherwise use default
         log_level = os.environ.get("SIMON_SAYS_LOGLEVEL") or DEFAULT_LOGLEVEL
         root.setLevel(log_level)
+
+    if json_format is None:
+        json_format = os.environ.get("SIMON_SAYS_LOG_FORMAT", "").lower() == "json"
+
+    if _listener is not None:
+        # Reconfiguring: write out what's queued, and hand the handlers back to the root logger
+        _listener.stop()
+        root.handlers = list(_listener.handlers)
+        _listener = None
+
     if handlers:
         # Use the handlers passed to this function
         root.handlers = handlers
     else:
         # Or use the default handler
         root.addHandler(logging.StreamHandler(sys.stdout))
+
+    if json_format:
+        for handler in root.handlers:
+            handler.setFormatter(JSONFormatter())
+
+    if queued:
+        q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        _listener = QueueListener(q, *root.handlers, respect_handler_level=True)
+        root.handlers = [DeferredQueueHandler(q)]
+        _listener.start()
+
+    for handler in root.handlers:
+        if not any(isinstance(f, SampledOutFilter) for f in handler.filters):
+            handler.addFilter(SampledOutFilter())
+
+
+def stop_logging() -> None:
+    """ Write out queued records, and stop the listener thread """
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        logging.getLogger().handlers = list(_listener.handlers)
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+class LogSampling:
+    """ Falcon middleware deciding, once per request, whether its INFO and DEBUG records are logged """
+
+    def __init__(self, config: ConfigParser) -> None:
+        self.rates: Dict[str, float] = {}
+        if config.has_section(LOG_SAMPLING_SECTION):
+            self.rates = {route: float(rate) for route, rate in config[LOG_SAMPLING_SECTION].items()}
+
+    def __bool__(self) -> bool:
+        return bool(self.rates)
+
+    def sampled(self, req) -> bool:
+        """ Decide whether to log a request """
+
+        if not req.uri_template:
+            return True
+        rate = self.rates.get(req.uri_template.rsplit("/", 1)[-1])
+        return rate is None or random.random() < rate
+
+    def process_resource(self, req, resp, resource, params):
+        req.context.log_sampled_token = _sampled.set(self.sampled(req))
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        token = req.context.get("log_sampled_token")
+        if token is not None:
+            _sampled.reset(token)
+
+
+class AsyncLogSampling(LogSampling):
+    """ Falcon ASGI middleware deciding, once per request, whether its INFO and DEBUG records are logged """
+
+    async def process_resource(self, req, resp, resource, params):  # type: ignore
+        super().process_resource(req, resp, resource, params)
+
+    async def process_response(self, req, resp, resource, req_succeeded):  # type: ignore
+        super().process_response(req, resp, resource, req_succeeded)
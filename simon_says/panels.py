@@ -0,0 +1,165 @@
+import logging
+from configparser import ConfigParser
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from simon_says.config import SENSORS_SECTION_PREFIX, get_config
+from simon_says.control import Controller
+from simon_says.sensors import Sensors
+
+logger = logging.getLogger(__name__)
+
+# Config section prefix for per-panel settings, e.g. [panel:1234]. Sensor names are in [sensors:1234]
+PANEL_SECTION_PREFIX = "panel:"
+
+
+def configured_accounts(config: ConfigParser) -> List[int]:
+    """ Get the accounts of all panels in the config """
+
+    return [int(s.partition(":")[2]) for s in config.sections() if s.startswith(PANEL_SECTION_PREFIX)]
+
+
+class Panel:
+    """
+    A single alarm panel, identified by its Contact ID account number.
+    The default panel has no account, and uses the [control] and [sensors] sections.
+    """
+
+    def __init__(
+        self,
+        account: Optional[int],
+        sensors: Sensors,
+        controller: Controller,
+        event_store: Any,
+        sensor_history: Any = None,
+    ) -> None:
+        self.account = account
+        self.sensors = sensors
+        self.controller = controller
+        self.event_store = event_store
+        self.sensor_history = sensor_history
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ Convert to Dict """
+        return {"account": self.account, "extension": self.controller.extension}
+
+
+class Panels:
+    """
+    A collection of Panel objects, keyed by account.
+
+    Panels are configured with a [panel:<account>] section, which can override any setting of the
+    [control] section (e.g. the SIP extension), and a [sensors:<account>] section with its sensor names.
+    Events from accounts without a panel section go to the default panel.
+    """
+
+    def __init__(
+        self,
+        event_store_factory: Callable[[Optional[int]], Any],
+        config: ConfigParser = None,
+        controller: Controller = None,
+        sensor_history_factory: Callable[[Optional[int]], Any] = None,
+    ) -> None:
+        self.cfg = config or get_config()
+        self._event_store_factory = event_store_factory
+        self._sensor_history_factory = sensor_history_factory
+        self._default_controller = controller
+        self._panels_by_account: Dict[int, Panel] = {}
+
+        self.default = self._build_default(event_store=event_store_factory(None))
+        self._load_from_config()
+
+    def add(self, panel: Panel) -> None:
+        """ Add a panel to the collection """
+
+        if panel.account is None or panel.account in self._panels_by_account:
+            raise ValueError(f"Invalid or duplicate panel account {panel.account}")
+
+        self._panels_by_account[panel.account] = panel
+
+    def by_account(self, account: int) -> Panel:
+        """ Get a configured panel given its account """
+        return self._panels_by_account[account]
+
+    def for_event_account(self, account: int) -> Panel:
+        """ Get the panel that handles events from the given account """
+        return self._panels_by_account.get(account, self.default)
+
+    def get_all_panels(self) -> List[Panel]:
+        """ Get all configured panels """
+
+        return list(self._panels_by_account.values())
+
+    def reload(self, config: ConfigParser) -> None:
+        """
+        Rebuild all panels from a new config, keeping their sensor states and event stores.
+        The new set of panels replaces the old one at once, so requests in progress are not affected.
+        """
+
+        logger.info("Reloading panels")
+        self.cfg = config
+
+        default = self._build_default(event_store=self.default.event_store)
+        default.sensors.copy_states(self.default.sensors)
+
+        panels_by_account = {}
+        for account in configured_accounts(config):
+            old = self._panels_by_account.get(account)
+            panel = self._build_panel(account, event_store=old.event_store if old else None)
+            if old:
+                panel.sensors.copy_states(old.sensors)
+            panels_by_account[account] = panel
+
+        self.default, self._panels_by_account = default, panels_by_account
+
+    def _build_default(self, event_store: Any) -> Panel:
+        """ Build the default panel, from the [control] and [sensors] sections """
+
+        return Panel(
+            account=None,
+            sensors=Sensors(config=self.cfg),
+            controller=self._default_controller or Controller(config=self.cfg),
+            event_store=event_store,
+            sensor_history=self._build_sensor_history(None),
+        )
+
+    def _build_panel(self, account: int, event_store: Any = None) -> Panel:
+        """ Build the panel for an account, from its [panel:<account>] and [sensors:<account>] sections """
+
+        return Panel(
+            account=account,
+            sensors=Sensors(config=self.cfg, section=f"{SENSORS_SECTION_PREFIX}{account}"),
+            controller=self._build_controller(account),
+            event_store=event_store or self._event_store_factory(account),
+            sensor_history=self._build_sensor_history(account),
+        )
+
+    def _build_sensor_history(self, account: Optional[int]) -> Any:
+        """ Build the sensor history of a panel, if the collection keeps one """
+
+        return self._sensor_history_factory(account) if self._sensor_history_factory else None
+
+    def _build_controller(self, account: int) -> Controller:
+        """ Build a controller using the panel section, falling back to [control] """
+
+        section = f"{PANEL_SECTION_PREFIX}{account}"
+
+        def setting(name: str) -> str:
+            return self.cfg.get(section, name, fallback=self.cfg.get("control", name))
+
+        return Controller(
+            config=self.cfg,
+            extension=setting("extension"),
+            wait_time=int(setting("wait_time")),
+            retry_time=int(setting("retry_time")),
+            max_retries=int(setting("max_retries")),
+            asterisk_user=setting("asterisk_user"),
+            spool_dir=Path(setting("spool_dir")),
+        )
+
+    def _load_from_config(self) -> None:
+        """ Load panels into collection from config data """
+
+        for account in configured_accounts(self.cfg):
+            logger.debug("Loading panel for account %s", account)
+            self.add(self._build_panel(account))
@@ -0,0 +1,257 @@
+"""
+Parser for Asterisk's AlarmReceiver event files.
+
+This module is imported by the short-lived event handler, so it must only depend on
+the standard library and light-weight simon_says modules (no pydantic, redis, etc), as must
+every simon_says module the handler imports.
+"""
+import datetime
+import logging
+import re
+from configparser import ConfigParser
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from simon_says.ademco import CODE_TABLE, MESSAGE_LENGTH, UNKNOWN_TYPE, checksum_valid
+from simon_says.archive import SegmentArchive
+from simon_says.config import account_sensor_names, get_config
+from simon_says.spool import SpoolScanner, shard_dir
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_RE = re.compile(r"PROTOCOL=(.*)$")
+CALLINGFROM_RE = re.compile(r"CALLINGFROM=(.*)$")
+TIMESTAMP_RE = re.compile(r"TIMESTAMP=(.*)$")
+EVENT_RE = re.compile(r"^(\d{4})(\d{2})(\d)(\d{3})(\d{2})(\d{3})(\d)")
+
+
+class InvalidEventError(ValueError):
+    """ An event file that can't be trusted (e.g. corrupted by a noisy line) """
+
+
+class EventParser:
+    """
+    Parse Asterisk's AlarmReceiver events
+    """
+
+    def __init__(
+        self,
+        config: ConfigParser = None,
+        src_dir: Path = None,
+        dst_dir: Path = None,
+        move_files: bool = True,
+        quarantine_dir: Path = None,
+        archive: bool = None,
+        batch_size: int = None,
+    ) -> None:
+
+        self.cfg = config or get_config()
+        self.src_dir = src_dir or Path(self.cfg.get("events", "src_dir"))
+        self.dst_dir = dst_dir or Path(self.cfg.get("events", "dst_dir"))
+        self.quarantine_dir = quarantine_dir or Path(self.cfg.get("events", "quarantine_dir"))
+
+        required_dirs = [self.src_dir, self.dst_dir]
+        if move_files:
+            required_dirs.append(self.quarantine_dir)
+        for p in required_dirs:
+            if not p.is_dir():
+                raise RuntimeError(f"Required directory {p} does not exist")
+
+        self.move_files = move_files
+        if archive is None:
+            archive = self.cfg.getboolean("events", "archive", fallback=False)
+        self.archive = SegmentArchive(self.dst_dir) if archive else None
+        # Both src_dir and dst_dir are sharded alike
+        self.shard_depth = self.cfg.getint("events", "shard_depth", fallback=0)
+        if batch_size is None:
+            batch_size = self.cfg.getint("events", "batch_size", fallback=0)
+        self.scanner = SpoolScanner(self.src_dir, depth=self.shard_depth, batch_size=batch_size)
+        self._sensor_names = account_sensor_names(self.cfg)
+
+    def reload(self, config: ConfigParser) -> None:
+        """ Pick up sensor names from a new config. Directories are kept as they are """
+
+        self.cfg = config
+        self._sensor_names = account_sensor_names(config)
+
+    def parse_file(self, path: Path) -> Optional[Dict[str, Any]]:
+        """
+        Parse an event file
+        See: https://www.voip-info.org/asterisk-cmd-alarmreceiver/
+
+        Notice that this code expects Asterisk's EventHandler config to be set with:
+            logindividualevents = yes
+        """
+
+        logger.debug("Parsing event file at %s", path)
+        with path.open("r") as f:
+            return self.parse_lines(path.name, f)
+
+    def parse_bytes(self, filename: str, data: bytes) -> Optional[Dict[str, Any]]:
+        """ Parse the contents of an event file, e.g. read from an archive """
+
+        return self.parse_lines(filename, data.decode().splitlines())
+
+    def parse_lines(self, filename: str, lines: Iterable[str]) -> Optional[Dict[str, Any]]:
+        """ Parse the lines of an event file """
+
+        uid = self._get_uid_from_filename(filename)
+        extension = None
+        timestamp = None
+        for line in lines:
+            line = line.strip()
+
+            # Verify Protocol
+            proto_match = PROTOCOL_RE.match(line)
+            if proto_match:
+                proto_value = proto_match.group(1)
+                if proto_value != "ADEMCO_CONTACT_ID":
+                    raise InvalidEventError(f"Invalid protocol {proto_value} in file {filename}")
+
+            # Get caller extension
+            x_match = CALLINGFROM_RE.match(line)
+            if x_match:
+                extension = x_match.group(1)
+
+            # Get Timestamp
+            t_match = TIMESTAMP_RE.match(line)
+            if t_match:
+                timestamp_str = t_match.group(1)
+                timestamp = self._parse_timestamp_str(timestamp_str)
+
+            # Get event info
+            fields = EVENT_RE.findall(line)
+            if fields:
+                logger.debug("Event line found: %s", line)
+
+                if not checksum_valid(line[:MESSAGE_LENGTH]):
+                    raise InvalidEventError(f"Invalid checksum in event line {line} of file {filename}")
+
+                if timestamp is None:
+                    raise InvalidEventError(f"Missing timestamp in file {filename}")
+
+                account, msg_type, qualifier, code_str, partition, sensor_or_user, checksum = fields[0]
+                code = int(code_str)
+                code_info = CODE_TABLE[code]
+
+                event_data = {
+                    "uid": uid,
+                    "timestamp": timestamp,
+                    "account": account,
+                    "msg_type": msg_type,
+                    "qualifier": qualifier,
+                    "code": code,
+                    "code_description": code_info.name,
+                    "category": code_info.category,
+                    "partition": partition,
+                    "checksum": checksum,
+                    "extension": extension,
+                }
+
+                self._set_sensor_or_user(event_data, code_info.type, int(sensor_or_user))
+
+                logger.debug("Event data: %s", event_data)
+                return event_data
+
+        logger.warning("No events found in file %s", filename)
+        return None
+
+    def move_file(self, src: Path) -> None:
+        """ Move event file to processed folder, or to the archive segment of the day """
+
+        if self.archive is not None:
+            entry = self.archive.append(src.name, src.read_bytes())
+            logger.debug("Archived file %s at offset %s of %s", src, entry.offset, self.dst_dir)
+            src.unlink()
+            return
+
+        dst_dir = shard_dir(self.dst_dir, src.name, self.shard_depth)
+        if self.shard_depth:
+            dst_dir.mkdir(parents=True, exist_ok=True)
+        dst = dst_dir / src.name
+        logger.debug("Moving file %s to %s", src, dst)
+        src.rename(dst)
+
+    @property
+    def backlog(self) -> int:
+        """ Number of files left for later calls to process_files, when processing in batches """
+
+        return self.scanner.backlog
+
+    def quarantine_file(self, src: Path) -> None:
+        """ Move a rejected event file to the quarantine folder """
+
+        dst = self.quarantine_dir / src.name
+        logger.debug("Moving file %s to %s", src, dst)
+        src.rename(dst)
+
+    def process_files(self) -> List[Dict[str, Any]]:
+        """
+        Parse the next batch of event files in the spool directory (all of them, unless a batch size is set),
+        oldest first.
+        Move each parsed file to another directory, and files that can't be parsed to the quarantine directory
+        """
+        results = []
+        for file in self.scanner.next_batch():
+            try:
+                event_data = self.parse_file(file)
+            except FileNotFoundError:
+                # Already taken by another handler since the spool directory was scanned
+                continue
+            except Exception as err:
+                # Never let a single bad file stall the rest of the batch
+                logger.error("Rejecting event file %s: %s", file, err)
+                if self.move_files:
+                    self.quarantine_file(file)
+                continue
+
+            if event_data:
+                results.append(event_data)
+            if self.move_files:
+                self.move_file(file)
+        return results
+
+    @staticmethod
+    def _get_uid_from_filename(filename: str) -> str:
+        """ Extract unique ID from filename """
+
+        # e.g. event-1IkVo1 -> 1IkVo1
+        return filename.replace("event-", "")
+
+    @staticmethod
+    def _parse_timestamp_str(timestamp: str) -> int:
+        """ Convert the string timestamp coming from Asterisk into seconds from epoch"""
+        # e.g
+        # Sat Dec 26, 2020 @ 16:16:29 UTC => datetime.datetime(2020, 12, 26, 16, 16, 29)
+        return int(datetime.datetime.strptime(timestamp, "%a %b %d, %Y @ %H:%M:%S %Z").timestamp())
+
+    def _set_sensor_or_user(self, event_data: Dict, data_type: str, sensor_or_user: int) -> None:
+        """ Set either sensor or user fields """
+
+        # The Ademco standard reuses the 6th field for either sensor or user identification.
+        # We look at what each code data type is and set the fields accordingly
+        if data_type == "zone":
+            event_data["sensor"] = sensor_or_user
+            # If there are configured sensor names, include the name, from the panel's own sensors if it has them
+            account = int(event_data["account"])
+            names = self._sensor_names.get(account, self._sensor_names[None])
+            event_data["sensor_name"] = names.get(sensor_or_user)
+            if event_data["sensor_name"] is None:
+                logger.debug("Sensor %s not found in config", sensor_or_user)
+            event_data["user"] = None
+        elif data_type == "user":
+            event_data["user"] = sensor_or_user
+            event_data["sensor"] = None
+            event_data["sensor_name"] = None
+        elif data_type == UNKNOWN_TYPE:
+            event_data["user"] = None
+            event_data["sensor"] = None
+            event_data["sensor_name"] = None
+        else:
+            raise ValueError(f"Invalid data type {data_type}")
+
+    @staticmethod
+    def _get_event_category(code: int) -> str:
+        """ Given a code number, get the ADEMCO category description """
+
+        return CODE_TABLE[code].category
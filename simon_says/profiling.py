@@ -0,0 +1,298 @@
+"""
+On-demand profiling of API requests and event handler runs.
+
+Set up in the [profiling] config section, e.g.:
+
+    [profiling]
+    enabled = yes
+    # Fraction of requests to capture cProfile stats for
+    sample_rate = 0.01
+    # Also capture what sampled requests allocate
+    tracemalloc = yes
+    # Trace requests slower than this, with the time spent in the data store, validation and JSON
+    slow_request_ms = 500
+    output_dir = /tmp/simon_says_profiles
+
+Profiling can also be turned on and off without restarting: by changing enabled and reloading the config with
+SIGHUP, or in the event handler, with SIGUSR1 (API workers leave it to gunicorn, which reopens logs on SIGUSR1).
+
+Sampled requests leave a <time>-<pid>-<request>.prof file in output_dir, which can be read with pstats
+(python -m pstats <file>) or snakeviz, and with tracemalloc, a .tracemalloc.txt file with the top allocations
+made by the request that were still alive at its end. Slow requests are logged, and appended as JSON lines to
+slow_requests.ndjson in output_dir.
+
+cProfile and tracemalloc are only imported once a request is sampled.
+"""
+import functools
+import json
+import logging
+import os
+import random
+import re
+import signal
+import threading
+import time
+from configparser import ConfigParser
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, Optional, TypeVar
+
+from simon_says.config import get_config
+
+if TYPE_CHECKING:
+    import cProfile
+    import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+PROFILING_SECTION = "profiling"
+SLOW_REQUESTS_FILE = "slow_requests.ndjson"
+
+# Allocations listed in tracemalloc reports
+TRACEMALLOC_TOP = 25
+
+# Time spent in each category (e.g. "datastore") during the current request, when it's being traced
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("timings", default=None)
+
+F = TypeVar("F", bound=Callable[..., Any])
+C = TypeVar("C", bound=type)
+
+
+def timed(category: str) -> Callable[[F], F]:
+    """ Decorator adding the run time of a function (or coroutine) to the given category of the current trace """
+
+    import inspect
+
+    def decorator(func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                timings = _timings.get()
+                if timings is None:
+                    return await func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    timings[category] = timings.get(category, 0.0) + time.perf_counter() - start
+
+            return async_wrapper  # type: ignore
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = _timings.get()
+            if timings is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[category] = timings.get(category, 0.0) + time.perf_counter() - start
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+def timed_methods(category: str) -> Callable[[C], C]:
+    """
+    Class decorator timing all public methods defined in the class.
+    Generators are left alone, since calling them only creates the generator.
+    """
+
+    import inspect
+
+    def decorator(cls: C) -> C:
+        for name, attr in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.isfunction(attr):
+                continue
+            if inspect.isgeneratorfunction(attr) or inspect.isasyncgenfunction(attr):
+                continue
+            setattr(cls, name, timed(category)(attr))
+        return cls
+
+    return decorator
+
+
+class timer:
+    """ Context manager adding the time spent in a block to the given category of the current trace """
+
+    def __init__(self, category: str) -> None:
+        self.category = category
+        self._timings: Optional[Dict[str, float]] = None
+        self._start = 0.0
+
+    def __enter__(self) -> "timer":
+        self._timings = _timings.get()
+        if self._timings is not None:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._timings is not None:
+            self._timings[self.category] = self._timings.get(self.category, 0.0) + time.perf_counter() - self._start
+
+
+class Capture:
+    """ What is being recorded about a single request or handler run """
+
+    def __init__(self, name: str, token: Token, timings: Dict[str, float]) -> None:
+        self.name = name
+        self.token = token
+        self.timings = timings
+        self.wall_time = time.time()
+        self.started = time.perf_counter()
+        self.profile: Optional["cProfile.Profile"] = None
+        # Whether tracemalloc was started for this capture
+        self.tracing = False
+
+
+class Profiler:
+    """ Samples requests (or any other unit of work) for profiling, and traces the slow ones """
+
+    def __init__(self, config: ConfigParser = None) -> None:
+        # Only one sampled request is profiled at a time
+        self._lock = threading.Lock()
+        self.reload(config or get_config())
+
+    def reload(self, config: ConfigParser) -> None:
+        """ Load settings from the [profiling] config section """
+
+        self.enabled = config.getboolean(PROFILING_SECTION, "enabled", fallback=False)
+        self.sample_rate = config.getfloat(PROFILING_SECTION, "sample_rate", fallback=0.01)
+        self.tracemalloc = config.getboolean(PROFILING_SECTION, "tracemalloc", fallback=False)
+        self.slow_request_ms = config.getfloat(PROFILING_SECTION, "slow_request_ms", fallback=0)
+        self.output_dir = Path(config.get(PROFILING_SECTION, "output_dir", fallback="/tmp/simon_says_profiles"))
+
+    def toggle(self) -> None:
+        """ Turn profiling on or off """
+
+        self.enabled = not self.enabled
+        logger.warning("Profiling %s", "enabled" if self.enabled else "disabled")
+
+    def install_toggle_handler(self, signum: int = signal.SIGUSR1) -> None:
+        """ Turn profiling on or off when the process gets the given signal (SIGUSR1 by default) """
+
+        signal.signal(signum, lambda *_: self.toggle())
+
+    def start(self, name: str) -> Optional[Capture]:
+        """ Start tracing a unit of work, and profiling it if sampled. Returns None if profiling is disabled """
+
+        if not self.enabled:
+            return None
+
+        timings: Dict[str, float] = {}
+        capture = Capture(name, _timings.set(timings), timings)
+        if random.random() < self.sample_rate and self._lock.acquire(blocking=False):
+            import cProfile
+            import tracemalloc
+
+            if self.tracemalloc and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                capture.tracing = True
+            capture.profile = cProfile.Profile()
+            capture.profile.enable()
+        return capture
+
+    def finish(self, capture: Optional[Capture]) -> None:
+        """ Stop tracing, writing out the profile if sampled, and the trace if slow """
+
+        if capture is None:
+            return
+
+        elapsed = time.perf_counter() - capture.started
+        _timings.reset(capture.token)
+
+        if capture.profile is not None:
+            import tracemalloc
+
+            capture.profile.disable()
+            snapshot = tracemalloc.take_snapshot() if capture.tracing else None
+            if capture.tracing:
+                tracemalloc.stop()
+            self._lock.release()
+            try:
+                self._write_profile(capture, snapshot)
+            except OSError as err:
+                logger.error("Error writing profile of %s: %s", capture.name, err)
+
+        if self.slow_request_ms and elapsed * 1000 >= self.slow_request_ms:
+            self._write_slow_trace(capture, elapsed)
+
+    @contextmanager
+    def profile(self, name: str) -> Iterator[Optional[Capture]]:
+        """ Trace, and maybe profile, a block of code """
+
+        capture = self.start(name)
+        try:
+            yield capture
+        finally:
+            self.finish(capture)
+
+    def _file_prefix(self, capture: Capture) -> Path:
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", capture.name).strip("_")
+        return self.output_dir / f"{capture.wall_time:.3f}-{os.getpid()}-{slug}"
+
+    def _write_profile(self, capture: Capture, snapshot: Optional["tracemalloc.Snapshot"]) -> None:
+        import tracemalloc
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        prefix = self._file_prefix(capture)
+        capture.profile.dump_stats(f"{prefix}.prof")  # type: ignore
+
+        if snapshot is not None:
+            snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+            with open(f"{prefix}.tracemalloc.txt", "w") as f:
+                for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]:
+                    f.write(f"{stat}\n")
+
+        logger.info("Wrote profile of %s to %s.*", capture.name, prefix)
+
+    def _write_slow_trace(self, capture: Capture, elapsed: float) -> None:
+        timings = {k: round(v * 1000, 3) for k, v in capture.timings.items()}
+        timings["other"] = round(max(0.0, elapsed - sum(capture.timings.values())) * 1000, 3)
+        logger.warning(
+            "Slow: %s took %.1fms (%s)",
+            capture.name,
+            elapsed * 1000,
+            ", ".join(f"{k} {v:.1f}ms" for k, v in timings.items()),
+        )
+
+        trace = {"timestamp": capture.wall_time, "name": capture.name, "ms": round(elapsed * 1000, 3), **timings}
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.output_dir / SLOW_REQUESTS_FILE, "a") as f:
+                f.write(json.dumps(trace) + "\n")
+        except OSError as err:
+            logger.error("Error writing slow trace of %s: %s", capture.name, err)
+
+
+class ProfilingMiddleware:
+    """ Falcon middleware profiling requests """
+
+    def __init__(self, profiler: Profiler) -> None:
+        self.profiler = profiler
+
+    def process_request(self, req, resp):
+        req.context.profile_capture = self.profiler.start(f"{req.method} {req.path}")
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        self.profiler.finish(req.context.get("profile_capture"))
+
+
+class AsyncProfilingMiddleware:
+    """
+    Falcon ASGI middleware profiling requests.
+    Notice that profiles of sampled requests include whatever else the event loop ran meanwhile.
+    """
+
+    def __init__(self, profiler: Profiler) -> None:
+        self.profiler = profiler
+
+    async def process_request(self, req, resp):
+        req.context.profile_capture = self.profiler.start(f"{req.method} {req.path}")
+
+    async def process_response(self, req, resp, resource, req_succeeded):
+        self.profiler.finish(req.context.get("profile_capture"))
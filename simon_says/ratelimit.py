@@ -0,0 +1,189 @@
+"""
+Token bucket rate limiting for write requests, shared by all workers through Redis.
+
+Limits are set per route in the [rate_limit] config section, e.g.:
+
+    [rate_limit]
+    # <route> = <requests per second>, <burst>: the limit for each client
+    events = 5, 20
+    # <route>_total = <requests per second>, <burst>: the limit for all clients together
+    events_total = 50, 200
+    # Clients that are never limited (the event handler, over the API's Unix socket, is "unix")
+    exempt_clients = unix
+
+Routes are named after the last part of their path, so the "events" limits apply to both
+POST /events and POST /panels/<account>/events. Clients over their own limit get 429 Too Many
+Requests, and requests over the total limit are shed with 503 Service Unavailable. Both come
+with a Retry-After header.
+"""
+import logging
+import math
+from configparser import ConfigParser
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import falcon
+
+from simon_says.db import AsyncDataStore, DataStore
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_SECTION = "rate_limit"
+TOTAL_SUFFIX = "_total"
+
+# Only requests with these methods are rate limited
+LIMITED_METHODS = ("POST",)
+
+# Take a token from each bucket in KEYS, but only if all of them have one.
+# ARGV holds the rate (tokens per second) and burst (bucket size) of each bucket, in pairs.
+# Returns the (1-based) position of the first empty bucket, or 0, and how long until it has a token.
+TOKEN_BUCKET_SCRIPT = """
+local t = redis.call("TIME")
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local bucket = redis.call("HMGET", key, "tokens", "ts")
+    local n = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    n = math.min(burst, n + math.max(0, now - ts) * rate)
+    if n < 1 then
+        return {i, tostring((1 - n) / rate)}
+    end
+    tokens[i] = n
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    redis.call("HSET", key, "tokens", tostring(tokens[i] - 1), "ts", tostring(now))
+    redis.call("PEXPIRE", key, math.ceil(burst / rate * 1000))
+end
+return {0, "0"}
+"""
+
+
+class Limit(NamedTuple):
+    """ A token bucket: rate is in requests per second, and burst is the bucket size """
+
+    rate: float
+    burst: int
+
+
+def parse_limit(value: str) -> Limit:
+    """ Parse a "<rate>, <burst>" limit """
+
+    rate, _, burst = value.partition(",")
+    limit = Limit(rate=float(rate), burst=int(burst or 1))
+    if limit.rate <= 0 or limit.burst < 1:
+        raise ValueError(f"Invalid rate limit: {value}")
+    return limit
+
+
+class RateLimits:
+    """ Rate limits loaded from the [rate_limit] config section """
+
+    def __init__(self, config: ConfigParser) -> None:
+        self.per_client: Dict[str, Limit] = {}
+        self.total: Dict[str, Limit] = {}
+        self.exempt_clients: List[str] = []
+
+        if not config.has_section(RATE_LIMIT_SECTION):
+            return
+
+        for name, value in config[RATE_LIMIT_SECTION].items():
+            if name == "exempt_clients":
+                self.exempt_clients = [c.strip() for c in value.split(",") if c.strip()]
+            elif name.endswith(TOTAL_SUFFIX):
+                self.total[name[: -len(TOTAL_SUFFIX)]] = parse_limit(value)  # noqa: E203
+            else:
+                self.per_client[name] = parse_limit(value)
+
+    def __bool__(self) -> bool:
+        return bool(self.per_client or self.total)
+
+    def buckets(self, req) -> Optional[Tuple[List[str], List[float]]]:
+        """ Get the bucket keys and limits that apply to a request, if any """
+
+        if req.method not in LIMITED_METHODS or not req.uri_template:
+            return None
+
+        route = req.uri_template.rsplit("/", 1)[-1]
+        client = req.remote_addr or "unix"
+        if client in self.exempt_clients:
+            return None
+
+        # Buckets of a route share a hash tag, so the script can update them together
+        keys: List[str] = []
+        args: List[float] = []
+        if route in self.per_client:
+            keys.append(f"rate_limit:{{{route}}}:{client}")
+            args.extend(self.per_client[route])
+        if route in self.total:
+            keys.append(f"rate_limit:{{{route}}}")
+            args.extend(self.total[route])
+
+        return (keys, args) if keys else None
+
+
+def raise_if_limited(keys: List[str], result: List) -> None:
+    """ Reject the request, if the script found an empty bucket """
+
+    position, wait = int(result[0]), float(result[1])
+    if not position:
+        return
+
+    retry_after = max(1, math.ceil(wait))
+    key = keys[position - 1]
+    if key.endswith("}"):
+        # The total bucket of the route (its key has no client suffix): shed load
+        logger.warning("Shedding load on %s, retry after %ss", key, retry_after)
+        raise falcon.HTTPServiceUnavailable(retry_after=retry_after)
+
+    logger.warning("Rate limit exceeded for %s, retry after %ss", key, retry_after)
+    raise falcon.HTTPTooManyRequests(retry_after=retry_after)
+
+
+class RateLimiter:
+    """ Falcon middleware enforcing rate limits """
+
+    def __init__(self, limits: RateLimits, db: DataStore) -> None:
+        self.limits = limits
+        self.db = db
+
+    def process_resource(self, req, resp, resource, params):
+        buckets = self.limits.buckets(req)
+        if buckets is None:
+            return
+
+        keys, args = buckets
+        try:
+            result = self.db.run_script(TOKEN_BUCKET_SCRIPT, keys, args)
+        except Exception as err:
+            # Never drop alarm events because the limiter itself is unavailable
+            logger.warning("Not rate limiting request, error checking limits: %s", err)
+            return
+
+        raise_if_limited(keys, result)
+
+
+class AsyncRateLimiter:
+    """ Falcon ASGI middleware enforcing rate limits """
+
+    def __init__(self, limits: RateLimits, db: AsyncDataStore) -> None:
+        self.limits = limits
+        self.db = db
+
+    async def process_resource(self, req, resp, resource, params):
+        buckets = self.limits.buckets(req)
+        if buckets is None:
+            return
+
+        keys, args = buckets
+        try:
+            result = await self.db.run_script(TOKEN_BUCKET_SCRIPT, keys, args)
+        except Exception as err:
+            # Never drop alarm events because the limiter itself is unavailable
+            logger.warning("Not rate limiting request, error checking limits: %s", err)
+            return
+
+        raise_if_limited(keys, result)
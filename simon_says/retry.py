@@ -0,0 +1,142 @@
+"""
+Retrying, timing out and failing fast against an API that is slow or down, for the Client and the event handler.
+"""
+import logging
+import random
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RetryPolicy(NamedTuple):
+    """ When, and how often, to retry a request """
+
+    max_retries: int = 3
+    # Waits between attempts that failed without the server saying how long to wait: exponential, from backoff
+    # seconds up to max_backoff
+    backoff: float = 0.5
+    max_backoff: float = 10.0
+    # Longest wait asked with a Retry-After header that is honored. Requests asked to wait longer fail right away
+    max_retry_after: float = 60.0
+
+
+class Backoff:
+    """
+    Exponential backoff with jitter, so that clients that failed together don't all come back together.
+    Each wait is between half and all of initial * factor ** <failures so far>, up to maximum
+    """
+
+    def __init__(self, initial: float = 0.5, maximum: float = 30.0, factor: float = 2.0) -> None:
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.failures = 0
+
+    def next(self) -> float:
+        """ Get how long to wait after another failure """
+
+        delay = min(self.maximum, self.initial * self.factor ** self.failures)
+        self.failures += 1
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def reset(self) -> None:
+        """ Start over, after a success """
+
+        self.failures = 0
+
+
+class AdaptiveTimeout:
+    """
+    Read timeouts following observed response times, the way TCP sets its retransmission timeout (RFC 6298):
+    a smoothed response time plus four times its variation, so that a healthy API is not waited on for long when
+    a response gets lost, while a slower one is given the time it usually needs.
+    """
+
+    def __init__(self, minimum: float = 1.0) -> None:
+        self.minimum = minimum
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+
+    def observe(self, elapsed: float) -> None:
+        """ Account for the time a response took """
+
+        if self.srtt is None:
+            self.srtt = elapsed
+            self.rttvar = elapsed / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - elapsed)
+            self.srtt = 0.875 * self.srtt + 0.125 * elapsed
+
+    def get(self, ceiling: float) -> float:
+        """ Get the timeout to use, never above ceiling. Without any responses yet, that's the ceiling """
+
+        if self.srtt is None:
+            return ceiling
+        return min(ceiling, max(self.minimum, self.srtt + 4 * self.rttvar))
+
+
+class CircuitOpenError(RuntimeError):
+    """ Failing fast, since the API failed too many times in a row """
+
+    def __init__(self, retry_in: float) -> None:
+        super().__init__(f"API unavailable, not trying again for {retry_in:.1f}s")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Stop sending requests to an API that keeps failing.
+
+    After failure_threshold failures in a row the circuit opens, and requests fail right away with a
+    CircuitOpenError. Once reset_timeout seconds went by, a single request is let through: the circuit closes
+    again if it succeeds, and stays open for another reset_timeout otherwise. Should that request never be
+    reported on, another one is let through after reset_timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> None:
+        """ Check whether a request may be sent now, raising CircuitOpenError otherwise """
+
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = self._clock()
+            retry_in = self._opened_at + self.reset_timeout - now
+            if retry_in <= 0:
+                # Let this one request through, to find out whether the API is back
+                self.state = self.HALF_OPEN
+                self._opened_at = now
+                return
+            raise CircuitOpenError(max(retry_in, 0.0))
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("API is back, closing circuit")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state == self.CLOSED:
+                    logger.warning("API failed %s times in a row, opening circuit", self.failures)
+                self.state = self.OPEN
+                self._opened_at = self._clock()
@@ -1,4 +1,3 @@
-import json
 import logging
 from configparser import ConfigParser
 from enum import Enum
@@ -6,7 +5,8 @@ from typing import Any, Dict, List
 
 from pydantic import BaseModel
 
-from simon_says.config import ConfigLoader
+from simon_says.config import get_config, sensor_names
+from simon_says.serialization import dumps
 
 logger = logging.getLogger(__name__)
 
@@ -26,13 +26,11 @@ class Sensor(BaseModel):
 
     def to_dict(self) -> Dict[str, Any]:
         """ Convert to Dict """
-        res = self.__dict__.copy()
-        res["state"] = self.state.value
-        return res
+        return {"number": self.number, "name": self.name, "state": self.state.value}
 
-    def to_json(self) -> str:
+    def to_json(self) -> bytes:
         """ Convert to JSON """
-        return json.dumps(self.to_dict())
+        return dumps(self.__dict__)
 
 
 class Sensors:
@@ -41,9 +39,10 @@ class Sensors:
     These correspond to "zones" in the Ademco nomenclature.
     """
 
-    def __init__(self, config: ConfigParser = None) -> None:
+    def __init__(self, config: ConfigParser = None, section: str = "sensors") -> None:
         self._sensors_by_number: Dict[int, Sensor] = {}
-        self.cfg = config or ConfigLoader().config
+        self.cfg = config or get_config()
+        self.section = section
         self._load_from_config()
 
     def add(self, sensor: Sensor) -> None:
@@ -62,10 +61,10 @@ class Sensors:
 
         return list(self._sensors_by_number.values())
 
-    def all_as_json(self) -> str:
+    def all_as_json(self) -> bytes:
         """ Return all sensors as JSON """
 
-        return json.dumps([s.to_dict() for s in self.get_all_sensors()])
+        return dumps([s.__dict__ for s in self.get_all_sensors()])
 
     def clear_all(self) -> None:
         """ Clear all sensors (set to CLOSED state) """
@@ -76,5 +75,16 @@ class Sensors:
 
     def _load_from_config(self) -> None:
         """ Load sensors into collection from config data """
-        for number, name in self.cfg["sensors"].items():
-            self.add(Sensor(number=int(number), name=name))
+        if not self.cfg.has_section(self.section):
+            logger.warning("No sensors configured in section [%s]", self.section)
+            return
+
+        for number, name in sensor_names(self.cfg, self.section).items():
+            self.add(Sensor(number=number, name=name))
+
+    def copy_states(self, other: "Sensors") -> None:
+        """ Take over the state of sensors with the same number in another collection """
+
+        for sensor in other.get_all_sensors():
+            if sensor.number in self._sensors_by_number:
+                self._sensors_by_number[sensor.number].state = sensor.state
@@ -0,0 +1,53 @@
+"""
+JSON serialization layer.
+
+Uses orjson when it is installed and falls back to the standard library otherwise.
+Both backends produce UTF-8 encoded bytes, so callers can hand the result straight
+to the response body or to the data store.
+"""
+import json
+from enum import Enum
+from typing import Any, Union
+
+from simon_says.profiling import timed
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+
+def _default(obj: Any) -> Any:
+    """ Serialize types the stdlib encoder does not know about """
+
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+
+    def dumps(obj: Any) -> bytes:
+        """ Serialize obj to JSON bytes """
+        return orjson.dumps(obj)
+
+    def loads(data: Union[bytes, str]) -> Any:
+        """ Deserialize JSON bytes or str """
+        return orjson.loads(data)
+
+else:  # pragma: no cover
+    BACKEND = "json"
+
+    def dumps(obj: Any) -> bytes:
+        """ Serialize obj to JSON bytes """
+        return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+    def loads(data: Union[bytes, str]) -> Any:
+        """ Deserialize JSON bytes or str """
+        return json.loads(data)
+
+
+# Count encoding and decoding time in slow request traces
+dumps = timed("json")(dumps)
+loads = timed("json")(loads)
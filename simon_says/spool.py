@@ -0,0 +1,104 @@
+"""
+Scanning of spool directories holding event files.
+
+Listing a directory with os.scandir gets the type of each entry along with its name (d_type), so regular files
+are told apart without a stat call per file, and file times are read once per scan, to hand files out oldest
+first.
+
+Directories can optionally be sharded ([events] shard_depth): files are then spread over <depth> levels of
+subdirectories named after a hash of their name (e.g. src_dir/3f/a0/event-1IkVo1 with a depth of 2), so that no
+single directory grows to hundreds of thousands of entries. Files at the top level are always picked up too,
+since Asterisk writes them there.
+"""
+import os
+import zlib
+from pathlib import Path
+from typing import Iterator, List
+
+# Only files named like the ones Asterisk writes are event files
+EVENT_FILE_PREFIX = "event-"
+
+# Hex digits of the name hash used by each level of subdirectories
+SHARD_WIDTH = 2
+MAX_SHARD_DEPTH = 4
+
+
+def shard_dir(base: Path, name: str, depth: int) -> Path:
+    """ Get the (sharded) directory of a file under base """
+
+    if not depth:
+        return base
+    if not 0 < depth <= MAX_SHARD_DEPTH:
+        raise ValueError(f"Invalid shard depth {depth} (1 to {MAX_SHARD_DEPTH})")
+
+    digest = f"{zlib.crc32(name.encode()):08x}"
+    levels = (digest[i : i + SHARD_WIDTH] for i in range(0, depth * SHARD_WIDTH, SHARD_WIDTH))  # noqa: E203
+    return base.joinpath(*levels)
+
+
+def _is_shard(name: str) -> bool:
+    return len(name) == SHARD_WIDTH and all(c in "0123456789abcdef" for c in name)
+
+
+def iter_entries(base: Path, depth: int = 0, prefix: str = EVENT_FILE_PREFIX) -> Iterator[os.DirEntry]:
+    """ Yield the entries of all regular files starting with prefix in base, and its shards up to depth levels """
+
+    with os.scandir(base) as it:
+        for entry in it:
+            if entry.name.startswith(prefix):
+                # Only stats the file if the file system doesn't report entry types
+                if entry.is_file(follow_symlinks=False):
+                    yield entry
+            elif depth and _is_shard(entry.name) and entry.is_dir(follow_symlinks=False):
+                yield from iter_entries(Path(entry.path), depth - 1, prefix)
+
+
+def _mtime(entry: os.DirEntry) -> float:
+    try:
+        return entry.stat(follow_symlinks=False).st_mtime
+    except FileNotFoundError:
+        # Taken by another handler meanwhile
+        return float("inf")
+
+
+def scan(base: Path, depth: int = 0, prefix: str = EVENT_FILE_PREFIX) -> List[Path]:
+    """ Get the paths of all event files in a spool directory, oldest first """
+
+    entries = sorted(iter_entries(base, depth, prefix), key=_mtime)
+    return [Path(entry.path) for entry in entries]
+
+
+class SpoolScanner:
+    """
+    Hand out the event files of a spool directory in bounded batches, oldest first.
+
+    A backlog is listed once, and then worked through batch by batch: the directory is only scanned again once
+    everything found by the previous scan was handed out, so the cost of scans does not grow with the number of
+    times a large backlog is looked at.
+    """
+
+    def __init__(self, base: Path, depth: int = 0, batch_size: int = 0) -> None:
+        self.base = base
+        self.depth = depth
+        self.batch_size = batch_size
+        self._pending: List[Path] = []
+
+    @property
+    def backlog(self) -> int:
+        """ Files found by the last scan that were not handed out yet """
+
+        return len(self._pending)
+
+    def next_batch(self) -> List[Path]:
+        """ Get the next batch of files (all of them, without a batch size) """
+
+        if not self._pending:
+            self._pending = scan(self.base, self.depth)
+            # Handed out from the end
+            self._pending.reverse()
+
+        size = self.batch_size or len(self._pending)
+        batch = self._pending[-size:]
+        del self._pending[-size:]
+        batch.reverse()
+        return batch
@@ -0,0 +1,195 @@
+"""
+Event submission paths for the event handler.
+
+The handler can be invoked by Asterisk once per call, so start-up time dominates its
+run time. HTTPSubmitter speaks just enough HTTP/1.1 over a plain TCP or Unix domain
+socket to POST events, and only imports from the standard library.
+
+When the handler runs as a resident daemon next to the API, StoreSubmitter skips HTTP
+altogether and writes into the EventStore directly.
+"""
+import json
+import logging
+import socket
+from configparser import ConfigParser
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from simon_says.profiling import timer
+
+# Both the connect and read timeout, in seconds
+DEFAULT_TIMEOUT = 10
+
+logger = logging.getLogger(__name__)
+
+
+class EventRejectedError(RuntimeError):
+    """ An event that will never be accepted (e.g. invalid), so submitting it again is pointless """
+
+
+class HTTPSubmitter:
+    """
+    POST events to the API, re-using the connection when the server allows it.
+
+    The URL can either be a TCP one (e.g. http://localhost:8000) or point at a Unix
+    domain socket the API listens on (e.g. unix:///run/simon_says/api.sock).
+    """
+
+    def __init__(self, url: str, timeout: float = DEFAULT_TIMEOUT) -> None:
+        parts = urlsplit(url)
+        self._unix_path: Optional[str] = None
+        if parts.scheme == "http":
+            self._host = parts.hostname or "localhost"
+            self._port = parts.port or 80
+            self._prefix = parts.path.rstrip("/")
+        elif parts.scheme == "unix":
+            self._unix_path = parts.path
+            self._host = "localhost"
+            self._port = 80
+            self._prefix = ""
+        else:
+            raise ValueError(f"Unsupported URL scheme: {parts.scheme}")
+
+        self._timeout = timeout
+        self._sock: Optional[socket.socket] = None
+
+    def _connect(self) -> socket.socket:
+        """ Open a new connection to the API """
+
+        if self._unix_path:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self._timeout)
+            try:
+                sock.connect(self._unix_path)
+            except OSError:
+                sock.close()
+                raise
+            return sock
+
+        return socket.create_connection((self._host, self._port), timeout=self._timeout)
+
+    def close(self) -> None:
+        """ Close the connection, if open """
+
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _read_response(self, sock: socket.socket) -> Tuple[int, bytes]:
+        """ Read status code and body from the connection """
+
+        with sock.makefile("rb") as f:
+            status_line = f.readline()
+            if not status_line:
+                raise ConnectionError("Connection closed by server")
+
+            version, status, _ = status_line.decode("latin-1").split(" ", 2)
+            keep_alive = version == "HTTP/1.1"
+            length = None
+            while True:
+                line = f.readline().decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                name = name.strip().lower()
+                if name == "content-length":
+                    length = int(value)
+                elif name == "connection" and value.strip().lower() == "close":
+                    keep_alive = False
+
+            if length is None:
+                body = f.read()
+                keep_alive = False
+            else:
+                body = f.read(length)
+
+        if not keep_alive:
+            self.close()
+
+        return int(status), body
+
+    def _request(self, method: str, path: str, body: bytes) -> Tuple[int, bytes]:
+        """ Send a request and return status code and body """
+
+        request = (
+            f"{method} {self._prefix}{path} HTTP/1.1\r\n"
+            f"Host: {self._host}:{self._port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "\r\n"
+        ).encode("latin-1") + body
+
+        reused = self._sock is not None
+        try:
+            if self._sock is None:
+                self._sock = self._connect()
+            self._sock.sendall(request)
+            return self._read_response(self._sock)
+        except (ConnectionError, socket.timeout):
+            self.close()
+            if not reused:
+                raise
+
+        # The server closed an idle keep-alive connection. Try once more with a fresh one.
+        logger.debug("Reconnecting to %s", self._unix_path or f"{self._host}:{self._port}")
+        self._sock = self._connect()
+        self._sock.sendall(request)
+        return self._read_response(self._sock)
+
+    def submit(self, data: Dict[str, Any]) -> None:
+        """ Add a single event """
+
+        status, content = self._request("POST", "/events", json.dumps(data).encode())
+        # 200 means the API already had the event (a panel retransmission)
+        if status in (200, 201):
+            return
+        error = f"Error code: {status}, content: {content.decode(errors='replace')}"
+        # Other than when shedding load (429), client errors are about the event itself
+        if 400 <= status < 500 and status != 429:
+            raise EventRejectedError(error)
+        raise RuntimeError(error)
+
+
+class StoreSubmitter:
+    """
+    Validate events and write them straight into the event store of their panel (the default one for accounts
+    without a [panel:<account>] section), over a persistent Redis connection.
+
+    Notice that sensor state is kept by the API, so events submitted this way do not update it.
+    """
+
+    def __init__(self, config: ConfigParser = None) -> None:
+        # Only the resident daemon uses this path, so defer the heavier imports until now
+        from simon_says.config import get_config
+        from simon_says.db import DataStore
+        from simon_says.events import AlarmEvent, EventStore
+        from simon_says.panels import configured_accounts
+
+        self.cfg = config or get_config()
+        self._event_class = AlarmEvent
+        self._store_class = EventStore
+        self._db = DataStore(config=self.cfg)
+        self._accounts = set(configured_accounts(self.cfg))
+        self._stores: Dict[Optional[int], Any] = {}
+
+    def _store_for(self, account: int) -> Any:
+        """ Get the event store for the panel of the given account """
+
+        key = account if account in self._accounts else None
+        if key not in self._stores:
+            self._stores[key] = self._store_class(db=self._db, account=key)
+        return self._stores[key]
+
+    def submit(self, data: Dict[str, Any]) -> None:
+        """ Add a single event """
+
+        try:
+            with timer("validation"):
+                event = self._event_class(**data)
+            self._store_for(event.account).add(event)
+        except ValueError as err:
+            # Invalid, or already stored
+            raise EventRejectedError(str(err))
+
+    def close(self) -> None:
+        """ Nothing to release; the Redis client manages its own pool """
@@ -0,0 +1,285 @@
+"""
+Push new events to other systems (notification services, home automation, etc).
+
+Subscribers are configured with [webhook:<name>] sections, e.g.:
+
+    [webhook:notifier]
+    url = http://notifier.local/alarm
+    # Only send events in these categories, or with these codes (default: all events)
+    categories = Alarms, Troubles
+    codes = 131, 132
+
+Events are POSTed as {"events": [...]}, in batches. Each subscriber has its own queue and worker
+threads, so a slow or failing one delays neither the others nor the API requests that queue events.
+Failed deliveries are retried with exponential backoff, and then kept in a Redis list (the dead
+letter queue) from which they can be sent again with `simon-says webhooks-replay`.
+"""
+import logging
+import queue
+import threading
+import time
+from configparser import ConfigParser
+from typing import Any, Dict, List, Optional, Set
+
+from simon_says.db import DataStore
+from simon_says.events import AlarmEvent
+from simon_says.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_SECTION_PREFIX = "webhook:"
+DEAD_LETTER_KEY = "webhook_dead_letters"
+
+# Defaults for each webhook, which its section can override
+WEBHOOK_DEFAULTS = {
+    # Events to send per request
+    "batch_size": "50",
+    # How long to wait for more events to fill a batch, in seconds
+    "batch_wait": "0.5",
+    # Delivery threads
+    "workers": "1",
+    "timeout": "10",
+    # Retries after the first attempt. The n-th retry happens backoff * 2 ** (n - 1) seconds after the previous one
+    "max_retries": "5",
+    "backoff": "1",
+    # Events waiting to be sent. When full, new events go straight to the dead letter queue
+    "queue_size": "10000",
+}
+
+# Tells worker threads to stop
+_STOP = object()
+
+
+def _parse_list(value: str) -> List[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+class Webhook:
+    """ A webhook subscriber, and the filter for the events it gets """
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        categories: Set[str] = None,
+        codes: Set[int] = None,
+        settings: Dict[str, str] = None,
+    ) -> None:
+        self.name = name
+        self.url = url
+        self.categories = categories or set()
+        self.codes = codes or set()
+
+        settings = dict(WEBHOOK_DEFAULTS, **(settings or {}))
+        self.batch_size = int(settings["batch_size"])
+        self.batch_wait = float(settings["batch_wait"])
+        self.workers = int(settings["workers"])
+        self.timeout = float(settings["timeout"])
+        self.max_retries = int(settings["max_retries"])
+        self.backoff = float(settings["backoff"])
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=int(settings["queue_size"]))
+
+    def wants(self, event: AlarmEvent) -> bool:
+        """ Check whether the subscriber wants an event """
+
+        if not self.categories and not self.codes:
+            return True
+        return event.category in self.categories or event.code in self.codes
+
+    @classmethod
+    def from_config(cls, config: ConfigParser, section: str) -> "Webhook":
+        """ Build a webhook from its config section """
+
+        settings = dict(config[section])
+        return cls(
+            name=section[len(WEBHOOK_SECTION_PREFIX) :],  # noqa: E203
+            url=settings.pop("url"),
+            categories=set(_parse_list(settings.pop("categories", ""))),
+            codes={int(c) for c in _parse_list(settings.pop("codes", ""))},
+            settings=settings,
+        )
+
+
+def configured_webhooks(config: ConfigParser) -> List[Webhook]:
+    """ Get all webhooks in the config """
+
+    return [Webhook.from_config(config, s) for s in config.sections() if s.startswith(WEBHOOK_SECTION_PREFIX)]
+
+
+class WebhookDispatcher:
+    """ Fan new events out to webhook subscribers, from background threads """
+
+    def __init__(self, webhooks: List[Webhook], db: DataStore) -> None:
+        # requests is slow to import, so only pay for it when webhooks are configured
+        import requests
+
+        self._requests = requests
+        self.webhooks = webhooks
+        self.db = db
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        """ Start the worker threads """
+
+        for webhook in self.webhooks:
+            for i in range(webhook.workers):
+                thread = threading.Thread(
+                    target=self._run, args=(webhook,), name=f"webhook-{webhook.name}-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, event: AlarmEvent) -> None:
+        """ Queue an event for the subscribers that want it. Never blocks """
+
+        for webhook in self.webhooks:
+            if not webhook.wants(event):
+                continue
+            try:
+                webhook.queue.put_nowait(event.to_dict())
+            except queue.Full:
+                logger.error("Queue of webhook %s is full, dead-lettering event %s", webhook.name, event.uid)
+                self.dead_letter(webhook, [event.to_dict()], "queue full")
+
+    def close(self, timeout: float = None) -> None:
+        """
+        Stop worker threads, once they've sent what is already queued.
+        Gives up waiting after timeout seconds overall. Should a queue still be full by then, the events in it are
+        dead-lettered to make room for telling its workers to stop
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for webhook in self.webhooks:
+            for _ in range(webhook.workers):
+                self._stop_worker(webhook, deadline)
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+        self._threads = []
+
+    def _stop_worker(self, webhook: Webhook, deadline: Optional[float]) -> None:
+        """ Tell a worker of a webhook to stop, waiting until the deadline for room in its queue """
+
+        try:
+            webhook.queue.put(_STOP, timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+            return
+        except queue.Full:
+            pass
+
+        items = []
+        while True:
+            try:
+                items.append(webhook.queue.get_nowait())
+            except queue.Empty:
+                break
+        events = [i for i in items if i is not _STOP]
+        if events:
+            self.dead_letter(webhook, events, "shutting down")
+        # Put back the stops meant for other workers, along with this one
+        for _ in range(len(items) - len(events) + 1):
+            webhook.queue.put_nowait(_STOP)
+
+    def deliver(self, webhook: Webhook, events: List[Dict[str, Any]], session: Any) -> None:
+        """ Send a batch of events, retrying with exponential backoff, or dead-letter it """
+
+        error = ""
+        for attempt in range(webhook.max_retries + 1):
+            if attempt:
+                time.sleep(webhook.backoff * 2 ** (attempt - 1))
+            try:
+                r = session.post(
+                    webhook.url,
+                    data=dumps({"events": events}),
+                    headers={"Content-Type": "application/json"},
+                    timeout=webhook.timeout,
+                )
+                if r.status_code < 300:
+                    logger.debug("Sent %s events to webhook %s", len(events), webhook.name)
+                    return
+                error = f"HTTP {r.status_code}"
+            except self._requests.RequestException as err:
+                error = str(err)
+
+            logger.warning("Error sending events to webhook %s (attempt %s): %s", webhook.name, attempt + 1, error)
+
+        self.dead_letter(webhook, events, error)
+
+    def dead_letter(self, webhook: Webhook, events: List[Dict[str, Any]], error: str) -> None:
+        """ Keep events that could not be delivered """
+
+        logger.error("Giving up on sending %s events to webhook %s: %s", len(events), webhook.name, error)
+        entry = dumps({"webhook": webhook.name, "error": error, "timestamp": int(time.time()), "events": events})
+        try:
+            self.db.push(DEAD_LETTER_KEY, entry)
+        except Exception as err:
+            logger.error("Error dead-lettering events for webhook %s: %s", webhook.name, err)
+
+    def replay_dead_letters(self) -> int:
+        """ Try to deliver all dead-lettered events once more. Returns the number of batches replayed """
+
+        by_name = {w.name: w for w in self.webhooks}
+        session = self._requests.Session()
+        count = 0
+        for _ in range(self.db.list_length(DEAD_LETTER_KEY)):
+            entry = self.db.pop(DEAD_LETTER_KEY)
+            if entry is None:
+                break
+
+            data = loads(entry)
+            webhook = by_name.get(data["webhook"])
+            if webhook is None:
+                logger.warning("Dropping events for webhook %s, which is no longer configured", data["webhook"])
+                continue
+            self.deliver(webhook, data["events"], session)
+            count += 1
+        return count
+
+    def _next_batch(self, webhook: Webhook) -> Optional[List[Dict[str, Any]]]:
+        """ Wait for events, and collect up to a batch of them. None when asked to stop """
+
+        item = webhook.queue.get()
+        if item is _STOP:
+            return None
+
+        batch = [item]
+        deadline = time.monotonic() + webhook.batch_wait
+        while len(batch) < webhook.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = webhook.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Let the worker finish this batch, and then stop
+                webhook.queue.put(_STOP)
+                break
+            batch.append(item)
+
+        return batch
+
+    def _run(self, webhook: Webhook) -> None:
+        """ Worker thread loop """
+
+        session = self._requests.Session()
+        while True:
+            batch = self._next_batch(webhook)
+            if batch is None:
+                return
+            try:
+                self.deliver(webhook, batch, session)
+            except Exception:
+                logger.exception("Unexpected error delivering to webhook %s", webhook.name)
+
+
+def create_webhook_dispatcher(db: DataStore) -> Optional[WebhookDispatcher]:
+    """ Create a dispatcher for the configured webhooks, if any """
+
+    webhooks = configured_webhooks(db.cfg)
+    if not webhooks:
+        return None
+
+    logger.info("Dispatching events to webhooks: %s", ", ".join(w.name for w in webhooks))
+    dispatcher = WebhookDispatcher(webhooks, db)
+    dispatcher.start()
+    return dispatcher
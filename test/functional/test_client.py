@@ -1,9 +1,13 @@
+import socket
+
 import pytest
+import requests
 from pytest_localserver.http import WSGIServer
 
 from simon_says.app import create_app
 from simon_says.client import Client
 from simon_says.helpers import redis_present
+from simon_says.retry import CircuitBreaker, CircuitOpenError, RetryPolicy
 
 #
 # To run a redis instance locally for testing:
@@ -67,3 +71,140 @@ def test_client_get_sensors(test_client):
     sensor = test_client.get_sensor("0")
     assert sensor["name"] == "nothing"
     assert sensor["state"] == "closed"
+
+
+def test_client_honors_retry_after():
+    responses = [("429 Too Many Requests", [("Retry-After", "0")]), ("201 Created", [])]
+
+    def app(environ, start_response):
+        environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+        status, headers = responses.pop(0)
+        start_response(status, headers + [("Content-Type", "application/json")])
+        return [b'{"result": "OK"}']
+
+    server = WSGIServer(application=app)
+    server.start()
+    try:
+        assert Client(server.url).add_event(data={})["result"] == "OK"
+        assert not responses
+
+        # Give up when told to wait longer than we are willing to
+        responses.extend([("503 Service Unavailable", [("Retry-After", "120")])])
+        with pytest.raises(RuntimeError):
+            Client(server.url).add_event(data={})
+    finally:
+        server.stop()
+
+
+def test_client_retries_idempotent_requests():
+    statuses = ["502 Bad Gateway", "200 OK", "502 Bad Gateway", "200 OK"]
+    methods = []
+
+    def app(environ, start_response):
+        environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+        methods.append(environ["REQUEST_METHOD"])
+        start_response(statuses.pop(0), [("Content-Type", "application/json")])
+        return [b'{"result": "OK"}']
+
+    server = WSGIServer(application=app)
+    server.start()
+    try:
+        client = Client(server.url, retry_policy=RetryPolicy(backoff=0.01))
+        assert client.get_version()["result"] == "OK"
+        assert methods == ["GET", "GET"]
+
+        # POSTs might have been handled before the gateway failed, so they are not sent again
+        with pytest.raises(RuntimeError):
+            client.add_event(data={})
+        assert methods == ["GET", "GET", "POST"]
+    finally:
+        server.stop()
+
+
+def test_client_circuit_breaker():
+    # A port nothing listens on, for as long as the socket is bound
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+    client = Client(url, retry_policy=RetryPolicy(max_retries=2, backoff=0.01), breaker=CircuitBreaker(3))
+    # Nothing listens, so the requests never reach the API and even POSTs are retried
+    with pytest.raises(requests.ConnectionError):
+        client.add_event(data={})
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    # Then requests fail fast
+    with pytest.raises(CircuitOpenError):
+        client.get_version()
+    sock.close()
+
+
+def test_client_circuit_breaker_unexpected_error(monkeypatch):
+    client = Client("http://127.0.0.1:1", breaker=CircuitBreaker(1, reset_timeout=0))
+    client.breaker.record_failure()
+
+    def request(*args, **kwargs):
+        raise requests.exceptions.InvalidHeader("Invalid header")
+
+    monkeypatch.setattr(client._session, "request", request)
+    # The trial request fails some other way, and the circuit opens again rather than waiting for it
+    with pytest.raises(requests.exceptions.InvalidHeader):
+        client.get_version()
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+
+def test_client_circuit_breaker_load_shedding():
+    def app(environ, start_response):
+        environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+        start_response("503 Service Unavailable", [("Retry-After", "120"), ("Content-Type", "application/json")])
+        return [b'{"result": "busy"}']
+
+    server = WSGIServer(application=app)
+    server.start()
+    try:
+        client = Client(server.url, breaker=CircuitBreaker(1))
+        with pytest.raises(RuntimeError):
+            client.get_version()
+        # The API asked us to come back later, which is not a failure
+        assert client.breaker.state == CircuitBreaker.CLOSED
+        assert client.breaker.failures == 0
+    finally:
+        server.stop()
+
+
+def test_client_circuit_breaker_interrupted(monkeypatch):
+    client = Client("http://127.0.0.1:1", breaker=CircuitBreaker(1))
+
+    def request(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(client._session, "request", request)
+    with pytest.raises(KeyboardInterrupt):
+        client.get_version()
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_client_adaptive_timeouts(monkeypatch):
+    client = Client("http://127.0.0.1:1")
+    timeouts = []
+
+    def request(method, url, timeout, **kwargs):
+        timeouts.append((method, timeout[1]))
+        response = requests.Response()
+        response.status_code = 201 if method == "POST" else 200
+        response._content = b'{"result": "OK"}'
+        return response
+
+    monkeypatch.setattr(client._session, "request", request)
+    for _ in range(10):
+        client.get_event("12abcd")
+        client.add_event(data={})
+    client.get_event("34efgh")
+    client.get_events()
+
+    # Requests to the same route share a timeout, whatever their parameters
+    assert timeouts[-2][1] < 10
+    # Not other routes
+    assert timeouts[-1][1] == 10
+    # Nor requests that can't be sent again after timing out early
+    assert {t for m, t in timeouts if m == "POST"} == {10}
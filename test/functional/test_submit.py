@@ -0,0 +1,109 @@
+import socketserver
+import subprocess
+import sys
+import threading
+
+import pytest
+from pytest_localserver.http import WSGIServer
+
+from simon_says.app import create_app
+from simon_says.events import EventStore
+from simon_says.helpers import redis_present
+from simon_says.submit import HTTPSubmitter, StoreSubmitter
+
+pytestmark = pytest.mark.skipif(not redis_present(), reason="redis not present")
+
+
+@pytest.fixture
+def test_server(request, test_controller, test_config):
+    server = WSGIServer(application=create_app(config=test_config, controller=test_controller))
+    server.start()
+    request.addfinalizer(server.stop)
+    return server
+
+
+def test_submit_events(test_server, test_parsed_events, test_db):
+    store = EventStore(db=test_db)
+    submitter = HTTPSubmitter(test_server.url)
+
+    for rec in test_parsed_events:
+        if store.get(rec["uid"]):
+            store.delete(rec["uid"])
+        submitter.submit(data=rec)
+        assert store.get(rec["uid"]).uid == rec["uid"]
+
+    # Submitting the same event twice is rejected by the API
+    with pytest.raises(RuntimeError):
+        submitter.submit(data=test_parsed_events[0])
+
+    submitter.close()
+
+
+def test_handler_imports_are_light():
+    code = "import sys, simon_says.parser, simon_says.submit; print(' '.join(sys.modules))"
+    modules = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout.split()
+    for heavy in ("pydantic", "redis", "requests", "falcon"):
+        assert heavy not in modules
+
+
+def test_submit_over_unix_socket(tmp_path, test_parsed_events, test_db, test_controller, test_config):
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+    class UnixWSGIServer(socketserver.UnixStreamServer, WSGIServer):
+        def server_bind(self):
+            socketserver.UnixStreamServer.server_bind(self)
+            self.server_name, self.server_port = "localhost", 80
+            self.setup_environ()
+
+    class Handler(WSGIRequestHandler):
+        def setup(self):
+            super().setup()
+            # Unix sockets have no peer address, which wsgiref expects
+            self.client_address = ("localhost", 0)
+
+    sock_path = str(tmp_path / "api.sock")
+    server = UnixWSGIServer(sock_path, Handler)
+    server.set_app(create_app(config=test_config, controller=test_controller))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    store = EventStore(db=test_db)
+    submitter = HTTPSubmitter(f"unix://{sock_path}")
+    try:
+        for rec in test_parsed_events:
+            if store.get(rec["uid"]):
+                store.delete(rec["uid"])
+            submitter.submit(data=rec)
+            assert store.get(rec["uid"]).uid == rec["uid"]
+    finally:
+        submitter.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_store_submitter(test_config, test_parsed_events, test_db):
+    store = EventStore(db=test_db)
+    submitter = StoreSubmitter(config=test_config)
+
+    for rec in test_parsed_events:
+        if store.get(rec["uid"]):
+            store.delete(rec["uid"])
+        submitter.submit(data=rec)
+        assert store.get(rec["uid"]).uid == rec["uid"]
+
+
+def test_store_submitter_panels(test_config, test_parsed_events, test_db):
+    # Account 5678 has a [panel:5678] section, so its events go to that panel's store
+    panel_store = EventStore(db=test_db, account=5678)
+    default_store = EventStore(db=test_db)
+    submitter = StoreSubmitter(config=test_config)
+
+    rec = dict(test_parsed_events[0], uid="5678panel", account="5678")
+    if panel_store.get(rec["uid"]):
+        panel_store.delete(rec["uid"])
+    try:
+        submitter.submit(data=rec)
+        assert panel_store.get(rec["uid"]).account == 5678
+        assert default_store.get(rec["uid"]) is None
+    finally:
+        panel_store.delete(rec["uid"])
@@ -1,10 +1,16 @@
+import csv
+import io
+import json
+
 import falcon
 import pytest
+import redis
 from falcon import testing
 
 from simon_says.app import create_app
-from simon_says.events import EventStore
+from simon_says.events import AlarmEvent, EventStore
 from simon_says.helpers import redis_present
+from simon_says.history import SensorHistory
 
 pytestmark = pytest.mark.skipif(not redis_present(), reason="redis not present")
 
@@ -47,6 +53,92 @@ def test_post_and_get_events(client, test_parsed_events, test_db):
     assert result["uid"] == uid
 
 
+def test_export_events(client, test_parsed_events, test_db):
+    store = EventStore(db=test_db)
+    for rec in test_parsed_events:
+        if not store.get(rec["uid"]):
+            client.simulate_post("/events", json=rec)
+
+    response = client.simulate_get("/export/events")
+    assert response.status == falcon.HTTP_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["uid"] for line in response.text.splitlines()] == ["12abcd", "34efgh"]
+
+    start = test_parsed_events[1]["timestamp"]
+    response = client.simulate_get("/export/events", params={"format": "csv", "start": start})
+    assert response.headers["content-type"] == "text/csv"
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [r["uid"] for r in rows] == ["34efgh"]
+
+    response = client.simulate_get("/export/events", params={"format": "parquet"})
+    assert response.status == falcon.HTTP_BAD_REQUEST
+
+
+def test_panel_scoped_events(client, test_parsed_events, test_db):
+    store = EventStore(db=test_db, account=5678)
+    rec = dict(test_parsed_events[1], account="5678")
+    if store.get(rec["uid"]):
+        store.delete(rec["uid"])
+
+    # Events are routed to the panel configured for their account
+    res = client.simulate_post("/events", json=rec)
+    assert res.status == falcon.HTTP_CREATED
+    assert store.get(rec["uid"]).account == 5678
+
+    response = client.simulate_get(f"/panels/5678/events/{rec['uid']}")
+    assert response.json["uid"] == rec["uid"]
+
+    # Events can't be posted to a different panel
+    res = client.simulate_post("/panels/5678/events", json=test_parsed_events[0])
+    assert res.status == falcon.HTTP_BAD_REQUEST
+
+    response = client.simulate_get("/panels/9999/events")
+    assert response.status == falcon.HTTP_NOT_FOUND
+
+    store.delete(rec["uid"])
+
+
+def test_duplicate_events(test_controller, test_config, test_parsed_events, test_db):
+    test_config.set("events", "dedup_window", "30")
+    client = testing.TestClient(create_app(config=test_config, controller=test_controller))
+    store = EventStore(db=test_db, account=5678)
+    rec = dict(test_parsed_events[1], account="5678")
+    retransmission = dict(rec, uid="retransmitted")
+    for r in (rec, retransmission):
+        if store.get(r["uid"]):
+            store.delete(r["uid"])
+    dedup_key = store.dedup_key(AlarmEvent(**rec))
+    test_db.delete(dedup_key)
+
+    assert client.simulate_post("/events", json=rec).status == falcon.HTTP_CREATED
+    res = client.simulate_post("/events", json=retransmission)
+    assert res.status == falcon.HTTP_OK
+    assert res.json == {"result": "DUPLICATE"}
+    assert store.get("retransmitted") is None
+
+    store.delete(rec["uid"])
+    test_db.delete(dedup_key)
+    test_db.delete(store.duplicates_key)
+
+
+def test_post_event_store_unavailable(client, test_parsed_events, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise redis.ConnectionError("Connection refused")
+
+    monkeypatch.setattr(EventStore, "add", unavailable)
+    # Not the event's fault, so the sender can tell it's worth retrying
+    assert client.simulate_post("/events", json=test_parsed_events[0]).status == falcon.HTTP_SERVICE_UNAVAILABLE
+    assert client.simulate_post("/events", json={"uid": "invalid"}).status == falcon.HTTP_BAD_REQUEST
+
+
+def test_get_panels(client):
+    response = client.simulate_get("/panels")
+    assert response.json == [{"account": 5678, "extension": "101"}]
+
+    response = client.simulate_get("/panels/5678/sensors")
+    assert len(response.json) == 2
+
+
 def test_controller_disarm(client, tmp_path):
     data = {"action": "disarm", "access_code": "1234"}
     resp = client.simulate_post("/control", json=data)
@@ -58,6 +150,22 @@ def test_controller_disarm(client, tmp_path):
     call_file.unlink()
 
 
+def test_controller_batch(client, tmp_path):
+    data = {"actions": ["disarm", "arm_away"], "access_code": "1234"}
+    resp = client.simulate_post("/control", json=data)
+    assert resp.status == falcon.HTTP_ACCEPTED
+
+    (call_file,) = tmp_path.iterdir()
+    lines = call_file.read_text().splitlines()
+    assert lines[5] == "Data: ww1234w1wwww2w3w9"
+    call_file.unlink()
+
+    for actions in ([], "disarm", ["disarm", "nonexistent"], ["arm_doors_and_windows", "arm_motion_sensors"]):
+        resp = client.simulate_post("/control", json={"actions": actions, "access_code": "1234"})
+        assert resp.status == falcon.HTTP_BAD_REQUEST
+    assert not list(tmp_path.iterdir())
+
+
 def test_get_sensors(client):
     response = client.simulate_get("/sensors")
     result = response.json
@@ -69,3 +177,35 @@ def test_get_one_sensor(client):
     result = response.json
     assert result["name"] == "nothing"
     assert result["state"] == "closed"
+
+
+def test_sensor_history(client, test_parsed_events, test_db, tmp_path):
+    history = SensorHistory(db=test_db)
+    store = EventStore(db=test_db)
+    test_db.delete(history.key(15))
+
+    # A trouble event opens the sensor
+    rec = dict(test_parsed_events[1], uid="history1", category="Troubles")
+    if store.get(rec["uid"]):
+        store.delete(rec["uid"])
+    res = client.simulate_post("/events", json=rec)
+    assert res.status == falcon.HTTP_CREATED
+    opened_at = rec["timestamp"]
+
+    response = client.simulate_get("/sensors/15", params={"at": opened_at})
+    assert response.json["state"] == "open"
+    response = client.simulate_get("/sensors", params={"at": opened_at - 1})
+    assert {s["state"] for s in response.json} == {"closed"}
+
+    # Disarming closes all sensors
+    client.simulate_post("/control", json={"action": "disarm", "access_code": "1234"})
+    response = client.simulate_get("/sensors/15/history", params={"start": opened_at})
+    assert [t["state"] for t in response.json] == ["open", "closed"]
+    assert response.json[0]["timestamp"] == opened_at
+
+    response = client.simulate_get("/sensors/99/history")
+    assert response.status == falcon.HTTP_NOT_FOUND
+
+    store.delete(rec["uid"])
+    for number in range(16):
+        test_db.delete(history.key(number))
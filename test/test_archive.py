@@ -0,0 +1,57 @@
+import gzip
+import shutil
+from pathlib import Path
+
+from simon_says import archive as under_test
+from simon_says.parser import EventParser
+
+CWD = Path(__file__).parent
+TEST_DATA_DIR = CWD / "data"
+
+# 2020-12-26 and 2020-12-27, UTC
+DAY1 = 1609000000
+DAY2 = DAY1 + 86400
+
+
+def test_append_and_read(tmp_path):
+    archive = under_test.SegmentArchive(tmp_path)
+    archive.append("event-a", b"first", timestamp=DAY1)
+    archive.append("event-b", b"second", timestamp=DAY1)
+    archive.append("event-c", b"third", timestamp=DAY2)
+
+    segments = archive.segments()
+    assert [s.name for s in segments] == ["events-2020-12-26.gz", "events-2020-12-27.gz"]
+    assert archive.segments(start="2020-12-27") == segments[1:]
+    assert archive.segments(end="2020-12-26") == segments[:1]
+
+    # Each file can be read on its own, or the whole segment at once
+    entries = under_test.read_index(segments[0])
+    assert [e.name for e in entries] == ["event-a", "event-b"]
+    assert under_test.read_entry(segments[0], entries[1]) == b"second"
+    assert list(under_test.iter_segment(segments[0])) == [("event-a", b"first"), ("event-b", b"second")]
+    assert gzip.decompress(segments[0].read_bytes()) == b"firstsecond"
+
+    assert archive.find("event-c") == b"third"
+    assert archive.find("event-c", end="2020-12-26") is None
+
+    out = tmp_path / "out"
+    out.mkdir()
+    assert archive.extract(segments[0], out) == 2
+    assert (out / "event-b").read_bytes() == b"second"
+
+
+def test_parser_archives_files(tmp_path, test_config):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    src.mkdir()
+    dst.mkdir()
+    for name in ("event-12abcd", "event-34efgh"):
+        shutil.copy(TEST_DATA_DIR / name, src)
+
+    parser = EventParser(config=test_config, src_dir=src, dst_dir=dst, quarantine_dir=tmp_path, archive=True)
+    assert len(parser.process_files()) == 2
+
+    # Processed files end up in a single segment and its index
+    assert not list(src.iterdir())
+    assert len(list(dst.iterdir())) == 2
+    (segment,) = under_test.SegmentArchive(dst).segments()
+    assert dict(under_test.iter_segment(segment))["event-12abcd"] == (TEST_DATA_DIR / "event-12abcd").read_bytes()
@@ -0,0 +1,102 @@
+import gzip
+import json
+
+import falcon
+import pytest
+from falcon import testing
+
+from simon_says.asgi import create_asgi_app
+from simon_says.events import EventStore
+from simon_says.helpers import redis_present
+
+pytestmark = pytest.mark.skipif(not redis_present(), reason="redis not present")
+
+
+@pytest.fixture
+def client(test_controller, test_config):
+    app = create_asgi_app(config=test_config, controller=test_controller)
+    return testing.TestClient(app)
+
+
+def test_get_version(client):
+    response = client.simulate_get("/version")
+    result = response.json
+    assert result["version"]
+
+
+def test_post_and_get_events(client, test_parsed_events, test_db):
+    store = EventStore(db=test_db)
+
+    for rec in test_parsed_events:
+        # Delete the event first if it already exists
+        if store.get(rec["uid"]):
+            store.delete(rec["uid"])
+
+        res = client.simulate_post("/events", json=rec)
+        assert res.status == falcon.HTTP_CREATED
+
+    response = client.simulate_get("/events")
+    assert response.status == falcon.HTTP_OK
+
+    result = response.json
+    assert len(result) == 2
+
+    uid = "12abcd"
+    assert result[0]["uid"] == uid
+
+    response = client.simulate_get(f"/events/{uid}")
+    assert response.json["uid"] == uid
+
+    response = client.simulate_get("/events/nonexistent")
+    assert response.status == falcon.HTTP_NOT_FOUND
+
+
+def test_export_events(client, test_parsed_events, test_db):
+    store = EventStore(db=test_db)
+    for rec in test_parsed_events:
+        if not store.get(rec["uid"]):
+            client.simulate_post("/events", json=rec)
+
+    response = client.simulate_get("/export/events")
+    assert response.status == falcon.HTTP_OK
+    assert [json.loads(line)["uid"] for line in response.text.splitlines()] == ["12abcd", "34efgh"]
+
+    response = client.simulate_get("/panels/5678/export/events", params={"format": "csv"})
+    assert response.text.splitlines()[0].startswith("uid,timestamp,")
+
+
+def test_controller_disarm(client, tmp_path):
+    data = {"action": "disarm", "access_code": "1234"}
+    resp = client.simulate_post("/control", json=data)
+    assert resp.status == falcon.HTTP_ACCEPTED
+
+    call_file = next(tmp_path.iterdir())
+    lines = call_file.read_text().splitlines()
+    assert lines[5] == "Data: ww1234w1w9"
+    call_file.unlink()
+
+
+def test_controller_missing_code(client):
+    resp = client.simulate_post("/control", json={"action": "disarm"})
+    assert resp.status == falcon.HTTP_BAD_REQUEST
+
+
+def test_get_sensors(client):
+    response = client.simulate_get("/sensors")
+    assert len(response.json) == 5
+
+    response = client.simulate_get("/sensors/0")
+    assert response.json["state"] == "closed"
+
+
+def test_response_compression(test_controller, test_config):
+    test_config.read_dict({"compression": {"min_size": "100"}})
+    client = testing.TestClient(create_asgi_app(config=test_config, controller=test_controller))
+
+    plain = client.simulate_get("/sensors")
+    compressed = client.simulate_get("/sensors", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed.content) == plain.content
+
+    stream = client.simulate_get("/export/events", headers={"Accept-Encoding": "gzip"})
+    assert gzip.decompress(stream.content) == client.simulate_get("/export/events").content
@@ -0,0 +1,70 @@
+import time
+from configparser import ConfigParser
+
+import pytest
+
+from simon_says import cache as under_test
+from simon_says.db import DataStore
+from simon_says.events import AlarmEvent, EventStore
+from simon_says.helpers import redis_present
+
+
+def test_lru():
+    cache = under_test.EventCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    # "b" was the least recently used
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "max_size": 2, "hits": 2, "misses": 1}
+
+    cache.invalidate("a")
+    assert cache.get("a") is None
+
+    # Read before an invalidation, so possibly deleted meanwhile
+    invalidations = cache.invalidations
+    cache.invalidate("d")
+    cache.put("d", 4, invalidations)
+    assert cache.get("d") is None
+    cache.put("d", 4, cache.invalidations)
+    assert cache.get("d") == 4
+
+    with pytest.raises(ValueError):
+        under_test.EventCache(max_size=0)
+
+
+def test_cache_disabled(test_config):
+    assert under_test.create_event_cache(DataStore(config=test_config)) is None
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_cached_event_store(test_config, test_db, test_parsed_events):
+    config = ConfigParser()
+    config.read_dict(test_config)
+    config.set("events", "cache_size", "10")
+    cache = under_test.create_event_cache(DataStore(config=config))
+
+    event_store = EventStore(db=test_db, account=4321, cache=cache)
+    # Another worker, without a cache of its own
+    other_store = EventStore(db=test_db, account=4321)
+
+    event = AlarmEvent(**dict(test_parsed_events[0], account=4321))
+    if event_store.get(event.uid):
+        event_store.delete(event.uid)
+    event_store.add(event)
+
+    assert event_store.get(event.uid) == event
+    assert event_store.get(event.uid) == event
+    assert [e.uid for e in event_store.get_events()] == [event.uid]
+    assert cache.hits == 2
+
+    # Deleting from any process invalidates cached copies
+    other_store.delete(event.uid)
+    for _ in range(50):
+        if not len(cache):
+            break
+        time.sleep(0.05)
+    assert event_store.get(event.uid) is None
@@ -0,0 +1,61 @@
+import gzip
+import io
+
+import pytest
+from falcon import testing
+
+from simon_says import compression as under_test
+from simon_says.app import create_app
+from simon_says.helpers import redis_present
+
+
+@pytest.mark.parametrize(
+    "header,available,expected",
+    [
+        ("gzip, deflate", ("br", "gzip"), "gzip"),
+        ("gzip, br", ("br", "gzip"), "br"),
+        ("br;q=0.5, gzip", ("br", "gzip"), "gzip"),
+        ("br", ("gzip",), None),
+        ("*", ("br", "gzip"), "br"),
+        ("gzip;q=0, *", ("gzip",), None),
+        ("identity", ("br", "gzip"), None),
+        (None, ("br", "gzip"), None),
+    ],
+)
+def test_negotiate(header, available, expected):
+    assert under_test.negotiate(header, available) == expected
+
+
+def test_compressor_streams():
+    compressor = under_test.Compressor("gzip")
+    # Each flushed chunk can be decompressed as soon as it arrives
+    first = compressor.compress(b"first") + compressor.flush()
+    assert gzip.GzipFile(fileobj=io.BytesIO(first)).read1() == b"first"
+    data = first + compressor.compress(b"second") + compressor.flush() + compressor.finish()
+    assert gzip.decompress(data) == b"firstsecond"
+
+    with pytest.raises(ValueError):
+        under_test.Compressor("compress")
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_response_compression(test_config, test_controller):
+    test_config.read_dict({"compression": {"min_size": "100"}})
+    client = testing.TestClient(create_app(config=test_config, controller=test_controller))
+
+    plain = client.simulate_get("/sensors")
+    assert "Content-Encoding" not in plain.headers
+    assert plain.headers["Vary"] == "Accept-Encoding"
+
+    compressed = client.simulate_get("/sensors", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed.content) == plain.content
+    assert len(compressed.content) < len(plain.content)
+
+    # Too small to bother
+    small = client.simulate_get("/version", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers
+
+    stream = client.simulate_get("/export/events", headers={"Accept-Encoding": "gzip"})
+    assert stream.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(stream.content) == client.simulate_get("/export/events").content
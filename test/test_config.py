@@ -0,0 +1,31 @@
+import os
+import signal
+
+from simon_says import config as under_test
+
+
+def test_sensor_names(test_config):
+    names = under_test.sensor_names(test_config)
+    assert names[15] == "front window left"
+    assert under_test.sensor_names(test_config, "sensors:5678") == {1: "garage door", 2: "kitchen window"}
+    assert under_test.sensor_names(test_config, "missing") == {}
+
+
+def test_reload_on_signal(monkeypatch):
+    monkeypatch.setattr(under_test, "_reload_callbacks", [])
+    old_handler = signal.getsignal(signal.SIGUSR1)
+
+    config = under_test.get_config()
+    assert under_test.get_config() is config
+
+    reloaded = []
+    under_test.on_reload(reloaded.append)
+    try:
+        under_test.install_reload_handler(signal.SIGUSR1)
+        os.kill(os.getpid(), signal.SIGUSR1)
+    finally:
+        signal.signal(signal.SIGUSR1, old_handler)
+
+    assert len(reloaded) == 1
+    assert reloaded[0] is under_test.get_config()
+    assert reloaded[0] is not config
@@ -1,3 +1,5 @@
+import pytest
+
 ACCESS_CODE = "1234"
 
 
@@ -26,3 +28,38 @@ def test_arm_doors_and_windows_no_delay(test_controller, tmp_path):
     lines = call_file.read_text().splitlines()
     assert lines[5] == f"Data: ww{ACCESS_CODE}w2w2w9"
     call_file.unlink()
+
+
+def test_build_batch_dtmf(test_controller):
+    # A longer pause between actions than between the tones of each one
+    dtmf = test_controller._build_batch_dtmf_sequence(["disarm", "arm_home"], access_code=ACCESS_CODE)
+    assert dtmf == "ww1234w1wwww2w2w9"
+
+    for actions in ([], ["disarm", "nonexistent"], ["disarm", "terminate"], ["disarm"] * 9):
+        with pytest.raises(ValueError):
+            test_controller._build_batch_dtmf_sequence(actions, access_code=ACCESS_CODE)
+
+
+@pytest.mark.parametrize(
+    "actions",
+    [
+        # Read as arm_doors_and_windows_and_motion_sensors
+        ["arm_doors_and_windows", "arm_motion_sensors"],
+        # Read as arm_doors_and_windows_no_delay
+        ["arm_doors_and_windows", "arm_doors_and_windows"],
+        # 2, 2 then 3 also reads as arm_doors_and_windows followed by arm_doors_and_windows_and_motion_sensors
+        ["arm_doors_and_windows_no_delay", "arm_motion_sensors"],
+        ["arm_motion_sensors", "arm_motion_sensors"],
+    ],
+)
+def test_batch_dtmf_collisions(test_controller, actions):
+    with pytest.raises(ValueError, match="Ambiguous"):
+        test_controller._build_batch_dtmf_sequence(actions, access_code=ACCESS_CODE)
+
+
+def test_send_commands(test_controller, tmp_path):
+    test_controller.send_commands(["disarm", "arm_motion_sensors"], access_code=ACCESS_CODE)
+    (call_file,) = tmp_path.iterdir()
+    lines = call_file.read_text().splitlines()
+    assert lines[5] == f"Data: ww{ACCESS_CODE}w1wwww3w9"
+    call_file.unlink()
@@ -1,5 +1,6 @@
 import pytest
 
+from simon_says import db as under_test
 from simon_says.helpers import redis_present
 
 test_data = {
@@ -23,3 +24,101 @@ def test_db_crud(test_db):
 
     all_keys = test_db.get_all_keys("test:*")
     assert len(all_keys) == 0
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_db_get_many_and_index(test_db):
+    for score, (k, v) in zip((30, 10, 20), test_data.items()):
+        test_db.add(k, v)
+        test_db.add_to_index("test_index", k, score)
+
+    assert test_db.get_many(["test:2", "missing", "test:1"]) == ["bar", None, "foo"]
+    assert test_db.exists("test_index")
+    assert test_db.range_from_index("test_index") == ["test:2", "other", "test:1"]
+    assert test_db.range_from_index("test_index", start=15, end=30) == ["other", "test:1"]
+    assert test_db.range_from_index("test_index", count=1) == ["test:2"]
+
+    for k in test_data:
+        test_db.delete(k)
+        test_db.remove_from_index("test_index", k)
+    assert not test_db.exists("test_index")
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_db_iter_index(test_db):
+    # Ties in scores span chunk boundaries
+    scores = {f"m{i:02d}": i // 4 for i in range(20)}
+    test_db.add_many_to_index("test_iter_index", scores)
+
+    chunks = list(test_db.iter_index("test_iter_index", chunk_size=3))
+    assert [len(c) for c in chunks] == [3, 3, 3, 3, 3, 3, 2]
+    assert [m for c in chunks for m in c] == sorted(scores)
+
+    members = [m for c in test_db.iter_index("test_iter_index", start=1, end=2, chunk_size=4) for m in c]
+    assert members == [f"m{i:02d}" for i in range(4, 12)]
+
+    test_db.delete("test_iter_index")
+
+
+def test_index_cursor():
+    cursor = under_test.IndexCursor(start=5)
+    assert cursor.advance([("a", 5), ("b", 5)], chunk_size=2) == ["a", "b"]
+    assert (cursor.low, cursor.skip, cursor.done) == (5, 2, False)
+    assert cursor.advance([("c", 5), ("d", 7)], chunk_size=2) == ["c", "d"]
+    assert (cursor.low, cursor.skip, cursor.done) == (7, 1, False)
+    cursor.advance([("e", 8)], chunk_size=2)
+    assert cursor.done
+
+
+def test_hash_tag():
+    assert under_test.hash_tag("account:{1234}:event:abc") == "1234"
+    assert under_test.hash_tag("event:abc") == "event:abc"
+    assert under_test.hash_tag("event:{}:abc") == "event:{}:abc"
+
+
+def test_hash_ring():
+    ring = under_test.HashRing([("a", "node-a"), ("b", "node-b"), ("c", "node-c")])
+    owners = [ring.get_node(f"event:{i}") for i in range(3000)]
+
+    # Keys are spread across all nodes, and always map to the same one
+    for node in ("node-a", "node-b", "node-c"):
+        assert owners.count(node) > 500
+    assert owners == [ring.get_node(f"event:{i}") for i in range(3000)]
+
+    # Hash-tagged keys stay together
+    assert len({ring.get_node(f"account:{{1234}}:event:{i}") for i in range(100)}) == 1
+
+
+def test_parse_nodes():
+    assert under_test.parse_nodes("redis1:6379, redis2:6380,") == [("redis1", 6379), ("redis2", 6380)]
+
+
+def test_colocated(test_config):
+    test_config.read_dict({"data_store": {"redis_nodes": "redis1:6379, redis2:6379, redis3:6379"}})
+    db = under_test.DataStore(config=test_config)
+    assert db.colocated(["account:{1234}:event:abc", "account:{1234}:event_index"])
+    assert not all(db.colocated([f"event:{i}", "event_index"]) for i in range(100))
+
+    # A single node holds all keys, but in a cluster they also need a hash tag
+    test_config.read_dict({"data_store": {"redis_nodes": ""}})
+    assert under_test.DataStore(config=test_config).colocated(["event:abc", "event_index"])
+    # Cluster clients connect right away, so skip the constructor
+    cluster = under_test.DataStore.__new__(under_test.DataStore)
+    cluster._cluster = True
+    assert not cluster.colocated(["event:abc", "event_index"])
+    assert cluster.colocated(["account:{1234}:event:abc", "account:{1234}:event_index"])
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_db_add_new_and_scripts(test_db):
+    assert test_db.add_new("test:new", "foo")
+    assert not test_db.add_new("test:new", "bar")
+    assert test_db.get("test:new") == "foo"
+
+    script = 'return redis.call("SET", KEYS[1], ARGV[1], "NX") and 1 or 0'
+    calls = [(["test:new"], ["baz"]), (["test:other"], ["baz"])]
+    assert test_db.run_script_many(script, calls) == [0, 1]
+    assert test_db.get_many(["test:new", "test:other"]) == ["foo", "baz"]
+
+    test_db.delete("test:new")
+    test_db.delete("test:other")
@@ -1,10 +1,12 @@
 import json
+from configparser import ConfigParser
 from pathlib import Path
 
 import pytest
 
 from simon_says import events as under_test
-from simon_says.ademco import EVENT_CATEGORIES
+from simon_says.ademco import CODE_TABLE, CODES, EVENT_CATEGORIES, checksum_valid
+from simon_says.db import DataStore
 from simon_says.helpers import redis_present
 
 CWD = Path(__file__).parent
@@ -42,6 +44,13 @@ def test_event(test_parsed_events):
         assert json.loads(event.to_json())
 
 
+def test_event_from_trusted(test_parsed_events):
+    for r in test_parsed_events:
+        event = under_test.AlarmEvent(**r)
+        trusted = under_test.AlarmEvent.from_trusted(json.loads(event.to_json()))
+        assert trusted == event
+
+
 @pytest.mark.skipif(not redis_present(), reason="redis not present")
 def test_event_store(test_parsed_events, test_db):
 
@@ -68,11 +77,101 @@ def test_event_store(test_parsed_events, test_db):
     events = event_store.get_events()
     assert len(events) == 2
 
+    # Get events within a time range
+    events = event_store.get_events(start=events[1].timestamp)
+    assert [e.uid for e in events] == ["34efgh"]
+
+    # The index can be rebuilt from the stored events
+    test_db.delete(event_store.index_key)
+    assert event_store.reindex() == 2
+
     # Clean up
     for r in test_parsed_events:
         event_store.delete(r["uid"])
 
 
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_event_store_indexes_legacy_events(test_parsed_events, test_db):
+    event_store = under_test.EventStore(db=test_db, account=4444)
+    legacy, new = (under_test.AlarmEvent(**dict(r, account="4444")) for r in test_parsed_events)
+    for key in (event_store.index_key, event_store.index_built_key, event_store.obj_key(new.uid)):
+        test_db.delete(key)
+
+    # Stored before the index existed, and not indexed since
+    test_db.add(event_store.obj_key(legacy.uid), legacy.to_json())
+    event_store.add(new)
+    assert sorted(e.uid for e in event_store.get_events()) == sorted([legacy.uid, new.uid])
+
+    # Only indexed once
+    test_db.delete(event_store.index_key)
+    assert under_test.EventStore(db=test_db, account=4444).get_events() == []
+
+    for key in (event_store.index_key, event_store.index_built_key):
+        test_db.delete(key)
+    for uid in (legacy.uid, new.uid):
+        test_db.delete(event_store.obj_key(uid))
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_event_store_dedup(test_parsed_events, test_config):
+    config = ConfigParser()
+    config.read_dict(test_config)
+    config.set("events", "dedup_window", "30")
+    db = DataStore(config=config)
+    event_store = under_test.EventStore(db=db, account=4321)
+
+    event = under_test.AlarmEvent(**dict(test_parsed_events[1], account=4321))
+    retransmission = event.copy(update={"uid": "retransmitted", "timestamp": event.timestamp + 5})
+    later = event.copy(update={"uid": "later", "timestamp": event.timestamp + 60})
+    for e in (event, retransmission, later):
+        if event_store.get(e.uid):
+            event_store.delete(e.uid)
+    db.delete(event_store.dedup_key(event))
+    db.delete(event_store.duplicates_key)
+
+    assert event_store.add(event)
+    assert not event_store.add(retransmission)
+    assert event_store.get(retransmission.uid) is None
+    assert event_store.duplicate_count() == 1
+
+    # Outside the window, the same report is a new event
+    assert event_store.add(later)
+    assert [e.uid for e in event_store.get_events()] == [event.uid, later.uid]
+
+    for e in (event, later):
+        event_store.delete(e.uid)
+    db.delete(event_store.dedup_key(event))
+    db.delete(event_store.duplicates_key)
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_event_store_failed_write(test_parsed_events, test_config, monkeypatch):
+    config = ConfigParser()
+    config.read_dict(test_config)
+    config.set("events", "dedup_window", "30")
+    db = DataStore(config=config)
+    event_store = under_test.EventStore(db=db, account=4321)
+    event = under_test.AlarmEvent(**dict(test_parsed_events[1], account=4321))
+    db.delete(event_store.dedup_key(event))
+
+    def fail(key, value):
+        raise ConnectionError()
+
+    # Keys on different nodes are written a step at a time
+    monkeypatch.setattr(db, "colocated", lambda keys: False)
+    with monkeypatch.context() as m:
+        m.setattr(db, "add_new", fail)
+        with pytest.raises(ConnectionError):
+            event_store.add(event)
+
+    # The retry is not taken for a retransmission, and the event is indexed
+    assert event_store.add(event)
+    assert [e.uid for e in event_store.get_events()] == [event.uid]
+
+    event_store.delete(event.uid)
+    db.delete(event_store.dedup_key(event))
+
+
 @pytest.mark.parametrize(
     "test_input,expected",
     [
@@ -86,3 +185,64 @@ def test_event_store(test_parsed_events, test_db):
 )
 def test_event_category(test_input, expected):
     assert under_test.EventParser._get_event_category(test_input) == expected
+
+
+def test_code_table():
+    assert len(CODE_TABLE) == 1000
+    for code, info in CODES.items():
+        assert CODE_TABLE[int(code)].name == info["name"]
+        assert CODE_TABLE[int(code)].type == info["type"]
+
+    assert CODE_TABLE[42].category == "Unknown"
+    assert CODE_TABLE[999].name == "Unknown"
+
+
+@pytest.mark.parametrize(
+    "message,expected",
+    [
+        ("1234181601000003", True),
+        ("1234181131010158", True),
+        ("1234181131010157", False),
+        ("1234181131010", False),
+        ("12341811310101A8", False),
+    ],
+)
+def test_checksum_valid(message, expected):
+    assert checksum_valid(message) == expected
+
+
+def test_reject_bad_files(tmp_path, test_config):
+    src_dir, dst_dir, quarantine_dir = (tmp_path / d for d in ("src", "dst", "quarantine"))
+    for d in (src_dir, dst_dir, quarantine_dir):
+        d.mkdir()
+
+    good = (TEST_DATA_DIR / "event-12abcd").read_text()
+    (src_dir / "event-good").write_text(good)
+    (src_dir / "event-badsum").write_text(good.replace("1234181601000003", "1234181601000004"))
+    (src_dir / "event-unknown").write_text(good.replace("1234181601000003", "1234181999000008"))
+
+    parser = under_test.EventParser(
+        config=test_config, src_dir=src_dir, dst_dir=dst_dir, quarantine_dir=quarantine_dir
+    )
+    records = sorted(parser.process_files(), key=lambda r: r["uid"])
+    assert [r["uid"] for r in records] == ["good", "unknown"]
+    assert records[1]["code_description"] == "Unknown"
+    assert records[1]["sensor"] is None
+
+    assert sorted(p.name for p in dst_dir.iterdir()) == ["event-good", "event-unknown"]
+    assert [p.name for p in quarantine_dir.iterdir()] == ["event-badsum"]
+    assert not list(src_dir.iterdir())
+
+
+def test_sensor_names_per_account(tmp_path, test_config):
+    src_dir = tmp_path / "src"
+    src_dir.mkdir()
+    event = (TEST_DATA_DIR / "event-12abcd").read_text()
+    (src_dir / "event-5678").write_text(event.replace("1234181601000003", "5678181131000027"))
+    (src_dir / "event-1234").write_text(event.replace("1234181601000003", "1234181131000028"))
+
+    parser = under_test.EventParser(config=test_config, src_dir=src_dir, dst_dir=tmp_path, quarantine_dir=tmp_path)
+    records = {r["account"]: r for r in parser.process_files()}
+    # Named after the panel's own [sensors:5678] section, and [sensors] for the others
+    assert records["5678"]["sensor_name"] == "kitchen window"
+    assert records["1234"]["sensor_name"] == "garage door"
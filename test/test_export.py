@@ -0,0 +1,43 @@
+import csv
+import io
+import json
+
+import pytest
+
+from simon_says import export as under_test
+from simon_says.events import AlarmEvent
+
+
+@pytest.fixture
+def event_chunks(test_parsed_events):
+    events = [AlarmEvent(**r) for r in test_parsed_events]
+    return [events[:1], events[1:], []]
+
+
+def test_encode_ndjson(event_chunks):
+    data = b"".join(under_test.encode_chunks("ndjson", event_chunks))
+    assert [json.loads(line)["uid"] for line in data.splitlines()] == ["12abcd", "34efgh"]
+
+
+def test_encode_csv(event_chunks):
+    data = b"".join(under_test.encode_chunks("csv", event_chunks))
+    rows = list(csv.DictReader(io.StringIO(data.decode())))
+    assert list(rows[0]) == under_test.EXPORT_FIELDS
+    assert [(r["uid"], r["sensor_name"]) for r in rows] == [("12abcd", "nothing"), ("34efgh", "front window left")]
+
+    # The header is there even with no events
+    assert b"".join(under_test.encode_chunks("csv", [])).decode().startswith("uid,timestamp,")
+
+
+def test_write_parquet(event_chunks, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    path = tmp_path / "events.parquet"
+    assert under_test.write_parquet(iter(event_chunks), path) == 2
+
+    table = pq.read_table(path)
+    assert table.column("uid").to_pylist() == ["12abcd", "34efgh"]
+    assert table.column("sensor").to_pylist() == [0, 15]
+    # Optional[int] fields are integers too, and the rest strings
+    assert str(table.schema.field("sensor").type) == "int64"
+    assert str(table.schema.field("sensor_name").type) == "string"
@@ -0,0 +1,54 @@
+import pytest
+
+from simon_says import history as under_test
+from simon_says.helpers import redis_present
+from simon_says.sensors import SensorState
+
+pytestmark = pytest.mark.skipif(not redis_present(), reason="redis not present")
+
+
+@pytest.fixture
+def sensor_history(test_db):
+    history = under_test.SensorHistory(db=test_db, account=4321)
+    yield history
+    for number in (1, 2, 3):
+        test_db.delete(history.key(number))
+
+
+def test_key():
+    assert under_test.SensorHistory(db=None).key(3) == "sensor_history:3"
+    assert under_test.SensorHistory(db=None, account=4321).key(3) == "account:{4321}:sensor_history:3"
+
+
+def test_sensor_history(sensor_history):
+    sensor_history.record([1], SensorState.OPEN, 100)
+    sensor_history.record([2], SensorState.OPEN, 150)
+    sensor_history.record([1, 2], SensorState.CLOSED, 200)
+    sensor_history.record([1], SensorState.OPEN, 300)
+
+    assert sensor_history.states_at([1, 2, 3], at=99) == {1: None, 2: None, 3: None}
+    assert sensor_history.states_at([1, 2, 3], at=150) == {1: SensorState.OPEN, 2: SensorState.OPEN, 3: None}
+    assert sensor_history.states_at([1, 2], at=250) == {1: SensorState.CLOSED, 2: SensorState.CLOSED}
+    assert sensor_history.states_at([1, 2]) == {1: SensorState.OPEN, 2: SensorState.CLOSED}
+
+    assert sensor_history.transitions(1) == [
+        (100, SensorState.OPEN),
+        (200, SensorState.CLOSED),
+        (300, SensorState.OPEN),
+    ]
+    assert sensor_history.transitions(1, start=150, end=250) == [(200, SensorState.CLOSED)]
+
+
+def test_sensor_history_same_second(sensor_history):
+    sensor_history.record([1], SensorState.OPEN, 100)
+    sensor_history.record([1], SensorState.CLOSED, 100)
+    sensor_history.record([2], SensorState.CLOSED, 100)
+    sensor_history.record([2], SensorState.OPEN, 100)
+
+    assert sensor_history.states_at([1, 2], at=100) == {1: SensorState.CLOSED, 2: SensorState.OPEN}
+    assert sensor_history.transitions(1) == [(100, SensorState.OPEN), (100, SensorState.CLOSED)]
+
+
+def test_sensor_history_old_members(sensor_history, test_db):
+    test_db.add_to_index(sensor_history.key(1), "100:open", 100)
+    assert sensor_history.states_at([1]) == {1: SensorState.OPEN}
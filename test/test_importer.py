@@ -0,0 +1,104 @@
+import shutil
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from simon_says import importer as under_test
+from simon_says.archive import SegmentArchive
+from simon_says.events import EventStore
+from simon_says.helpers import redis_present
+
+CWD = Path(__file__).parent
+TEST_DATA_DIR = CWD / "data"
+TEST_UIDS = ["12abcd", "34efgh"]
+
+
+@pytest.fixture
+def archive_dir(tmp_path):
+    path = tmp_path / "archive"
+    path.mkdir()
+    for uid in TEST_UIDS:
+        shutil.copy(TEST_DATA_DIR / f"event-{uid}", path)
+    # Neither of these should be imported
+    (path / "event-empty").touch()
+    (path / "notes.txt").write_text("not an event")
+    return path
+
+
+@pytest.fixture
+def clean_event_store(test_db):
+    event_store = EventStore(db=test_db)
+    for uid in TEST_UIDS:
+        event_store.delete(uid)
+    yield event_store
+    for uid in TEST_UIDS:
+        event_store.delete(uid)
+
+
+def test_iter_directory(archive_dir):
+    files = list(under_test.iter_directory(archive_dir))
+    assert [name for name, _ in files] == ["event-12abcd", "event-34efgh", "event-empty"]
+    assert files[0][1] == (archive_dir / "event-12abcd").read_bytes()
+    assert files[2][1] == b""
+
+
+def test_iter_directory_skip(archive_dir, monkeypatch):
+    read = []
+    monkeypatch.setattr(under_test, "read_file", lambda path: read.append(path.name) or b"")
+
+    # Files imported by a previous run are not even read
+    assert [name for name, _ in under_test.iter_directory(archive_dir, skip=2)] == ["event-empty"]
+    assert read == ["event-empty"]
+
+
+def test_iter_tarball(archive_dir, tmp_path):
+    tarball = tmp_path / "archive.tar.gz"
+    with tarfile.open(tarball, "w:gz") as tar:
+        tar.add(archive_dir, arcname="alarm_events_processed")
+
+    names = sorted(name for name, _ in under_test.iter_tarball(tarball))
+    assert names == ["event-12abcd", "event-34efgh", "event-empty"]
+    assert len(list(under_test.iter_tarball(tarball, skip=2))) == 1
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_import_archive_segment(archive_dir, test_config, test_db, clean_event_store):
+    archive = SegmentArchive(archive_dir)
+    for uid in TEST_UIDS:
+        archive.append(f"event-{uid}", (archive_dir / f"event-{uid}").read_bytes())
+    (segment,) = archive.segments()
+
+    state = under_test.EventImporter(config=test_config, db=test_db).run(segment)
+    assert (state.processed, state.imported, state.rejected) == (2, 2, 0)
+    assert [e.uid for e in clean_event_store.get_events()] == TEST_UIDS
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_import(archive_dir, tmp_path, test_config, test_db, clean_event_store):
+    state_file = tmp_path / "state.json"
+    importer = under_test.EventImporter(config=test_config, db=test_db, batch_size=2, state_file=state_file)
+
+    state = importer.run(archive_dir)
+    assert (state.processed, state.imported, state.rejected) == (3, 2, 1)
+    assert [e.uid for e in clean_event_store.get_events()] == ["12abcd", "34efgh"]
+
+    # Nothing left to do when resuming a finished import
+    state = importer.run(archive_dir)
+    assert (state.processed, state.imported, state.rejected) == (3, 2, 1)
+
+    # Importing again from scratch skips existing events
+    state_file.unlink()
+    state = importer.run(archive_dir)
+    assert (state.processed, state.imported, state.rejected) == (3, 0, 1)
+
+
+def test_import_state_source_mismatch(archive_dir, tmp_path):
+    state_file = tmp_path / "state.json"
+    state = under_test.ImportState(state_file, archive_dir)
+    state.processed = 1
+    state.save()
+
+    assert under_test.ImportState(state_file, archive_dir).processed == 1
+    with pytest.raises(ValueError):
+        under_test.ImportState(state_file, tmp_path)
@@ -0,0 +1,83 @@
+import pytest
+
+from simon_says import loadgen as under_test
+from simon_says.ademco import checksum_valid
+from simon_says.helpers import redis_present
+from simon_says.parser import EventParser
+from simon_says.submit import StoreSubmitter
+
+
+@pytest.mark.parametrize("code,zone", [(131, z) for z in range(20)] + [(401, 3), (601, 0)])
+def test_contact_id_message(code, zone):
+    message = under_test.contact_id_message(1234, 1, code, 1, zone)
+    assert checksum_valid(message)
+    assert message.startswith(f"1234181{code}01")
+
+
+def test_event_file_contents(test_config, tmp_path):
+    message = under_test.contact_id_message(1234, 3, 131, 1, 15)
+    contents = under_test.event_file_contents(message, 1609000000)
+
+    parser = EventParser(config=test_config, src_dir=tmp_path, dst_dir=tmp_path, move_files=False)
+    event = parser.parse_bytes("event-abc", contents.encode())
+    assert event["uid"] == "abc"
+    assert event["timestamp"] == 1609000000
+    assert event["code"] == 131
+    assert event["sensor"] == 15
+
+
+def test_percentiles():
+    assert under_test.percentiles([]) == {}
+    values = [i / 100 for i in range(1, 101)]
+    assert under_test.percentiles(values) == {"p50": 0.5, "p90": 0.9, "p99": 0.99, "max": 1.0}
+    summary = under_test.format_latencies("test", [0.5])
+    assert summary == "test: 1 samples, p50=500.0ms, p90=500.0ms, p99=500.0ms, max=500.0ms"
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_load_generator(test_config, test_db, tmp_path):
+    spool = tmp_path / "spool"
+    processed = tmp_path / "processed"
+    spool.mkdir()
+    processed.mkdir()
+    generator = under_test.LoadGenerator(config=test_config, db=test_db, spool_dir=spool, seed=1)
+    uids = [generator.write_event() for _ in range(3)]
+    assert sorted(p.name for p in spool.iterdir()) == sorted(f"event-{uid}" for uid in uids)
+    assert generator.poll() == 0
+
+    # Stand in for the event handler
+    parser = EventParser(config=test_config, src_dir=spool, dst_dir=processed, move_files=False)
+    submitter = StoreSubmitter(config=test_config)
+    for rec in parser.process_files():
+        submitter.submit(rec)
+
+    assert generator.poll() == 3
+    assert generator.pending == 0
+    assert len(generator.latencies) == 3
+
+    generator.cleanup()
+    assert test_db.get_many([generator.event_store.obj_key(uid) for uid in uids]) == [None] * 3
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_call_file_consumer(test_controller):
+    consumer = under_test.CallFileConsumer(test_controller.spool_dir)
+    test_controller.disarm(access_code="1234")
+    test_controller.arm_away(access_code="1234")
+
+    assert consumer.consume() == 2
+    assert len(consumer.latencies) == 2
+    assert not list(test_controller.spool_dir.glob("*.call"))
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_load_generator_unique_events(test_config, test_db, tmp_path):
+    test_config.read_dict({"events": {"dedup_window": "60"}})
+    generator = under_test.LoadGenerator(config=test_config, db=test_db, spool_dir=tmp_path, seed=1)
+    for _ in range(2000):
+        generator.write_event()
+
+    # None of them would be skipped as a retransmission of another
+    messages = [p.read_text().split("[events]")[1].strip() for p in tmp_path.iterdir()]
+    assert len({m[:-1] for m in messages}) == 2000
+    assert generator.duplicates == 0
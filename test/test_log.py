@@ -0,0 +1,94 @@
+import json
+import logging
+import sys
+import threading
+
+import pytest
+from falcon import testing
+
+from simon_says import log as under_test
+from simon_says.app import create_app
+from simon_says.helpers import redis_present
+
+
+class RecordingHandler(logging.Handler):
+    """ Keep formatted records, and the threads that formatted them """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.lines = []
+        self.threads = set()
+
+    def emit(self, record):
+        self.threads.add(threading.current_thread().name)
+        self.lines.append(self.format(record))
+
+
+@pytest.fixture
+def root_handlers():
+    root = logging.getLogger()
+    handlers, level = root.handlers, root.level
+    yield
+    under_test.stop_logging()
+    root.handlers, root.level = handlers, level
+
+
+def test_json_formatter():
+    logger = logging.getLogger("test_json")
+    record = logger.makeRecord("test_json", logging.INFO, __file__, 1, "Event %s", ("abc",), None, extra={"uid": "abc"})
+    data = json.loads(under_test.JSONFormatter().format(record))
+    assert data["level"] == "INFO"
+    assert data["logger"] == "test_json"
+    assert data["message"] == "Event abc"
+    assert data["uid"] == "abc"
+    assert "exception" not in data
+
+    try:
+        raise ValueError("bad")
+    except ValueError:
+        record = logger.makeRecord("test_json", logging.ERROR, __file__, 1, "Failed", (), sys.exc_info())
+    assert "ValueError: bad" in json.loads(under_test.JSONFormatter().format(record))["exception"]
+
+
+def test_queued_logging(root_handlers):
+    handler = RecordingHandler()
+    under_test.configure_logging("INFO", handlers=[handler], json_format=True, queued=True)
+
+    logging.getLogger("test_queued").info("Queued %s", 1)
+    logging.getLogger("test_queued").debug("Not logged")
+    under_test.stop_logging()
+
+    assert [json.loads(line)["message"] for line in handler.lines] == ["Queued 1"]
+    # Records are formatted by the listener, not the thread that logged them
+    assert threading.current_thread().name not in handler.threads
+    assert logging.getLogger().handlers == [handler]
+
+
+def test_reconfigure_queued_logging(root_handlers):
+    first, second = RecordingHandler(), RecordingHandler()
+    under_test.configure_logging("INFO", handlers=[first], queued=True)
+    under_test.configure_logging("INFO", handlers=[second], queued=True)
+
+    logging.getLogger("test_queued").warning("Only once")
+    under_test.stop_logging()
+    assert first.lines == []
+    assert second.lines == ["Only once"]
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_log_sampling(root_handlers, test_config, test_controller):
+    test_config.read_dict({"log_sampling": {"events": "0"}})
+    app = create_app(config=test_config, controller=test_controller)
+    handler = RecordingHandler()
+    under_test.configure_logging("INFO", handlers=[handler], queued=True)
+    client = testing.TestClient(app)
+
+    client.simulate_get("/events")
+    client.simulate_get("/events/nonexistent")
+    client.simulate_get("/sensors")
+    under_test.stop_logging()
+
+    # INFO records of the sampled out route are dropped, but not its errors, nor other routes' records
+    assert "Getting all events" not in handler.lines
+    assert "uid nonexistent not found" in handler.lines
+    assert "Getting all sensors" in handler.lines
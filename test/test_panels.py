@@ -0,0 +1,56 @@
+from configparser import ConfigParser
+from functools import partial
+
+import pytest
+
+from simon_says.events import EventStore
+from simon_says.panels import Panels
+from simon_says.sensors import SensorState
+
+
+@pytest.fixture
+def test_panels(test_config, test_controller, test_db):
+    return Panels(event_store_factory=partial(EventStore, test_db), config=test_config, controller=test_controller)
+
+
+def test_panels_from_config(test_panels, test_controller):
+    assert test_panels.default.account is None
+    assert test_panels.default.controller is test_controller
+    assert len(test_panels.default.sensors.get_all_sensors()) == 5
+
+    panels = test_panels.get_all_panels()
+    assert len(panels) == 1
+
+    panel = test_panels.by_account(5678)
+    assert panel.controller.extension == "101"
+    assert panel.sensors.by_number(2).name == "kitchen window"
+    assert panel.event_store.account == 5678
+    assert panel.to_dict() == {"account": 5678, "extension": "101"}
+
+
+def test_panel_for_event_account(test_panels):
+    assert test_panels.for_event_account(5678).account == 5678
+    assert test_panels.for_event_account(1234) is test_panels.default
+
+    with pytest.raises(KeyError):
+        test_panels.by_account(1234)
+
+
+def test_panels_reload(test_panels, test_config):
+    test_panels.default.sensors.by_number(1).state = SensorState.OPEN
+    event_store = test_panels.by_account(5678).event_store
+
+    new_config = ConfigParser()
+    new_config.read_dict(test_config)
+    new_config.set("sensors", "4", "side door")
+    new_config.set("panel:5678", "extension", "102")
+    new_config.read_dict({"panel:9012": {"spool_dir": "/tmp"}})
+    test_panels.reload(new_config)
+
+    assert test_panels.default.sensors.by_number(4).name == "side door"
+    assert test_panels.default.sensors.by_number(1).state == SensorState.OPEN
+
+    panel = test_panels.by_account(5678)
+    assert panel.controller.extension == "102"
+    assert panel.event_store is event_store
+    assert test_panels.by_account(9012).event_store.account == 9012
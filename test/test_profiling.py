@@ -0,0 +1,89 @@
+import asyncio
+import json
+import pstats
+
+import pytest
+from falcon import testing
+
+from simon_says import profiling as under_test
+from simon_says.app import create_app
+from simon_says.helpers import redis_present
+
+
+@pytest.fixture
+def profiler_config(test_config, tmp_path):
+    test_config.read_dict(
+        {
+            "profiling": {
+                "enabled": "yes",
+                "sample_rate": "1",
+                "tracemalloc": "yes",
+                "slow_request_ms": "0.001",
+                "output_dir": str(tmp_path / "profiles"),
+            }
+        }
+    )
+    return test_config
+
+
+@under_test.timed("sync")
+def sync_work():
+    return sum(range(1000))
+
+
+@under_test.timed("async")
+async def async_work():
+    await asyncio.sleep(0)
+    return 1
+
+
+def test_timings_outside_captures(test_config):
+    profiler = under_test.Profiler(test_config)
+    assert not profiler.enabled
+    assert profiler.start("disabled") is None
+
+    # Timed code runs the same when nothing is being traced
+    assert sync_work() == 499500
+    with under_test.timer("block"):
+        pass
+
+    profiler.toggle()
+    assert profiler.enabled
+
+
+def test_profile(profiler_config, tmp_path):
+    profiler = under_test.Profiler(profiler_config)
+
+    with profiler.profile("GET /test") as capture:
+        sync_work()
+        assert asyncio.run(async_work()) == 1
+        with under_test.timer("block"):
+            sync_work()
+
+    assert set(capture.timings) == {"sync", "async", "block"}
+
+    # Timings are not collected once done
+    sync_work()
+    assert capture.timings["sync"] < 1
+
+    output_dir = tmp_path / "profiles"
+    prof = next(output_dir.glob("*-GET_test.prof"))
+    assert pstats.Stats(str(prof)).total_calls > 0
+    assert next(output_dir.glob("*-GET_test.tracemalloc.txt"))
+
+    trace = json.loads((output_dir / under_test.SLOW_REQUESTS_FILE).read_text())
+    assert trace["name"] == "GET /test"
+    assert {"sync", "async", "block", "other"} <= set(trace)
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_profiling_middleware(profiler_config, test_controller, tmp_path):
+    client = testing.TestClient(create_app(config=profiler_config, controller=test_controller))
+    assert client.simulate_get("/events").status_code == 200
+
+    output_dir = tmp_path / "profiles"
+    assert next(output_dir.glob("*-GET_events.prof"))
+    trace = json.loads((output_dir / under_test.SLOW_REQUESTS_FILE).read_text().splitlines()[-1])
+    assert trace["name"] == "GET /events"
+    assert trace["datastore"] > 0
+    assert trace["json"] > 0
@@ -0,0 +1,68 @@
+import uuid
+from configparser import ConfigParser
+
+import falcon
+import pytest
+from falcon import testing
+
+from simon_says import ratelimit as under_test
+from simon_says.app import create_app
+from simon_says.helpers import redis_present
+
+
+@pytest.fixture
+def rate_limit_config(test_config):
+    config = ConfigParser()
+    config.read_dict(test_config)
+    # Buckets refill slowly enough not to get a token back during the test
+    config.read_dict({"rate_limit": {"events": "0.001, 2", "control_total": "0.001, 1", "exempt_clients": "10.0.0.1"}})
+    return config
+
+
+def test_parse_limit():
+    assert under_test.parse_limit("0.5, 10") == under_test.Limit(rate=0.5, burst=10)
+    assert under_test.parse_limit("2") == under_test.Limit(rate=2, burst=1)
+    with pytest.raises(ValueError):
+        under_test.parse_limit("0, 10")
+
+
+def test_rate_limits(rate_limit_config, test_config):
+    limits = under_test.RateLimits(rate_limit_config)
+    assert limits
+    assert limits.per_client == {"events": under_test.Limit(0.001, 2)}
+    assert limits.total == {"control": under_test.Limit(0.001, 1)}
+    assert limits.exempt_clients == ["10.0.0.1"]
+
+    assert not under_test.RateLimits(test_config)
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_rate_limiter(rate_limit_config, test_controller, test_db):
+    client = testing.TestClient(create_app(config=rate_limit_config, controller=test_controller))
+    addr = f"10.{uuid.uuid4().int % 250}.0.2"
+    control = {"action": "disarm", "access_code": "1234"}
+
+    # Requests are limited per client...
+    for _ in range(2):
+        res = client.simulate_post("/events", json={}, remote_addr=addr)
+        assert res.status == falcon.HTTP_BAD_REQUEST
+    res = client.simulate_post("/panels/5678/events", json={}, remote_addr=addr)
+    assert res.status == falcon.HTTP_TOO_MANY_REQUESTS
+    assert int(res.headers["retry-after"]) > 0
+
+    res = client.simulate_post("/events", json={}, remote_addr="10.0.0.1")
+    assert res.status == falcon.HTTP_BAD_REQUEST
+
+    # ...or for all clients together
+    test_db.delete("rate_limit:{control}")
+    res = client.simulate_post("/control", json=control, remote_addr=addr)
+    assert res.status == falcon.HTTP_ACCEPTED
+    res = client.simulate_post("/control", json=control, remote_addr="10.0.0.3")
+    assert res.status == falcon.HTTP_SERVICE_UNAVAILABLE
+    assert int(res.headers["retry-after"]) > 0
+
+    # Reads are not limited
+    assert client.simulate_get("/sensors", remote_addr=addr).status == falcon.HTTP_OK
+
+    test_db.delete(f"rate_limit:{{events}}:{addr}")
+    test_db.delete("rate_limit:{control}")
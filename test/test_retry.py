@@ -0,0 +1,83 @@
+import pytest
+
+from simon_says import retry as under_test
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_backoff():
+    backoff = under_test.Backoff(initial=1, maximum=5)
+    waits = [backoff.next() for _ in range(5)]
+    for wait, delay in zip(waits, (1, 2, 4, 5, 5)):
+        assert delay / 2 <= wait <= delay
+
+    backoff.reset()
+    assert backoff.next() <= 1
+
+
+def test_adaptive_timeout():
+    timeout = under_test.AdaptiveTimeout(minimum=0.5)
+    assert timeout.get(10) == 10
+
+    for _ in range(20):
+        timeout.observe(0.1)
+    # Fast responses don't go below the minimum
+    assert timeout.get(10) == 0.5
+
+    for _ in range(20):
+        timeout.observe(2)
+    assert 2 < timeout.get(10) < 10
+    # Nor above the ceiling
+    assert timeout.get(1) == 1
+
+
+def test_circuit_breaker():
+    clock = FakeClock()
+    breaker = under_test.CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    with pytest.raises(under_test.CircuitOpenError) as exc_info:
+        breaker.allow()
+    assert exc_info.value.retry_in == 30
+
+    # A single trial request once the timeout is over, which fails
+    clock.now = 30
+    breaker.allow()
+    assert breaker.state == breaker.HALF_OPEN
+    with pytest.raises(under_test.CircuitOpenError):
+        breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+
+    # And another one, which succeeds
+    clock.now = 60
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == breaker.CLOSED
+    breaker.allow()
+
+
+def test_circuit_breaker_lost_trial():
+    clock = FakeClock()
+    breaker = under_test.CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+
+    # The trial request is never reported on
+    clock.now = 30
+    breaker.allow()
+    with pytest.raises(under_test.CircuitOpenError):
+        breaker.allow()
+
+    # Another one is let through, rather than failing fast forever
+    clock.now = 60
+    breaker.allow()
+    assert breaker.state == breaker.HALF_OPEN
@@ -0,0 +1,27 @@
+import json
+
+import pytest
+
+from simon_says import serialization as under_test
+from simon_says.sensors import SensorState
+
+
+def test_dumps_returns_bytes():
+    data = {"uid": "12abcd", "sensor": None, "code": 601}
+    res = under_test.dumps(data)
+    assert isinstance(res, bytes)
+    assert json.loads(res) == data
+
+
+def test_dumps_enum():
+    assert under_test.loads(under_test.dumps({"state": SensorState.OPEN})) == {"state": "open"}
+
+
+def test_loads_str_and_bytes():
+    assert under_test.loads('{"a": 1}') == under_test.loads(b'{"a": 1}') == {"a": 1}
+
+
+def test_stdlib_default():
+    assert under_test._default(SensorState.BYPASSED) == "bypassed"
+    with pytest.raises(TypeError):
+        under_test._default(object())
@@ -0,0 +1,98 @@
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from simon_says import spool as under_test
+from simon_says.parser import EventParser
+
+CWD = Path(__file__).parent
+TEST_DATA_DIR = CWD / "data"
+
+
+def touch(path: Path, mtime: float) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("")
+    os.utime(path, (mtime, mtime))
+
+
+def test_shard_dir(tmp_path):
+    assert under_test.shard_dir(tmp_path, "event-12abcd", 0) == tmp_path
+
+    shard = under_test.shard_dir(tmp_path, "event-12abcd", 2)
+    assert shard.parent.parent == tmp_path
+    assert all(len(p.name) == 2 for p in (shard, shard.parent))
+    assert under_test.shard_dir(tmp_path, "event-12abcd", 2) == shard
+
+    with pytest.raises(ValueError):
+        under_test.shard_dir(tmp_path, "event-12abcd", 5)
+
+
+def test_scan(tmp_path):
+    touch(tmp_path / "event-c", 300)
+    touch(tmp_path / "event-a", 100)
+    touch(under_test.shard_dir(tmp_path, "event-b", 2) / "event-b", 200)
+    touch(tmp_path / "other", 0)
+    (tmp_path / "event-dir").mkdir()
+    (tmp_path / "event-link").symlink_to(tmp_path / "event-a")
+
+    assert [p.name for p in under_test.scan(tmp_path)] == ["event-a", "event-c"]
+    # Oldest first, wherever they are
+    assert [p.name for p in under_test.scan(tmp_path, depth=2)] == ["event-a", "event-b", "event-c"]
+
+
+def test_scanner_batches(tmp_path):
+    for i in range(5):
+        touch(tmp_path / f"event-{i}", 100 + i)
+
+    scanner = under_test.SpoolScanner(tmp_path, batch_size=2)
+    assert [p.name for p in scanner.next_batch()] == ["event-0", "event-1"]
+    assert scanner.backlog == 3
+
+    # Files arriving meanwhile wait for the backlog to be worked through
+    touch(tmp_path / "event-new", 0)
+    assert [p.name for p in scanner.next_batch()] == ["event-2", "event-3"]
+    assert [p.name for p in scanner.next_batch()] == ["event-4"]
+    assert scanner.backlog == 0
+
+    assert [p.name for p in scanner.next_batch()][0] == "event-new"
+
+
+def test_parser_batches_and_shards(tmp_path, test_config):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    src.mkdir()
+    dst.mkdir()
+    shutil.copy(TEST_DATA_DIR / "event-12abcd", src)
+    shard = under_test.shard_dir(src, "event-34efgh", 1)
+    shard.mkdir()
+    shutil.copy(TEST_DATA_DIR / "event-34efgh", shard)
+
+    test_config.read_dict({"events": {"shard_depth": "1"}})
+    parser = EventParser(config=test_config, src_dir=src, dst_dir=dst, quarantine_dir=tmp_path, batch_size=1)
+
+    assert len(parser.process_files()) == 1
+    assert parser.backlog == 1
+    assert len(parser.process_files()) == 1
+    assert parser.backlog == 0
+
+    assert [e.name for e in under_test.iter_entries(src, 1)] == []
+    moved = {Path(e.path).relative_to(dst) for e in under_test.iter_entries(dst, 1)}
+    assert moved == {
+        under_test.shard_dir(Path(), "event-12abcd", 1) / "event-12abcd",
+        under_test.shard_dir(Path(), "event-34efgh", 1) / "event-34efgh",
+    }
+
+
+def test_parser_skips_vanished_files(tmp_path, test_config):
+    src = tmp_path / "src"
+    src.mkdir()
+    shutil.copy(TEST_DATA_DIR / "event-12abcd", src)
+    shutil.copy(TEST_DATA_DIR / "event-34efgh", src)
+
+    parser = EventParser(config=test_config, src_dir=src, dst_dir=tmp_path, quarantine_dir=tmp_path, batch_size=1)
+    parser.process_files()
+    # Taken by another handler
+    next(src.iterdir()).unlink()
+    assert parser.process_files() == []
+    assert len(list(tmp_path.glob("event-*"))) == 1
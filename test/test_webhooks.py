@@ -0,0 +1,147 @@
+import time
+from configparser import ConfigParser
+
+import pytest
+from pytest_localserver.http import WSGIServer
+
+from simon_says import webhooks as under_test
+from simon_says.db import DataStore
+from simon_says.events import AlarmEvent
+from simon_says.helpers import redis_present
+from simon_says.serialization import loads
+
+
+class Subscriber:
+    """ A WSGI app that records the batches it gets, answering with the given status """
+
+    def __init__(self, status: str = "200 OK") -> None:
+        self.status = status
+        self.batches = []
+
+    def __call__(self, environ, start_response):
+        body = environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+        self.batches.append(loads(body)["events"])
+        start_response(self.status, [("Content-Type", "text/plain")])
+        return [b""]
+
+
+@pytest.fixture
+def subscriber(request):
+    app = Subscriber()
+    server = WSGIServer(application=app)
+    server.start()
+    request.addfinalizer(server.stop)
+    app.url = server.url
+    return app
+
+
+def wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def test_configured_webhooks(test_config):
+    config = ConfigParser()
+    config.read_dict(test_config)
+    config.read_dict(
+        {
+            "webhook:all": {"url": "http://localhost/all"},
+            "webhook:alarms": {"url": "http://localhost/alarms", "categories": "Alarms", "codes": "401, 402"},
+        }
+    )
+
+    hooks = {w.name: w for w in under_test.configured_webhooks(config)}
+    assert set(hooks) == {"all", "alarms"}
+    assert hooks["alarms"].categories == {"Alarms"}
+    assert hooks["alarms"].codes == {401, 402}
+    assert hooks["all"].batch_size == int(under_test.WEBHOOK_DEFAULTS["batch_size"])
+
+    assert under_test.configured_webhooks(test_config) == []
+    assert under_test.create_webhook_dispatcher(DataStore(config=test_config)) is None
+
+
+def test_filters(test_parsed_events):
+    event = AlarmEvent(**test_parsed_events[0])
+
+    assert under_test.Webhook("all", "http://localhost").wants(event)
+    assert under_test.Webhook("category", "http://localhost", categories={event.category}).wants(event)
+    assert under_test.Webhook("code", "http://localhost", codes={event.code}).wants(event)
+    assert not under_test.Webhook("other", "http://localhost", categories={"Other"}, codes={0}).wants(event)
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_batched_delivery(test_db, test_parsed_events, subscriber):
+    webhook = under_test.Webhook("test", subscriber.url, settings={"batch_size": "10", "batch_wait": "1"})
+    dispatcher = under_test.WebhookDispatcher([webhook], test_db)
+    dispatcher.start()
+
+    events = [AlarmEvent(**e) for e in test_parsed_events]
+    for event in events:
+        dispatcher.submit(event)
+    dispatcher.close(timeout=5)
+
+    # All events arrive in a single batch
+    assert subscriber.batches == [[e.to_dict() for e in events]]
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_dead_letters(test_db, test_parsed_events, subscriber):
+    test_db.delete(under_test.DEAD_LETTER_KEY)
+    subscriber.status = "500 Internal Server Error"
+    webhook = under_test.Webhook("test", subscriber.url, settings={"max_retries": "2", "backoff": "0.01"})
+    dispatcher = under_test.WebhookDispatcher([webhook], test_db)
+    dispatcher.start()
+
+    event = AlarmEvent(**test_parsed_events[0])
+    dispatcher.submit(event)
+    wait_for(lambda: test_db.list_length(under_test.DEAD_LETTER_KEY))
+    dispatcher.close(timeout=5)
+
+    # The first attempt and two retries
+    assert len(subscriber.batches) == 3
+    raw = test_db.pop(under_test.DEAD_LETTER_KEY)
+    test_db.push(under_test.DEAD_LETTER_KEY, raw)
+    entry = loads(raw)
+    assert entry["webhook"] == "test"
+    assert entry["error"] == "HTTP 500"
+    assert entry["events"] == [event.to_dict()]
+
+    # Replay once the subscriber is back
+    subscriber.status = "200 OK"
+    assert dispatcher.replay_dead_letters() == 1
+    assert subscriber.batches[-1] == [event.to_dict()]
+    assert test_db.list_length(under_test.DEAD_LETTER_KEY) == 0
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_full_queue_does_not_block(test_db, test_parsed_events):
+    test_db.delete(under_test.DEAD_LETTER_KEY)
+    # Not started, so nothing takes events off the queue
+    webhook = under_test.Webhook("test", "http://localhost", settings={"queue_size": "1"})
+    dispatcher = under_test.WebhookDispatcher([webhook], test_db)
+
+    events = [AlarmEvent(**e) for e in test_parsed_events[:2]]
+    for event in events:
+        dispatcher.submit(event)
+
+    assert webhook.queue.qsize() == 1
+    assert test_db.list_length(under_test.DEAD_LETTER_KEY) == 1
+    test_db.delete(under_test.DEAD_LETTER_KEY)
+
+
+@pytest.mark.skipif(not redis_present(), reason="redis not present")
+def test_close_full_queue(test_db, test_parsed_events):
+    test_db.delete(under_test.DEAD_LETTER_KEY)
+    webhook = under_test.Webhook("test", "http://localhost", settings={"queue_size": "1"})
+    dispatcher = under_test.WebhookDispatcher([webhook], test_db)
+    event = AlarmEvent(**test_parsed_events[0])
+    dispatcher.submit(event)
+
+    # Nothing takes the event off the queue, so it is dead-lettered rather than blocking forever
+    started = time.monotonic()
+    dispatcher.close(timeout=0.1)
+    assert time.monotonic() - started < 1
+    assert webhook.queue.get_nowait() is under_test._STOP
+    assert loads(test_db.pop(under_test.DEAD_LETTER_KEY))["events"] == [event.to_dict()]
+    test_db.delete(under_test.DEAD_LETTER_KEY)